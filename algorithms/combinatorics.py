@@ -1,7 +1,10 @@
+import math
 import unittest
 import doctest
 
-from itertools import combinations
+from itertools import combinations, islice, permutations
+
+import numpy as np
 
 
 def subsets(iterable):
@@ -18,13 +21,438 @@ def subsets(iterable):
     >>> res is None
     True
     """
-    length = len([i for i in iter(iterable)])
-    for l in range(1, length + 1):
-        subsets_of_size_l = combinations(iter(iterable), l)
+    items = tuple(iterable)
+    for l in range(1, len(items) + 1):
+        subsets_of_size_l = combinations(items, l)
         for subset in subsets_of_size_l:
             yield subset
 
 
+def mask_to_subset(mask, items):
+    """
+    The items of the set bits of the mask, the bit i is items[i].
+    >>> mask_to_subset(0b101, 'abc')
+    ('a', 'c')
+    """
+    subset = []
+    while mask:
+        low_bit = mask & -mask
+        subset.append(items[low_bit.bit_length() - 1])
+        mask ^= low_bit
+    return tuple(subset)
+
+
+def nth_subset(items, k):
+    """
+    The subset of the rank k. The rank of a subset is its bitmask, so the
+    ranks go from 0, the empty subset, to 2 ** len(items) - 1.
+    >>> nth_subset('abc', 6)
+    ('b', 'c')
+    """
+    if not 0 <= k < 1 << len(items):
+        raise IndexError(f'subset rank out of range: {k}')
+    return mask_to_subset(k, items)
+
+
+class SubsetCursor:
+    """
+    Iterates the subsets of the ranks [start, stop). The whole state is the
+    rank of the next subset, so an iteration is resumed from any point by
+    a new cursor with start=cursor.rank.
+    >>> cursor = SubsetCursor('abc', start=1)
+    >>> next(cursor), next(cursor), cursor.rank
+    (('a',), ('b',), 3)
+    >>> list(SubsetCursor('abc', start=cursor.rank, stop=5))
+    [('a', 'b'), ('c',)]
+    """
+
+    def __init__(self, items, start=0, stop=None):
+        self.items = tuple(items)
+        total = 1 << len(self.items)
+        self.stop = total if stop is None else stop
+        if not 0 <= start <= self.stop <= total:
+            raise IndexError(f'subset ranks out of range: [{start}, {stop})')
+        self.rank = start
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.rank >= self.stop:
+            raise StopIteration
+        subset = mask_to_subset(self.rank, self.items)
+        self.rank += 1
+        return subset
+
+    def __len__(self):
+        return self.stop - self.rank
+
+    def masks(self):
+        """The remaining ranks as bitmasks, the cursor is not moved."""
+        return range(self.rank, self.stop)
+
+
+def partition_ranks(num_items, num_parts):
+    """
+    Splits the ranks of the subsets of num_items items into num_parts
+    disjoint ranges (start, stop) of almost equal sizes, e.g. one per
+    worker of a process pool: a worker needs only the items and its range.
+    >>> partition_ranks(3, 3)
+    [(0, 3), (3, 6), (6, 8)]
+    """
+    return split_ranges(1 << num_items, num_parts)
+
+
+def split_ranges(total, num_parts):
+    """
+    Splits the ranks [0, total) into num_parts ranges of almost equal sizes.
+    >>> split_ranges(7, 3)
+    [(0, 3), (3, 5), (5, 7)]
+    """
+    num_parts = max(1, min(num_parts, total))
+    size, rest = divmod(total, num_parts)
+    ranges = []
+    start = 0
+    for part in range(num_parts):
+        stop = start + size + (part < rest)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def binomial(n, k):
+    """
+    >>> binomial(5, 2), binomial(5, 6)
+    (10, 0)
+    """
+    return math.comb(n, k) if 0 <= k <= n else 0
+
+
+# The cached rows of the Stirling numbers, a row is built from the
+# previous one.
+STIRLING2_ROWS = [(1,)]
+STIRLING1_ROWS = [(1,)]
+
+
+def stirling2_row(n):
+    """
+    The Stirling numbers of the second kind S(n, k) for k = 0..n, the
+    number of partitions of n items into k blocks.
+    >>> stirling2_row(4)
+    (0, 1, 7, 6, 1)
+    """
+    while len(STIRLING2_ROWS) <= n:
+        m = len(STIRLING2_ROWS)
+        previous = STIRLING2_ROWS[-1] + (0,)
+        STIRLING2_ROWS.append((0,) + tuple(
+            k * previous[k] + previous[k - 1] for k in range(1, m + 1)
+        ))
+    return STIRLING2_ROWS[n]
+
+
+def stirling1_row(n):
+    """
+    The unsigned Stirling numbers of the first kind c(n, k) for k = 0..n,
+    the number of permutations of n items with k cycles.
+    >>> stirling1_row(4)
+    (0, 6, 11, 6, 1)
+    """
+    while len(STIRLING1_ROWS) <= n:
+        m = len(STIRLING1_ROWS)
+        previous = STIRLING1_ROWS[-1] + (0,)
+        STIRLING1_ROWS.append((0,) + tuple(
+            (m - 1) * previous[k] + previous[k - 1] for k in range(1, m + 1)
+        ))
+    return STIRLING1_ROWS[n]
+
+
+def stirling2(n, k):
+    return stirling2_row(n)[k] if 0 <= k <= n else 0
+
+
+def stirling1(n, k):
+    return stirling1_row(n)[k] if 0 <= k <= n else 0
+
+
+def bell(n):
+    """
+    The number of partitions of n items.
+    >>> [bell(n) for n in range(7)]
+    [1, 1, 2, 5, 15, 52, 203]
+    """
+    return sum(stirling2_row(n))
+
+
+def subsets_count(num_items):
+    """The number of subsets `subsets` yields."""
+    return (1 << num_items) - 1
+
+
+def combination_rank(combination, n):
+    """
+    The rank of a sorted k-combination of range(n) in the order of
+    `itertools.combinations(range(n), k)`.
+    >>> combination_rank((1, 3), 4)
+    4
+    """
+    k = len(combination)
+    # The combinations after this one are counted position by position
+    # and taken from the rank of the last combination.
+    return binomial(n, k) - 1 - sum(
+        binomial(n - 1 - c, k - i) for i, c in enumerate(combination)
+    )
+
+
+def combination_unrank(rank, n, k):
+    """
+    >>> combination_unrank(4, 4, 2)
+    (1, 3)
+    """
+    if not 0 <= rank < binomial(n, k):
+        raise IndexError(f'combination rank out of range: {rank}')
+    combination = []
+    c = 0
+    for i in range(k, 0, -1):
+        # The combinations starting with c at this position.
+        while binomial(n - 1 - c, i - 1) <= rank:
+            rank -= binomial(n - 1 - c, i - 1)
+            c += 1
+        combination.append(c)
+        c += 1
+    return tuple(combination)
+
+
+def next_combination(combination, n):
+    """
+    The combination after a sorted k-combination of range(n) in the order
+    of `itertools.combinations`, None after the last one.
+    >>> next_combination([0, 3], 4), next_combination([2, 3], 4)
+    ([1, 2], None)
+    """
+    k = len(combination)
+    for i in range(k - 1, -1, -1):
+        if combination[i] < n - k + i:
+            combination = list(combination)
+            combination[i] += 1
+            for j in range(i + 1, k):
+                combination[j] = combination[j - 1] + 1
+            return combination
+    return None
+
+
+def permutation_rank(permutation):
+    """
+    The rank of a permutation of range(n) in the order of
+    `itertools.permutations(range(n))` from its Lehmer code.
+    >>> permutation_rank((1, 2, 0))
+    3
+    """
+    n = len(permutation)
+    rank = 0
+    for i, p in enumerate(permutation):
+        # The Lehmer code digit: the smaller items which are still free.
+        smaller = sum(1 for q in permutation[i + 1:] if q < p)
+        rank += smaller * math.factorial(n - 1 - i)
+    return rank
+
+
+def permutation_unrank(rank, n):
+    """
+    >>> permutation_unrank(3, 3)
+    (1, 2, 0)
+    """
+    if not 0 <= rank < math.factorial(n):
+        raise IndexError(f'permutation rank out of range: {rank}')
+    free = list(range(n))
+    permutation = []
+    for i in range(n - 1, -1, -1):
+        digit, rank = divmod(rank, math.factorial(i))
+        permutation.append(free.pop(digit))
+    return tuple(permutation)
+
+
+def set_partitions(iterable):
+    """
+    Yields the partitions of the items as tuples of blocks, from the
+    restricted growth strings in lex order: an item goes to one of the
+    blocks before it or starts the next block. Only the current string is
+    kept, so the partitions are streamed.
+    >>> list(set_partitions('abc'))  # doctest: +NORMALIZE_WHITESPACE
+    [(('a', 'b', 'c'),), (('a', 'b'), ('c',)), (('a', 'c'), ('b',)),
+     (('a',), ('b', 'c')), (('a',), ('b',), ('c',))]
+    """
+    items = tuple(iterable)
+    n = len(items)
+    if n == 0:
+        yield ()
+        return
+
+    growth = [0] * n
+    # The largest block number before the position plus one.
+    maxima = [1] * n
+    while True:
+        blocks = [[] for _ in range(maxima[-1] + (growth[-1] == maxima[-1]))]
+        for item, block in zip(items, growth):
+            blocks[block].append(item)
+        yield tuple(tuple(block) for block in blocks)
+
+        i = n - 1
+        while i > 0 and growth[i] == maxima[i]:
+            i -= 1
+        if i == 0:
+            return
+        growth[i] += 1
+        for j in range(i + 1, n):
+            growth[j] = 0
+            maxima[j] = max(maxima[j - 1], growth[j - 1] + 1)
+
+
+def nth_subset_by_size(items, rank):
+    """
+    The subset of the rank in the order of `subsets`, which starts from
+    the rank 0.
+    >>> nth_subset_by_size('abc', 3)
+    ('a', 'b')
+    """
+    if not 0 <= rank < subsets_count(len(items)):
+        raise IndexError(f'subset rank out of range: {rank}')
+    size = 1
+    while rank >= binomial(len(items), size):
+        rank -= binomial(len(items), size)
+        size += 1
+    return tuple(items[i] for i in combination_unrank(rank, len(items), size))
+
+
+def subsets_range(iterable, start=0, stop=None):
+    """
+    The subsets of the ranks [start, stop) in the order of `subsets`, so
+    `split_ranges(subsets_count(n), parts)` splits `subsets` into
+    independent ranges. Only the first subset is unranked, the others are
+    the next combinations.
+    >>> list(subsets_range('abc', 2, 5))
+    [('c',), ('a', 'b'), ('a', 'c')]
+    """
+    items = tuple(iterable)
+    n = len(items)
+    stop = subsets_count(n) if stop is None else stop
+    if not 0 <= start <= stop <= subsets_count(n):
+        raise IndexError(f'subset ranks out of range: [{start}, {stop})')
+    if start == stop:
+        return
+
+    first = nth_subset_by_size(range(n), start)
+    combination = list(first)
+    for _ in range(stop - start):
+        yield tuple(items[i] for i in combination)
+        next_indices = next_combination(combination, n)
+        # After the last combination of a size comes the first one of the
+        # next size.
+        combination = (
+            next_indices if next_indices is not None
+            else list(range(len(combination) + 1))
+        )
+
+
+SUBSET_ORDERS = ('binary', 'gray', 'size')
+# A bitmask of a subset is one uint64.
+MAX_BLOCK_ITEMS = 64
+
+
+def binomial_table(n):
+    """binomial_table(n)[m, k] is C(m, k) for m, k <= n as uint64."""
+    table = np.zeros((n + 1, n + 1), dtype=np.uint64)
+    table[:, 0] = 1
+    for m in range(1, n + 1):
+        table[m, 1:] = table[m - 1, 1:] + table[m - 1, :-1]
+    return table
+
+
+def colex_unrank(ranks, size, table):
+    """
+    The bitmasks of the size-subsets of the colex ranks: in colex order
+    the subsets of one size go by their bitmask ascending.
+    >>> colex_unrank(np.arange(6, dtype=np.uint64), 2, binomial_table(4))
+    array([ 3,  5,  6,  9, 10, 12], dtype=uint64)
+    """
+    ranks = ranks.copy()
+    masks = np.zeros(len(ranks), dtype=np.uint64)
+    n = len(table) - 1
+    for j in range(size, 0, -1):
+        # The largest c with C(c, j) <= rank, C(c, j) grows with c.
+        c = np.searchsorted(table[:n, j], ranks, side='right') - 1
+        masks |= np.left_shift(np.uint64(1), c.astype(np.uint64))
+        ranks -= table[c, j]
+    return masks
+
+
+def size_order_masks(ranks, num_items, table):
+    """The subsets by size, those of one size in colex order."""
+    # The end of the last size, 2 ** 64 for 64 items, is left out.
+    offsets = np.cumsum(table[num_items, :-1], dtype=np.uint64)
+    sizes = np.searchsorted(offsets, ranks, side='right')
+    masks = np.zeros(len(ranks), dtype=np.uint64)
+    for size in np.unique(sizes).tolist():
+        selected = sizes == size
+        first = offsets[size - 1] if size else np.uint64(0)
+        masks[selected] = colex_unrank(ranks[selected] - first, size, table)
+    return masks
+
+
+def masks_to_bool(masks, num_items):
+    """A row of the membership matrix per mask, the column i is items[i]."""
+    bits = np.arange(num_items, dtype=np.uint64)
+    return (masks[:, None] >> bits & np.uint64(1)).astype(bool)
+
+
+def subset_blocks(
+        num_items,
+        block_size=1 << 16,
+        order='binary',
+        output='mask',
+        start=0,
+        stop=None
+):
+    """
+    Yields the subsets of the ranks [start, stop) in blocks of up to
+    block_size, as uint64 bitmasks or as boolean membership matrices of
+    block_size x num_items. The rank 0 is the empty subset in every order.
+    `binary` goes by the bitmask, `gray` changes one item between
+    neighbours and `size` goes by the size of the subsets.
+    >>> next(subset_blocks(3, order='gray'))
+    array([0, 1, 3, 2, 6, 7, 5, 4], dtype=uint64)
+    >>> next(subset_blocks(3, order='size', output='bool', start=1, stop=4))
+    array([[ True, False, False],
+           [False,  True, False],
+           [False, False,  True]])
+    """
+    if not 0 <= num_items <= MAX_BLOCK_ITEMS:
+        raise ValueError(f'At most {MAX_BLOCK_ITEMS} items, got {num_items}')
+    if order not in SUBSET_ORDERS:
+        raise ValueError(f'Unknown subset order: {order}')
+    if output not in ('mask', 'bool'):
+        raise ValueError(f'Unknown output: {output}')
+    total = 1 << num_items
+    stop = total if stop is None else stop
+    if not 0 <= start <= stop <= total:
+        raise IndexError(f'subset ranks out of range: [{start}, {stop})')
+
+    table = binomial_table(num_items) if order == 'size' else None
+    for block_start in range(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        # The ranks are made relative to the block start, so a rank of 64
+        # items never goes through a float.
+        ranks = np.uint64(block_start) + np.arange(
+            block_stop - block_start, dtype=np.uint64
+        )
+        if order == 'binary':
+            masks = ranks
+        elif order == 'gray':
+            masks = ranks ^ (ranks >> np.uint64(1))
+        else:
+            masks = size_order_masks(ranks, num_items, table)
+        yield masks if output == 'mask' else masks_to_bool(masks, num_items)
+
+
 class TestCase(unittest.TestCase):
 
     def test_subsets(self):
@@ -46,6 +474,125 @@ class TestCase(unittest.TestCase):
                 generated_subsets = [s for s in subsets(data)]
                 self.assertSequenceEqual(generated_subsets, data_subsets)
 
+    def test_subsets_of_iterator(self):
+        self.assertSequenceEqual(
+            list(subsets(iter('ab'))), [('a',), ('b', ), ('a', 'b')]
+        )
+
+    def test_partitioned_cursors(self):
+        items = 'abcde'
+        every_subset = [nth_subset(items, k) for k in range(1 << len(items))]
+        self.assertEqual(set(every_subset[1:]), set(subsets(items)))
+        for num_parts in [1, 3, 7, 32, 100]:
+            with self.subTest(num_parts=num_parts):
+                ranges = partition_ranks(len(items), num_parts)
+                self.assertEqual(len(ranges), min(num_parts, 32))
+                self.assertEqual(
+                    [
+                        subset
+                        for start, stop in ranges
+                        for subset in SubsetCursor(items, start, stop)
+                    ],
+                    every_subset
+                )
+
+    def test_subset_blocks(self):
+        items = 'abcdefg'
+        every_mask = list(range(1 << len(items)))
+        for order in SUBSET_ORDERS:
+            with self.subTest(order=order):
+                blocks = list(subset_blocks(len(items), 10, order, start=1))
+                self.assertTrue(all(len(block) <= 10 for block in blocks))
+                masks = np.concatenate(blocks).tolist()
+                self.assertEqual(sorted(masks), every_mask[1:])
+
+                rows = np.concatenate(list(subset_blocks(
+                    len(items), 10, order, output='bool', start=1
+                )))
+                self.assertEqual(
+                    [tuple(np.array(list(items))[row]) for row in rows],
+                    [mask_to_subset(mask, items) for mask in masks]
+                )
+
+        gray = np.concatenate(list(subset_blocks(len(items), 10, 'gray')))
+        changed = gray[1:] ^ gray[:-1]
+        self.assertFalse((changed & (changed - np.uint64(1))).any())
+
+        by_size = np.concatenate(list(subset_blocks(len(items), 10, 'size')))
+        sizes = [bin(mask).count('1') for mask in by_size.tolist()]
+        self.assertEqual(sizes, sorted(sizes))
+
+    def test_subset_blocks_of_64_items(self):
+        last = 1 << 64
+        for order in ['binary', 'size']:
+            with self.subTest(order=order):
+                block = next(subset_blocks(64, 4, order, start=last - 3))
+                # The last subsets of 63 items come before the full set.
+                self.assertEqual(block.tolist(), [last - 3, last - 2, last - 1])
+
+    def test_counting(self):
+        for n in range(8):
+            with self.subTest(n=n):
+                self.assertEqual(
+                    [binomial(n, k) for k in range(n + 2)],
+                    [len(list(combinations(range(n), k))) for k in range(n + 2)]
+                )
+                self.assertEqual(bell(n), len(list(set_partitions(range(n)))))
+                self.assertEqual(sum(stirling1_row(n)), math.factorial(n))
+                partition_sizes = [
+                    len(partition) for partition in set_partitions(range(n))
+                ]
+                self.assertEqual(
+                    [partition_sizes.count(k) for k in range(n + 1)],
+                    [stirling2(n, k) for k in range(n + 1)]
+                )
+                self.assertEqual(subsets_count(n), len(list(subsets(range(n)))))
+        self.assertEqual(bell(20), 51724158235372)
+
+    def test_ranking(self):
+        n = 7
+        for k in range(n + 1):
+            for rank, combination in enumerate(combinations(range(n), k)):
+                self.assertEqual(combination_rank(combination, n), rank)
+                self.assertEqual(combination_unrank(rank, n, k), combination)
+        for rank, permutation in enumerate(permutations(range(5))):
+            self.assertEqual(permutation_rank(permutation), rank)
+            self.assertEqual(permutation_unrank(rank, 5), permutation)
+
+    def test_set_partitions(self):
+        partitions = list(set_partitions('abcd'))
+        self.assertEqual(len(set(partitions)), 15)
+        for partition in partitions:
+            self.assertEqual(
+                sorted(item for block in partition for item in block),
+                list('abcd')
+            )
+
+    def test_subsets_range(self):
+        items = 'abcdef'
+        every_subset = list(subsets(items))
+        for num_parts in [1, 4, 63]:
+            with self.subTest(num_parts=num_parts):
+                self.assertEqual(
+                    [
+                        subset
+                        for start, stop in split_ranges(
+                            subsets_count(len(items)), num_parts
+                        )
+                        for subset in subsets_range(items, start, stop)
+                    ],
+                    every_subset
+                )
+        self.assertEqual(
+            list(islice(subsets_range(items, 20), 3)), every_subset[20:23]
+        )
+
+    def test_out_of_range(self):
+        with self.assertRaises(IndexError):
+            nth_subset('ab', 4)
+        with self.assertRaises(IndexError):
+            SubsetCursor('ab', start=5)
+
 
 if __name__ == '__main__':
     unittest.main(exit=False)
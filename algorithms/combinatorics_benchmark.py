@@ -0,0 +1,94 @@
+"""
+Subsets per second of `subsets` against `subset_blocks`, scoring every
+subset by the sum of the weights of its items like a brute-force search
+for the subsets of a target weight.
+
+    python combinatorics_benchmark.py --items 22 --block-size 65536
+"""
+import time
+import argparse
+
+import numpy as np
+
+from combinatorics import SUBSET_ORDERS, subsets, subset_blocks
+
+
+def count_with_tuples(weights, target):
+    weight = dict(enumerate(weights))
+    return sum(
+        1 for subset in subsets(range(len(weights)))
+        if sum(weight[i] for i in subset) == target
+    )
+
+
+def count_with_bool_blocks(weights, target, block_size, order):
+    weights = np.array(weights, dtype=np.int64)
+    found = 0
+    for block in subset_blocks(
+            len(weights), block_size, order, output='bool', start=1
+    ):
+        found += int(np.count_nonzero(block @ weights == target))
+    return found
+
+
+def count_with_mask_blocks(weights, target, block_size, order):
+    """The sums of the 8 bit groups of a mask come from lookup tables."""
+    weights = np.array(weights, dtype=np.int64)
+    group_sums = []
+    for i in range(0, len(weights), 8):
+        group = weights[i:i + 8]
+        bits = np.arange(256)[:, None] >> np.arange(len(group)) & 1
+        group_sums.append(bits @ group)
+    found = 0
+    for block in subset_blocks(len(weights), block_size, order, start=1):
+        totals = np.zeros(len(block), dtype=np.int64)
+        for group, sums in enumerate(group_sums):
+            totals += sums[(block >> np.uint64(8 * group)) & np.uint64(255)]
+        found += int(np.count_nonzero(totals == target))
+    return found
+
+
+def measure(name, function, num_subsets):
+    start = time.perf_counter()
+    found = function()
+    elapsed = time.perf_counter() - start
+    print(
+        f'{name:<16} {elapsed:>10.3f} {num_subsets / elapsed:>14,.0f} '
+        f'{found:>10}'
+    )
+    return found
+
+
+def main(num_items, block_size, skip_tuples):
+    rng = np.random.default_rng(0)
+    weights = rng.integers(1, 100, num_items).tolist()
+    target = sum(weights) // 2
+    num_subsets = (1 << num_items) - 1
+
+    print(f'{"generator":<16} {"seconds":>10} {"subsets/s":>14} {"found":>10}')
+    results = set()
+    if not skip_tuples:
+        results.add(measure(
+            'subsets', lambda: count_with_tuples(weights, target), num_subsets
+        ))
+    for order in SUBSET_ORDERS:
+        results.add(measure(
+            f'bool {order}',
+            lambda: count_with_bool_blocks(weights, target, block_size, order),
+            num_subsets
+        ))
+        results.add(measure(
+            f'mask {order}',
+            lambda: count_with_mask_blocks(weights, target, block_size, order),
+            num_subsets
+        ))
+    assert len(results) == 1, results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--block-size', type=int, default=1 << 16)
+    parser.add_argument('--skip-tuples', action='store_true')
+    args = parser.parse_args()
+    main(args.items, args.block_size, args.skip_tuples)
@@ -0,0 +1,363 @@
+import os
+import json
+import mmap
+import time
+import sqlite3
+import hashlib
+import pathlib
+import unittest
+import unittest.mock
+import tempfile
+
+from typing import List, NamedTuple, Optional
+
+
+class DeckFlashcard(NamedTuple):
+    word: str
+    num: int
+    question: Optional[str]
+    answer: str
+    explanation: str
+    audio: Optional[str]
+
+
+class Deck:
+    """
+    A whole vocabulary in two files: the sqlite index `path` of the words
+    and their flashcards and the append-only audio pack `path.pack`. An
+    mp3 is stored once per sha256 and read through a memory map of the
+    pack, so a flashcard's audio costs no file of its own.
+
+    The blobs are appended through one handle of the pack, which is
+    synced once by `commit` before the index rows are committed. An
+    interrupted export leaves at most an unreferenced tail in the pack.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.pack_path = pathlib.Path(f'{path}.pack')
+        self.pack = open(self.pack_path, 'ab')
+        self.pack_end = self.pack.seek(0, os.SEEK_END)
+        self.unsynced = False
+        self.map: Optional[mmap.mmap] = None
+
+        self.db = sqlite3.connect(str(self.path))
+        with self.db:
+            self.db.executescript('''
+                CREATE TABLE IF NOT EXISTS words (
+                    word TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS flashcards (
+                    word TEXT NOT NULL,
+                    num INTEGER NOT NULL,
+                    question TEXT,
+                    answer TEXT NOT NULL,
+                    explanation TEXT NOT NULL,
+                    audio TEXT,
+                    PRIMARY KEY (word, num)
+                );
+                CREATE TABLE IF NOT EXISTS audio (
+                    digest TEXT PRIMARY KEY,
+                    offset INTEGER NOT NULL,
+                    size INTEGER NOT NULL
+                );
+            ''')
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.pack.close()
+        self.db.close()
+
+    def commit(self):
+        """Syncs the appended blobs, then commits their index rows."""
+        if self.unsynced:
+            self.pack.flush()
+            os.fsync(self.pack.fileno())
+            self.unsynced = False
+        self.db.commit()
+
+    def add_audio(self, body: bytes) -> str:
+        """
+        Appends the mp3 unless the pack has it, returns its sha256. The
+        index row is written by the next `commit`.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        known = self.db.execute(
+            'SELECT 1 FROM audio WHERE digest = ?', (digest,)
+        ).fetchone()
+        if known:
+            return digest
+
+        offset = self.pack_end
+        self.pack.write(body)
+        self.pack_end += len(body)
+        self.unsynced = True
+        self.db.execute(
+            'INSERT INTO audio (digest, offset, size) VALUES (?, ?, ?)',
+            (digest, offset, len(body))
+        )
+        return digest
+
+    def audio(self, digest) -> Optional[bytes]:
+        row = self.db.execute(
+            'SELECT offset, size FROM audio WHERE digest = ?', (digest,)
+        ).fetchone()
+        if row is None:
+            return None
+        offset, size = row
+        if not size:
+            return b''
+        if self.map is None or len(self.map) < offset + size:
+            # The pack has grown since it was mapped.
+            self.pack.flush()
+            if self.map is not None:
+                self.map.close()
+            with open(self.pack_path, 'rb') as fh:
+                self.map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + size]
+
+    def add_word(self, word, data, flashcards, commit=True):
+        """
+        Replaces the word, data is its parsed page and flashcards are
+        (num, question, answer, explanation, mp3 bytes or None).
+        """
+        try:
+            self.db.execute(
+                'INSERT OR REPLACE INTO words (word, data, updated_at) '
+                'VALUES (?, ?, ?)',
+                (word, json.dumps(data, ensure_ascii=False,
+                                  separators=(',', ':')), time.time())
+            )
+            self.db.execute('DELETE FROM flashcards WHERE word = ?', (word,))
+            for num, question, answer, explanation, audio_file in flashcards:
+                audio = None if audio_file is None else self.add_audio(audio_file)
+                self.db.execute(
+                    'INSERT INTO flashcards (word, num, question, answer, '
+                    'explanation, audio) VALUES (?, ?, ?, ?, ?, ?)',
+                    (word, num, question, answer, explanation, audio)
+                )
+        except BaseException:
+            self.db.rollback()
+            raise
+        if commit:
+            self.commit()
+
+    def words(self) -> List[str]:
+        return [row[0] for row in self.db.execute(
+            'SELECT word FROM words ORDER BY word'
+        )]
+
+    def word_data(self, word):
+        row = self.db.execute(
+            'SELECT data FROM words WHERE word = ?', (word,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def flashcards(self, word) -> List[DeckFlashcard]:
+        return [DeckFlashcard(*row) for row in self.db.execute(
+            'SELECT word, num, question, answer, explanation, audio '
+            'FROM flashcards WHERE word = ? ORDER BY num',
+            (word,)
+        )]
+
+    def stats(self):
+        words, = self.db.execute('SELECT COUNT(*) FROM words').fetchone()
+        flashcards, = self.db.execute(
+            'SELECT COUNT(*) FROM flashcards'
+        ).fetchone()
+        blobs, size = self.db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio'
+        ).fetchone()
+        return {
+            'words': words,
+            'flashcards': flashcards,
+            'audio_blobs': blobs,
+            'audio_bytes': size,
+        }
+
+
+def read_word(words_dir, word):
+    """
+    The parsed page and the flashcards of a word in the words_data layout:
+    `{word}.json` and `{word}_flashcards/{n}.json` with `{n}.mp3`.
+    """
+    words_dir = pathlib.Path(words_dir)
+    with open(words_dir.joinpath(f'{word}.json')) as fh:
+        data = json.load(fh)
+
+    flashcards = []
+    work_dir = words_dir.joinpath(f'{word}_flashcards')
+    json_paths = sorted(
+        work_dir.glob('*.json'), key=lambda path: int(path.stem)
+    )
+    for json_path in json_paths:
+        with open(json_path) as fh:
+            flashcard = json.load(fh)
+        mp3_path = json_path.with_suffix('.mp3')
+        flashcards.append((
+            int(json_path.stem),
+            flashcard['question'],
+            flashcard['answer'],
+            flashcard['explanation'],
+            mp3_path.read_bytes() if mp3_path.exists() else None
+        ))
+    return data, flashcards
+
+
+def flashcard_words(words_dir):
+    """The words of the directory that have flashcards."""
+    suffix = '_flashcards'
+    return sorted(
+        path.name[:-len(suffix)]
+        for path in pathlib.Path(words_dir).glob(f'*{suffix}')
+        if path.is_dir()
+        and path.parent.joinpath(f'{path.name[:-len(suffix)]}.json').exists()
+    )
+
+
+def export_words(words_dir, deck_path, words=None):
+    """
+    Packs the words, all of them by default, into the deck in one
+    transaction, the pack is synced once.
+    """
+    deck = Deck(deck_path)
+    try:
+        for word in words or flashcard_words(words_dir):
+            data, flashcards = read_word(words_dir, word)
+            deck.add_word(word, data, flashcards, commit=False)
+        deck.commit()
+        return deck.stats()
+    finally:
+        deck.close()
+
+
+def unpack_word(deck: Deck, word, words_dir):
+    """Writes a word of the deck back in the words_data layout."""
+    words_dir = pathlib.Path(words_dir)
+    work_dir = words_dir.joinpath(f'{word}_flashcards')
+    work_dir.mkdir(parents=True, exist_ok=True)
+    with open(words_dir.joinpath(f'{word}.json'), 'w') as fh:
+        json.dump(deck.word_data(word), fh, ensure_ascii=False, indent=4)
+    for flashcard in deck.flashcards(word):
+        with open(work_dir.joinpath(f'{flashcard.num}.json'), 'w') as fh:
+            json.dump({
+                'question': flashcard.question,
+                'answer': flashcard.answer,
+                'explanation': flashcard.explanation
+            }, fh, ensure_ascii=False, indent=4)
+        if flashcard.audio is not None:
+            work_dir.joinpath(f'{flashcard.num}.mp3').write_bytes(
+                deck.audio(flashcard.audio)
+            )
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = pathlib.Path(tmp_dir.name)
+        self.words_dir = self.tmp_dir.joinpath('words_data')
+        self.deck_path = self.tmp_dir.joinpath('vocabulary.deck')
+        # The same recording is used by both words.
+        self.write_word('go', {1: b'mp3 go', 2: b'mp3 shared'})
+        self.write_word('be', {1: b'mp3 shared', 3: None})
+
+    def write_word(self, word, audio):
+        work_dir = self.words_dir.joinpath(f'{word}_flashcards')
+        work_dir.mkdir(parents=True)
+        self.words_dir.joinpath(f'{word}.json').write_text(
+            json.dumps([{'definition': f'to {word}', 'examples': []}])
+        )
+        for num, body in audio.items():
+            work_dir.joinpath(f'{num}.json').write_text(json.dumps({
+                'question': f'{word} {num}',
+                'answer': f'{word.upper()} {num}',
+                'explanation': word
+            }))
+            if body is not None:
+                work_dir.joinpath(f'{num}.mp3').write_bytes(body)
+
+    def test_export(self):
+        stats = export_words(self.words_dir, self.deck_path)
+        self.assertEqual(stats, {
+            'words': 2, 'flashcards': 4, 'audio_blobs': 2,
+            'audio_bytes': len(b'mp3 go') + len(b'mp3 shared')
+        })
+        self.assertEqual(
+            self.deck_path.with_suffix('.deck.pack').stat().st_size,
+            stats['audio_bytes']
+        )
+
+        deck = Deck(self.deck_path)
+        self.addCleanup(deck.close)
+        self.assertEqual(deck.words(), ['be', 'go'])
+        be = deck.flashcards('be')
+        self.assertEqual([flashcard.num for flashcard in be], [1, 3])
+        self.assertEqual(be[0].question, 'be 1')
+        self.assertEqual(deck.audio(be[0].audio), b'mp3 shared')
+        self.assertIsNone(be[1].audio)
+        self.assertEqual(
+            deck.audio(deck.flashcards('go')[0].audio), b'mp3 go'
+        )
+        self.assertEqual(deck.word_data('go')[0]['definition'], 'to go')
+
+    def test_reexport_does_not_grow_the_pack(self):
+        export_words(self.words_dir, self.deck_path)
+        size = self.deck_path.with_suffix('.deck.pack').stat().st_size
+
+        self.write_word('do', {1: b'mp3 go', 2: b'mp3 do'})
+        stats = export_words(self.words_dir, self.deck_path, ['go', 'do'])
+        self.assertEqual(stats['words'], 3)
+        self.assertEqual(
+            self.deck_path.with_suffix('.deck.pack').stat().st_size,
+            size + len(b'mp3 do')
+        )
+
+    def test_unpack(self):
+        export_words(self.words_dir, self.deck_path)
+        out_dir = self.tmp_dir.joinpath('unpacked')
+        deck = Deck(self.deck_path)
+        self.addCleanup(deck.close)
+        for word in deck.words():
+            unpack_word(deck, word, out_dir)
+        self.assertEqual(
+            [read_word(out_dir, word) for word in ['be', 'go']],
+            [read_word(self.words_dir, word) for word in ['be', 'go']]
+        )
+
+    def test_audio_appended_after_mapping(self):
+        deck = Deck(self.deck_path)
+        self.addCleanup(deck.close)
+        first = deck.add_audio(b'first')
+        self.assertEqual(deck.audio(first), b'first')
+        second = deck.add_audio(b'second')
+        self.assertEqual(deck.audio(second), b'second')
+        self.assertIsNone(deck.audio('missing'))
+
+    def test_export_syncs_the_pack_once(self):
+        self.write_word('do', {1: b'mp3 do', 2: b'mp3 done'})
+        with unittest.mock.patch('os.fsync') as fsync:
+            stats = export_words(self.words_dir, self.deck_path)
+        self.assertEqual(fsync.call_count, 1)
+        self.assertEqual(stats['audio_blobs'], 4)
+
+    def test_uncommitted_blobs_are_not_indexed(self):
+        deck = Deck(self.deck_path)
+        deck.add_word('go', [], [(1, 'q', 'a', '', b'lost')], commit=False)
+        deck.close()
+        deck = Deck(self.deck_path)
+        self.addCleanup(deck.close)
+        self.assertEqual(deck.words(), [])
+        # The tail is left in the pack, new blobs go after it.
+        digest = deck.add_audio(b'kept')
+        deck.commit()
+        self.assertEqual(deck.audio(digest), b'kept')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,365 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import pathlib
+import unittest
+import tempfile
+import threading
+import http.server
+
+from typing import NamedTuple, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheMiss(Exception):
+    """Raised in the offline mode when a url is not in the cache."""
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    digest: str
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class HTTPCache:
+    """
+    Content-addressed cache of http response bodies keyed by url.
+
+    Bodies are stored once per sha256 digest under `blobs/`, the url index
+    lives in sqlite. Entries younger than `ttl` seconds are served without
+    a request, older ones are revalidated with ETag/Last-Modified. The
+    least recently used entries are evicted when the blobs take more than
+    `max_size` bytes.
+    """
+
+    def __init__(
+            self, cache_dir, ttl=7 * 24 * 3600, max_size=512 * 1024 * 1024,
+            offline=False
+    ):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.blobs_dir = self.cache_dir.joinpath('blobs')
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+        self.db = sqlite3.connect(str(self.cache_dir.joinpath('index.sqlite')))
+        with self.db:
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            self.db.execute(
+                'CREATE INDEX IF NOT EXISTS entries_accessed_at '
+                'ON entries (accessed_at)'
+            )
+
+    def close(self):
+        self.db.close()
+
+    def fetch(self, url, do_fetch):
+        """
+        do_fetch(headers) performs the request with the given conditional
+        headers and returns (code, headers, body). Returns (code, body).
+        """
+        entry, body = self.lookup(url)
+        if body is not None:
+            return 200, body
+        code, headers, body = do_fetch(self.validators(entry))
+        return self.complete(url, entry, code, headers, body)
+
+    async def fetch_async(self, url, do_fetch):
+        """The same as `fetch`, but do_fetch is a coroutine function."""
+        entry, body = self.lookup(url)
+        if body is not None:
+            return 200, body
+        code, headers, body = await do_fetch(self.validators(entry))
+        return self.complete(url, entry, code, headers, body)
+
+    def lookup(self, url):
+        """
+        Returns (entry, body). The body is set when the request should
+        not be made at all.
+        """
+        entry = self.get_entry(url)
+        if entry is None:
+            if self.offline:
+                raise CacheMiss(url)
+            return None, None
+
+        if self.offline or time.time() - entry.fetched_at < self.ttl:
+            body = self.read(entry)
+            if body is not None:
+                self.hits += 1
+                return entry, body
+            if self.offline:
+                raise CacheMiss(url)
+            # The blob has been removed from the disk.
+            return None, None
+
+        return entry, None
+
+    def complete(self, url, entry, code, headers, body):
+        if code == 304 and entry is not None:
+            cached_body = self.read(entry)
+            if cached_body is not None:
+                self.revalidations += 1
+                self.refresh(entry, headers)
+                return 200, cached_body
+
+        if code == 200:
+            self.misses += 1
+            self.store(url, body, headers)
+        return code, body
+
+    def get_entry(self, url) -> Optional[CacheEntry]:
+        row = self.db.execute(
+            'SELECT url, digest, size, etag, last_modified, fetched_at '
+            'FROM entries WHERE url = ?',
+            (url,)
+        ).fetchone()
+        return CacheEntry(*row) if row else None
+
+    @staticmethod
+    def validators(entry: Optional[CacheEntry]):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def blob_path(self, digest):
+        return self.blobs_dir.joinpath(digest[:2], digest)
+
+    def read(self, entry: CacheEntry):
+        try:
+            body = self.blob_path(entry.digest).read_bytes()
+        except FileNotFoundError:
+            return None
+        with self.db:
+            self.db.execute(
+                'UPDATE entries SET accessed_at = ? WHERE url = ?',
+                (time.time(), entry.url)
+            )
+        return body
+
+    def store(self, url, body, headers):
+        digest = hashlib.sha256(body).hexdigest()
+        blob_path = self.blob_path(digest)
+        if not blob_path.exists():
+            blob_path.parent.mkdir(exist_ok=True)
+            tmp_path = blob_path.with_suffix('.tmp')
+            tmp_path.write_bytes(body)
+            os.replace(tmp_path, blob_path)
+
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(url, digest, size, etag, last_modified, fetched_at, '
+                'accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    url, digest, len(body), headers.get('ETag'),
+                    headers.get('Last-Modified'), now, now
+                )
+            )
+        self.evict()
+
+    def refresh(self, entry: CacheEntry, headers):
+        with self.db:
+            self.db.execute(
+                'UPDATE entries SET fetched_at = ?, etag = ?, '
+                'last_modified = ? WHERE url = ?',
+                (
+                    time.time(),
+                    headers.get('ETag') or entry.etag,
+                    headers.get('Last-Modified') or entry.last_modified,
+                    entry.url
+                )
+            )
+
+    def size(self):
+        return self.db.execute(
+            'SELECT COALESCE(SUM(size), 0) '
+            'FROM (SELECT DISTINCT digest, size FROM entries)'
+        ).fetchone()[0]
+
+    def evict(self):
+        total_size = self.size()
+        if total_size <= self.max_size:
+            return
+
+        rows = self.db.execute(
+            'SELECT url, digest, size FROM entries ORDER BY accessed_at'
+        ).fetchall()
+        for url, digest, size in rows:
+            if total_size <= self.max_size:
+                break
+            with self.db:
+                self.db.execute('DELETE FROM entries WHERE url = ?', (url,))
+            still_used = self.db.execute(
+                'SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)
+            ).fetchone()
+            if not still_used:
+                total_size -= size
+                self.blob_path(digest).unlink(missing_ok=True)
+            logger.debug('Evicted from the http cache: %s', url)
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves `pages` of the server and counts the requests. Responds with
+    304 when the ETag matches.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = self.server.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:16])
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), StandInHandler
+        )
+        self.server.requests = []
+        self.server.pages = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def make_cache(self, **kwargs):
+        cache = HTTPCache(self.tmp_dir.name, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def do_fetch(self, url):
+        import requests
+
+        def do_fetch(headers):
+            res = requests.get(url, headers=headers)
+            return res.status_code, res.headers, res.content
+        return do_fetch
+
+    def test_revalidation(self):
+        self.server.pages['/a'] = b'page a'
+        url = f'{self.base_url}/a'
+        cache = self.make_cache(ttl=0)
+
+        self.assertEqual(cache.fetch(url, self.do_fetch(url)), (200, b'page a'))
+        self.assertEqual(cache.fetch(url, self.do_fetch(url)), (200, b'page a'))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual((cache.misses, cache.revalidations), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = self.make_cache(max_size=10)
+        for path, body in [('/a', b'aaaa'), ('/b', b'bbbb'), ('/c', b'cccc')]:
+            self.server.pages[path] = body
+            url = f'{self.base_url}{path}'
+            cache.fetch(url, self.do_fetch(url))
+            if path == '/b':
+                # Makes /a the most recently used entry.
+                cache.fetch(f'{self.base_url}/a', None)
+
+        self.assertIsNone(cache.get_entry(f'{self.base_url}/b'))
+        self.assertIsNotNone(cache.get_entry(f'{self.base_url}/a'))
+        self.assertLessEqual(cache.size(), 10)
+
+    def test_offline(self):
+        cache = self.make_cache(offline=True)
+        with self.assertRaises(CacheMiss):
+            cache.fetch(f'{self.base_url}/a', None)
+
+    def test_warm_run_makes_no_requests(self):
+        import argparse
+        import main
+        from translation import TranslationService, TranslationStore
+
+        audio_url = f'{self.base_url}/audio/1.mp3'
+        self.server.pages['/dictionary/test'] = f'''
+            <span class="Sense" id="test__1">
+                <span class="DEF">a definition</span>
+                <span class="EXAMPLE">
+                    <span data-src-mp3="{audio_url}"></span>An example.
+                </span>
+            </span>
+        '''.encode()
+        self.server.pages['/audio/1.mp3'] = b'mp3'
+
+        translated = []
+
+        class GetVocabulary(main.GetVocabulary):
+            WORDS_DIR = pathlib.Path(self.tmp_dir.name, 'words_data')
+            DICTIONARY_URL = f'{self.base_url}/dictionary/{{word}}'
+
+            def translate_batch(self, texts):
+                translated.append(texts)
+                return texts
+
+        store = TranslationStore(
+            pathlib.Path(self.tmp_dir.name, 'translations.sqlite')
+        )
+        self.addCleanup(store.close)
+        for _ in range(2):
+            cache = self.make_cache()
+            GetVocabulary(
+                cache=cache, translations=TranslationService(store=store)
+            )(argparse.Namespace(words=['test']))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(cache.hits, 2)
+        # Only the cold run translates.
+        self.assertEqual(len(translated), 1)
+        self.assertTrue(
+            GetVocabulary.WORDS_DIR.joinpath('test_flashcards', '1.mp3').exists()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,336 @@
+"""
+Where the time of a run goes: wall and CPU time per pipeline stage, the
+requests and bytes per host, the cache and translation hit ratios, and
+optionally a cProfile dump and the top tracemalloc allocations. The
+report of a run is written as JSON or in the Prometheus text format.
+
+    python main.py get-vocabulary get --metrics run.json
+    python main.py get-vocabulary get --metrics run.prom --profile run.prof
+"""
+import json
+import time
+import cProfile
+import logging
+import unittest
+import tracemalloc
+import contextlib
+import collections
+
+from typing import Dict
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+
+class Instrumentation:
+    """
+    Accumulates wall and CPU time per pipeline stage. Stages of different
+    words overlap in the async mode, so the totals may exceed the run
+    time, and the CPU time is the one of the whole process.
+    """
+
+    def __init__(self, clock=time.perf_counter, cpu_clock=time.process_time):
+        self.clock = clock
+        self.cpu_clock = cpu_clock
+        self.stages: Dict[str, StageStats] = collections.defaultdict(StageStats)
+        self.started_at = clock()
+        self.cpu_started_at = cpu_clock()
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        start, cpu_start = self.clock(), self.cpu_clock()
+        try:
+            yield
+        finally:
+            stats = self.stages[stage]
+            stats.calls += 1
+            stats.wall += self.clock() - start
+            stats.cpu += self.cpu_clock() - cpu_start
+
+    def report(self, transport=None, cache=None, translations=None,
+               ledger=None, profiler=None):
+        """The report of the run with the stats of the given parts."""
+        report = {
+            'elapsed_seconds': self.clock() - self.started_at,
+            'cpu_seconds': self.cpu_clock() - self.cpu_started_at,
+            'stages': {
+                stage: {
+                    'calls': stats.calls,
+                    'wall_seconds': stats.wall,
+                    'cpu_seconds': stats.cpu,
+                }
+                for stage, stats in self.stages.items()
+            },
+        }
+        if transport is not None:
+            report['http'] = transport.stats.summary()
+        if cache is not None:
+            report['cache'] = {
+                'hits': cache.hits,
+                'misses': cache.misses,
+                'revalidations': cache.revalidations,
+                'hit_ratio': hit_ratio(cache.hits, cache.misses),
+            }
+        if translations is not None:
+            report['translations'] = {
+                'hits': translations.hits,
+                'misses': translations.misses,
+                'hit_ratio': hit_ratio(translations.hits, translations.misses),
+            }
+        if ledger is not None:
+            report['ledger'] = {'skipped': ledger.skipped}
+        if profiler is not None and profiler.memory is not None:
+            report['memory'] = profiler.memory
+        return report
+
+    def log_summary(self):
+        logger.info('Finished in %.2fs', self.clock() - self.started_at)
+        for stage, stats in self.stages.items():
+            logger.info(
+                'Stage %-10s calls=%-6d wall=%.2fs cpu=%.2fs avg=%.3fs',
+                stage, stats.calls, stats.wall, stats.cpu,
+                stats.wall / stats.calls
+            )
+
+
+def hit_ratio(hits, misses):
+    """
+    >>> hit_ratio(3, 1), hit_ratio(0, 0)
+    (0.75, 0.0)
+    """
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+class Profiler:
+    """
+    Runs cProfile and dumps its stats to profile_path, and keeps the
+    tracemalloc_top biggest allocation sites, while it is entered.
+    """
+
+    def __init__(self, profile_path=None, tracemalloc_top=0):
+        self.profile_path = profile_path
+        self.tracemalloc_top = tracemalloc_top
+        self.profile = None
+        self.memory = None
+
+    def __enter__(self):
+        if self.tracemalloc_top:
+            tracemalloc.start()
+        if self.profile_path:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.profile_path)
+        if self.tracemalloc_top:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.memory = {
+                'peak_bytes': peak,
+                'top': [
+                    {
+                        'location': str(stat.traceback),
+                        'bytes': stat.size,
+                        'blocks': stat.count,
+                    }
+                    for stat in snapshot.statistics('lineno')[
+                        :self.tracemalloc_top
+                    ]
+                ],
+            }
+
+
+def prometheus_labels(**labels):
+    """
+    >>> prometheus_labels(host='a"b', quantile=0.5)
+    '{host="a\\\\"b",quantile="0.5"}'
+    >>> prometheus_labels()
+    ''
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n')
+        )
+        for name, value in labels.items()
+    ) + '}'
+
+
+def to_prometheus(report, prefix='longman'):
+    """The report in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, samples):
+        if not samples:
+            return
+        lines.append(f'# TYPE {prefix}_{name} {kind}')
+        for labels, value in samples:
+            lines.append(f'{prefix}_{name}{prometheus_labels(**labels)} {value}')
+
+    metric('run_seconds', 'gauge', [({}, report['elapsed_seconds'])])
+    metric('run_cpu_seconds', 'gauge', [({}, report['cpu_seconds'])])
+
+    stages = report['stages']
+    for name, key in [
+        ('stage_calls_total', 'calls'),
+        ('stage_wall_seconds_total', 'wall_seconds'),
+        ('stage_cpu_seconds_total', 'cpu_seconds'),
+    ]:
+        metric(name, 'counter', [
+            ({'stage': stage}, stats[key]) for stage, stats in stages.items()
+        ])
+
+    http = report.get('http', {})
+    for name, key in [
+        ('http_requests_total', 'requests'),
+        ('http_retries_total', 'retries'),
+        ('http_errors_total', 'errors'),
+        ('http_response_bytes_total', 'bytes'),
+        ('http_throttled_seconds_total', 'throttled_seconds'),
+    ]:
+        metric(name, 'counter', [
+            ({'host': host}, stats[key]) for host, stats in http.items()
+        ])
+    metric('http_responses_total', 'counter', [
+        ({'host': host, 'code': code}, count)
+        for host, stats in http.items()
+        for code, count in stats['codes'].items()
+    ])
+    # The hosts without a response have no latencies.
+    timed = {host: stats for host, stats in http.items() if stats['requests']}
+    metric('http_latency_seconds', 'summary', [
+        ({'host': host, 'quantile': quantile}, stats[key])
+        for host, stats in timed.items()
+        for quantile, key in [(0.5, 'p50'), (0.95, 'p95')]
+    ])
+    for host, stats in timed.items():
+        labels = prometheus_labels(host=host)
+        lines.append(
+            f'{prefix}_http_latency_seconds_sum{labels} {stats["total_seconds"]}'
+        )
+        lines.append(
+            f'{prefix}_http_latency_seconds_count{labels} {stats["requests"]}'
+        )
+    metric('http_latency_max_seconds', 'gauge', [
+        ({'host': host}, stats['max']) for host, stats in timed.items()
+    ])
+
+    for part in ['cache', 'translations']:
+        if part in report:
+            stats = report[part]
+            metric(f'{part}_hits_total', 'counter', [({}, stats['hits'])])
+            metric(f'{part}_misses_total', 'counter', [({}, stats['misses'])])
+            metric(f'{part}_hit_ratio', 'gauge', [({}, stats['hit_ratio'])])
+    if 'ledger' in report:
+        metric('ledger_skipped_total', 'counter', [
+            ({}, report['ledger']['skipped'])
+        ])
+    if 'memory' in report:
+        metric('memory_peak_bytes', 'gauge', [
+            ({}, report['memory']['peak_bytes'])
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(report, path, report_format=None):
+    """The format is json or prometheus, by default .json is json."""
+    if report_format is None:
+        report_format = 'json' if str(path).endswith('.json') else 'prometheus'
+    with open(path, 'w') as fh:
+        if report_format == 'json':
+            json.dump(report, fh, indent=4)
+        else:
+            fh.write(to_prometheus(report))
+
+
+class TestCase(unittest.TestCase):
+
+    def test_measure(self):
+        now = [0.0]
+        metrics = Instrumentation(clock=lambda: now[0], cpu_clock=lambda: now[0] / 2)
+        with metrics.measure('parse'):
+            now[0] += 2
+        with self.assertRaises(ValueError):
+            with metrics.measure('parse'):
+                now[0] += 1
+                raise ValueError
+        self.assertEqual(metrics.report()['stages'], {'parse': {
+            'calls': 2, 'wall_seconds': 3.0, 'cpu_seconds': 1.5
+        }})
+
+    def test_prometheus(self):
+        from transport import LatencyStats
+
+        class Part:
+            hits = 3
+            misses = 1
+            revalidations = 0
+            skipped = 2
+            stats = LatencyStats()
+
+        Part.stats.record('example.com', 0.25, 200, 100)
+        Part.stats.record('example.com', 0.5, 200, 100)
+        Part.stats.record_error('down.example.com')
+        metrics = Instrumentation()
+        with metrics.measure('html'):
+            pass
+        text = to_prometheus(metrics.report(
+            transport=Part, cache=Part, translations=Part, ledger=Part
+        ))
+        self.assertIn('longman_stage_calls_total{stage="html"} 1\n', text)
+        self.assertIn(
+            'longman_http_response_bytes_total{host="example.com"} 200\n', text
+        )
+        self.assertIn(
+            'longman_http_responses_total{host="example.com",code="200"} 2\n',
+            text
+        )
+        self.assertIn('longman_cache_hit_ratio 0.75\n', text)
+        self.assertIn(
+            'longman_http_errors_total{host="down.example.com"} 1\n', text
+        )
+        self.assertNotIn('latency_seconds{host="down.example.com"', text)
+        self.assertNotIn('latency_seconds_sum{host="down.example.com"', text)
+        self.assertIn(
+            '# TYPE longman_http_latency_seconds summary\n'
+            'longman_http_latency_seconds{host="example.com",quantile="0.5"} 0.375\n'
+            'longman_http_latency_seconds{host="example.com",quantile="0.95"} 0.5\n'
+            'longman_http_latency_seconds_sum{host="example.com"} 0.75\n'
+            'longman_http_latency_seconds_count{host="example.com"} 2\n'
+            '# TYPE longman_http_latency_max_seconds gauge\n'
+            'longman_http_latency_max_seconds{host="example.com"} 0.5\n',
+            text
+        )
+
+    def test_profiler(self):
+        import os
+        import pstats
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'run.prof')
+            with Profiler(path, tracemalloc_top=3) as profiler:
+                data = [bytes(1000) for _ in range(100)]
+            self.assertTrue(pstats.Stats(path).total_calls)
+        self.assertEqual(len(profiler.memory['top']), 3)
+        self.assertGreater(profiler.memory['peak_bytes'], 100 * 1000)
+        del data
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import unittest
+import tempfile
+
+from typing import NamedTuple, Optional
+
+
+STAGES = ('html', 'json', 'audio', 'translation')
+DONE = 'done'
+FAILED = 'failed'
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_digest(*parts):
+    """
+    The digest of the inputs of a stage, the parts are anything json can
+    dump.
+    >>> input_digest('word', {'b': 1, 'a': 2}) == input_digest('word', {'a': 2, 'b': 1})
+    True
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+class StageRecord(NamedTuple):
+    word: str
+    stage: str
+    item: str
+    status: str
+    input_digest: str
+    output_digest: Optional[str]
+    error: Optional[str]
+    updated_at: float
+
+
+class JobLedger:
+    """
+    The status of every stage of every word: html and json per word, audio
+    and translation per flashcard, the item is the flashcard number. A
+    stage is done when its record has the digest of the current inputs
+    and its output file still has the recorded sha256, so a rerun redoes
+    only the missing or stale work.
+    """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(str(db_path))
+        with self.db:
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS stages (
+                    word TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    input_digest TEXT NOT NULL,
+                    output_digest TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (word, stage, item)
+                )
+            ''')
+        self.skipped = 0
+
+    def close(self):
+        self.db.close()
+
+    def lookup(self, word, stage, item='') -> Optional[StageRecord]:
+        row = self.db.execute(
+            'SELECT * FROM stages WHERE word = ? AND stage = ? AND item = ?',
+            (word, stage, str(item))
+        ).fetchone()
+        return StageRecord(*row) if row else None
+
+    def is_done(self, word, stage, digest, path, item=''):
+        record = self.lookup(word, stage, item)
+        done = (
+            record is not None and
+            record.status == DONE and
+            record.input_digest == digest and
+            os.path.exists(path) and
+            sha256_file(path) == record.output_digest
+        )
+        self.skipped += done
+        return done
+
+    def record(self, word, stage, digest, status, output_digest=None,
+               error=None, item=''):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO stages (word, stage, item, status, '
+                'input_digest, output_digest, error, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (word, stage, str(item), status, digest, output_digest,
+                 error, time.time())
+            )
+
+    def mark_done(self, word, stage, digest, path, item=''):
+        self.record(
+            word, stage, digest, DONE, output_digest=sha256_file(path),
+            item=item
+        )
+
+    def mark_failed(self, word, stage, digest, error, item=''):
+        self.record(word, stage, digest, FAILED, error=str(error), item=item)
+
+    def forget(self, word, stage=None):
+        """Removes the records of a word, or of one of its stages."""
+        with self.db:
+            if stage is None:
+                self.db.execute('DELETE FROM stages WHERE word = ?', (word,))
+            else:
+                self.db.execute(
+                    'DELETE FROM stages WHERE word = ? AND stage = ?',
+                    (word, stage)
+                )
+
+    def summary(self, words=None):
+        """
+        Returns {word: {stage: {status: count}}} of the given words or of
+        all of them.
+        """
+        query = 'SELECT word, stage, status, COUNT(*) FROM stages'
+        params = []
+        if words:
+            query += ' WHERE word IN ({})'.format(','.join('?' * len(words)))
+            params = list(words)
+        query += ' GROUP BY word, stage, status ORDER BY word'
+
+        summary = {}
+        for word, stage, status, count in self.db.execute(query, params):
+            summary.setdefault(word, {}).setdefault(stage, {})[status] = count
+        return summary
+
+    def failures(self, word):
+        return [
+            StageRecord(*row) for row in self.db.execute(
+                'SELECT * FROM stages WHERE word = ? AND status = ? '
+                'ORDER BY stage, CAST(item AS INTEGER)',
+                (word, FAILED)
+            )
+        ]
+
+
+def format_summary(summary):
+    """
+    >>> print(format_summary({'go': {'html': {'done': 1}, 'audio': {'done': 3, 'failed': 1}}}))
+    word                 html       json       audio      translation
+    go                   1          -          3/4        -
+    """
+    lines = ['{:<20} {:<10} {:<10} {:<10} {}'.format('word', *STAGES)]
+    for word, stages in summary.items():
+        cells = []
+        for stage in STAGES:
+            counts = stages.get(stage)
+            if not counts:
+                cells.append('-')
+            elif len(counts) == 1 and DONE in counts and stage in ('html', 'json'):
+                cells.append(str(counts[DONE]))
+            else:
+                cells.append(f'{counts.get(DONE, 0)}/{sum(counts.values())}')
+        lines.append('{:<20} {:<10} {:<10} {:<10} {}'.format(word, *cells))
+    return '\n'.join(lines)
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.ledger = JobLedger(os.path.join(self.tmp_dir, 'ledger.sqlite'))
+        self.addCleanup(self.ledger.close)
+        self.path = os.path.join(self.tmp_dir, '1.mp3')
+        with open(self.path, 'wb') as fh:
+            fh.write(b'mp3')
+
+    def test_is_done(self):
+        digest = input_digest('http://audio/1.mp3')
+        self.assertFalse(self.ledger.is_done('go', 'audio', digest, self.path, 1))
+
+        self.ledger.mark_done('go', 'audio', digest, self.path, 1)
+        self.assertTrue(self.ledger.is_done('go', 'audio', digest, self.path, 1))
+        # Other inputs.
+        self.assertFalse(self.ledger.is_done(
+            'go', 'audio', input_digest('http://audio/2.mp3'), self.path, 1
+        ))
+        # The output has been changed.
+        with open(self.path, 'wb') as fh:
+            fh.write(b'MP3')
+        self.assertFalse(self.ledger.is_done('go', 'audio', digest, self.path, 1))
+        os.remove(self.path)
+        self.assertFalse(self.ledger.is_done('go', 'audio', digest, self.path, 1))
+
+    def test_failed_stage_is_redone(self):
+        digest = input_digest('text')
+        self.ledger.mark_failed('go', 'translation', digest, 'timeout', 2)
+        self.assertFalse(
+            self.ledger.is_done('go', 'translation', digest, self.path, 2)
+        )
+        self.assertEqual(
+            [record.error for record in self.ledger.failures('go')],
+            ['timeout']
+        )
+
+    def test_summary(self):
+        digest = input_digest('x')
+        self.ledger.mark_done('go', 'html', digest, self.path)
+        self.ledger.mark_done('go', 'audio', digest, self.path, 1)
+        self.ledger.mark_failed('go', 'audio', digest, 'error', 2)
+        self.ledger.mark_done('be', 'html', digest, self.path)
+        self.assertEqual(self.ledger.summary(['go']), {'go': {
+            'html': {DONE: 1}, 'audio': {DONE: 1, FAILED: 1}
+        }})
+        self.ledger.forget('go')
+        self.assertEqual(list(self.ledger.summary()), ['be'])
+
+    def test_rerun_redoes_only_missing_work(self):
+        import argparse
+        import pathlib
+        import threading
+        import http.server
+
+        import main
+        from http_cache import StandInHandler
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        server.requests = []
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        server.pages = {
+            '/dictionary/test': f'''
+                <span class="Sense" id="test__1">
+                    <span class="DEF">a definition</span>
+                    <span class="EXAMPLE">
+                        <span data-src-mp3="{base_url}/1.mp3"></span>One.
+                    </span>
+                    <span class="EXAMPLE">
+                        <span data-src-mp3="{base_url}/2.mp3"></span>Two.
+                    </span>
+                </span>
+            '''.encode(),
+            '/1.mp3': b'mp3 1',
+            '/2.mp3': b'mp3 2',
+        }
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        translated = []
+
+        class GetVocabulary(main.GetVocabulary):
+            WORDS_DIR = pathlib.Path(self.tmp_dir, 'words_data')
+            DICTIONARY_URL = f'{base_url}/dictionary/{{word}}'
+
+            def translate_batch(self, texts):
+                translated.extend(texts)
+                return [text.upper() for text in texts]
+
+        class AsyncGetVocabulary(GetVocabulary, main.AsyncGetVocabulary):
+            async def translate_batch_async(self, texts):
+                return self.translate_batch(texts)
+
+        def run(cls):
+            cls(ledger=self.ledger)(argparse.Namespace(words=['test']))
+
+        run(GetVocabulary)
+        self.assertEqual(len(server.requests), 3)
+        work_dir = GetVocabulary.WORDS_DIR.joinpath('test_flashcards')
+        self.assertEqual(
+            sorted(path.name for path in work_dir.iterdir()),
+            ['1.json', '1.mp3', '2.json', '2.mp3']
+        )
+
+        for cls in [GetVocabulary, AsyncGetVocabulary]:
+            with self.subTest(cls=cls.__name__):
+                server.requests.clear()
+                translated.clear()
+                run(cls)
+                self.assertEqual((server.requests, translated), ([], []))
+
+                work_dir.joinpath('2.mp3').unlink()
+                work_dir.joinpath('1.json').write_text('{}')
+                run(cls)
+                self.assertEqual(server.requests, ['/2.mp3'])
+                self.assertEqual(translated, ['test', 'One.'])
+                self.assertEqual(
+                    json.loads(work_dir.joinpath('1.json').read_text())['question'],
+                    'ONE.'
+                )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import re
+import sys
 import json
+import time
 import os
 import os.path
 import argparse
@@ -7,11 +9,19 @@ import urllib.parse
 import typing
 import logging
 import pathlib
+import asyncio
 
-import requests
-
-from bs4 import BeautifulSoup
-from tornado.httpclient import HTTPRequest, HTTPResponse, HTTPClient
+from http_cache import HTTPCache, CacheMiss
+from translation import TranslationService, TranslationStore
+from parsers import PARSERS, LxmlParser
+from ledger import JobLedger, format_summary, input_digest, sha256_file
+from deck import export_words, flashcard_words
+from reparse import parse_digest, reparse, write_json_atomic
+from search_index import FIELDS, SearchIndex
+from instrumentation import Instrumentation, Profiler, write_report
+from transport import (
+    AsyncTransport, Request, Response, RetryPolicy, Transport
+)
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -23,9 +33,40 @@ class GetVocabulary:
         os.path.abspath(os.path.dirname(__file__)),
         'words_data'
     ))
-
-    def __init__(self):
-        self.http_client = HTTPClient()
+    CACHE_DIR = pathlib.Path(os.path.join(
+        os.path.abspath(os.path.dirname(__file__)),
+        'http_cache'
+    ))
+    TRANSLATIONS_DB = pathlib.Path(os.path.join(
+        os.path.abspath(os.path.dirname(__file__)),
+        'translations.sqlite'
+    ))
+    LEDGER_DB = pathlib.Path(os.path.join(
+        os.path.abspath(os.path.dirname(__file__)),
+        'ledger.sqlite'
+    ))
+    SEARCH_DB = pathlib.Path(os.path.join(
+        os.path.abspath(os.path.dirname(__file__)),
+        'search.sqlite'
+    ))
+    DICTIONARY_URL = 'https://www.ldoceonline.com/dictionary/{word}'
+    TRANSLATE_URL = 'https://translate.yandex.net/api/v1.5/tr.json/translate'
+
+    def __init__(
+            self, cache: typing.Optional[HTTPCache] = None,
+            translations: typing.Optional[TranslationService] = None,
+            parser=None, ledger: typing.Optional[JobLedger] = None,
+            transport: typing.Optional[Transport] = None,
+            metrics: typing.Optional[Instrumentation] = None,
+            search_index: typing.Optional[SearchIndex] = None
+    ):
+        self.transport = transport or Transport()
+        self.cache = cache
+        self.translations = translations or TranslationService()
+        self.parser = parser or LxmlParser()
+        self.ledger = ledger
+        self.metrics = metrics or Instrumentation()
+        self.search_index = search_index
 
     def __call__(self, args: argparse.Namespace):
         self.WORDS_DIR.mkdir(exist_ok=True)
@@ -34,129 +75,115 @@ class GetVocabulary:
         for word in words:
             logger.info('Processing the word: %s', word)
             orig_word = word
-            word = re.sub(r'\s+', ' ', word).strip().replace(' ', '-')
+            word = self.normalize_word(word)
 
-            html_file = self.get_word_html(word)
+            with self.metrics.measure('html'):
+                html_file = self.done_html(word)
+                if html_file is None:
+                    html_file = self.get_word_html(word)
+                    self.record_html(word, html_file)
             if html_file is None:
                 logger.error('Could not get html: %s', word)
                 continue
 
-            json_file_path = self.parse_word_html_page(
-                word=word, html_file_path=html_file
-            )
+            with self.metrics.measure('parse'):
+                json_file_path = self.word_json(word, html_file)
             self.make_flashcards(
                 orig_word=orig_word, word=word, json_file_path=json_file_path
             )
 
+    @staticmethod
+    def normalize_word(word):
+        return re.sub(r'\s+', ' ', word).strip().replace(' ', '-')
+
+    def stage_done(self, word, stage, digest, path, item=''):
+        return self.ledger is not None and self.ledger.is_done(
+            word, stage, digest, path, item
+        )
+
+    def record_stage(self, word, stage, digest, path, error=None, item=''):
+        """A stage without an output path or with an error has failed."""
+        if self.ledger is None:
+            return
+        if path is None or error is not None:
+            self.ledger.mark_failed(
+                word, stage, digest, error or 'no output', item
+            )
+        else:
+            self.ledger.mark_done(word, stage, digest, path, item)
+
+    def html_digest(self, word):
+        return input_digest(self.DICTIONARY_URL.format(word=word))
+
+    def done_html(self, word):
+        """The html file of the word if the ledger has it up to date."""
+        path = self.WORDS_DIR.joinpath(f'{word}.html')
+        if self.stage_done(word, 'html', self.html_digest(word), path):
+            return str(path)
+        return None
+
+    def record_html(self, word, html_file):
+        self.record_stage(word, 'html', self.html_digest(word), html_file)
+
+    def word_json(self, word, html_file):
+        """
+        Parses the html page unless the json of the same html is done, and
+        indexes the json for search.
+        """
+        digest = parse_digest(sha256_file(html_file), self.parser.name)
+        path = self.WORDS_DIR.joinpath(f'{word}.json')
+        if self.stage_done(word, 'json', digest, path):
+            json_file_path = str(path)
+        else:
+            json_file_path = self.parse_word_html_page(
+                word=word, html_file_path=html_file
+            )
+            self.record_stage(word, 'json', digest, json_file_path)
+        if self.search_index is not None and json_file_path is not None:
+            self.search_index.add_json(word, json_file_path)
+        return json_file_path
+
+    def get_fetcher(self, url):
+        def do_fetch(headers):
+            response = self.transport.fetch(Request('GET', url, headers))
+            return response.code, response.headers, response.body
+        return do_fetch
+
+    def fetch_url(self, url, do_fetch):
+        """
+        do_fetch(headers) returns (code, headers, body), the headers are
+        the conditional ones when the url is revalidated.
+        """
+        if self.cache is None:
+            code, _, body = do_fetch({})
+            return code, body
+        return self.cache.fetch(url, do_fetch)
+
     def get_word_html(self, word):
         html_file = None
-        res: requests.Response = requests.get(
-            f'https://www.ldoceonline.com/dictionary/{word}'
-        )
-        if res.status_code != 200:
-            err_msg = f'[{res.status_code}] {res.text}'
+        url = self.DICTIONARY_URL.format(word=word)
+
+        code, body = self.fetch_url(url, self.get_fetcher(url))
+        if code != 200:
+            err_msg = f'[{code}] {body.decode(errors="replace")}'
             logger.error('Getting word="%s" html ERROR="%s"', word, err_msg)
             return html_file
 
+        return self.save_word_html(word, body.decode('utf-8'))
+
+    def save_word_html(self, word, text):
         html_file = os.path.join(self.WORDS_DIR, f'{word}.html')
         with open(html_file, 'w') as fh:
-            fh.write(res.text)
+            fh.write(text)
         return html_file
 
     def parse_word_html_page(self, word, html_file_path):
         with open(html_file_path) as fh:
             html_doc = fh.read()
-        soup = BeautifulSoup(html_doc, 'html.parser')
-        senses = soup.find_all("span", attrs={"class": "Sense"})
-
-        data = []
-        for sense in senses:
-            datum = {}
-            number = sense.attrs['id'].split('__')[1]
-            if number:
-                datum['number'] = number.strip()
-
-            sign_post = sense.find('span', attrs={'class': 'signpost'.upper()})
-            if sign_post and sign_post.parent == sense:
-                datum['sign_post'] = sign_post.text.strip()
-
-            definition = sense.find('span', attrs={'class': 'def'.upper()})
-            if definition and definition.parent == sense:
-                datum['definition'] = definition.text.strip()
-
-            datum['examples'] = []
-
-            examples = sense.find_all(
-                "span", attrs={"class": "example".upper()}
-            )
-            for example in examples:
-                if example.span and 'data-src-mp3' in example.span.attrs:
-                    explanation = ''
-                    parent_tag = example.parent
-
-                    if parent_tag and 'GramExa' in parent_tag.attrs.get('class'):
-                        prop_form = parent_tag.find(
-                            "span", attrs={"class": "propform".upper()}
-                        )
-                        if prop_form and prop_form.parent == parent_tag:
-                            explanation += prop_form.text
-
-                        gloss = parent_tag.find(
-                            "span", attrs={"class": "gloss".upper()}
-                        )
-                        if gloss and gloss.parent == parent_tag:
-                            explanation += gloss.text
-
-                    if parent_tag and 'ColloExa' in parent_tag.attrs.get('class'):
-                        geo = parent_tag.find(
-                            "span", attrs={"class": 'geo'.upper()}
-                        )
-                        if geo and geo.parent == parent_tag:
-                            geo = geo.text
-                        else:
-                            geo = ''
-
-                        registerlab = parent_tag.find(
-                            "span", attrs={"class": 'registerlab'.upper()}
-                        )
-                        if registerlab and registerlab.parent == parent_tag:
-                            registerlab = registerlab.text
-                        else:
-                            registerlab = ''
-
-                        if geo or registerlab:
-                            explanation += '[{}]  '.format(
-                                ','.join(
-                                    i.strip()
-                                    for i in [geo, registerlab] if i.strip()
-                                )
-                            )
-
-                        for item_tag in ['collo', 'gloss']:
-                            item = parent_tag.find(
-                                "span", attrs={"class": item_tag.upper()}
-                            )
-                            if item and item.parent == parent_tag:
-                                explanation += item.text
-
-                    text = example.text.strip().replace('’', "'")
-                    match = re.search(r'\(\=.*\)', text)
-                    if match:
-                        explanation += ' ' + match.group()
-                        text = re.sub(r'\(\=.*\)', ' ', text)
-
-                    datum['examples'].append({
-                        'explanation': explanation,
-                        'audio': example.span.attrs['data-src-mp3'],
-                        'eng_text': text
-                    })
-
-            if datum['examples']:
-                data.append(datum)
+        data = self.parser.parse(html_doc)
 
         output = os.path.join(self.WORDS_DIR, f'{word}.json')
-        with open(output, 'w') as fh:
-            json.dump(data, fh, ensure_ascii=False, indent=4)
+        write_json_atomic(output, data)
         return output
 
     def make_flashcards(self, orig_word, word, json_file_path):
@@ -166,104 +193,766 @@ class GetVocabulary:
         work_dir = self.WORDS_DIR.joinpath(f'{word}_flashcards')
         work_dir.mkdir(exist_ok=True)
 
-        flashcard_num = 0
-        for datum in data:
-            for flashcard in datum['examples']:
-                flashcard_num += 1
-                audio_file = self.download_audio(audio_url=flashcard['audio'])
-                if audio_file:
-                    output_json = os.path.join(work_dir, f'{flashcard_num}.json')
-                    with open(output_json, 'w') as fh:
-                        explanation = f'{orig_word.upper()} -- '
-                        if 'sing_post' in datum:
-                            explanation += f'[{datum["sing_post"]}] '
-                        if 'definition' in datum:
-                            explanation += f'({datum["definition"]}) '
-                        if 'explanation' in datum:
-                            explanation += f'{datum["explanation"]} '
-                        word_translation = self.translate(text=orig_word)
-                        if word_translation:
-                            explanation += f'{word_translation}'
-
-                        json.dump({
-                            'question': self.translate(text=flashcard['eng_text']),
-                            'answer': flashcard['eng_text'],
-                            'explanation': explanation.strip()
-                        }, fh, ensure_ascii=False, indent=4)
-
-                    output_mp3 = work_dir.joinpath(f'{flashcard_num}.mp3')
-                    output_mp3.write_bytes(audio_file)
+        examples = self.numbered_examples(data)
+        downloaded = {
+            flashcard_num: self.download_audio(audio_url=flashcard['audio'])
+            for flashcard_num, _, flashcard in self.missing_audio(
+                word, work_dir, examples
+            )
+        }
+        flashcards = self.collect_flashcards(word, examples, downloaded)
+
+        pending = self.pending_flashcards(orig_word, word, work_dir, flashcards)
+        translations = {}
+        if pending:
+            with self.metrics.measure('translate'):
+                translations = self.translate_many(
+                    self.flashcard_texts(orig_word, pending)
+                )
+        with self.metrics.measure('write'):
+            self.save_flashcards(
+                orig_word, word, work_dir, flashcards, pending, translations
+            )
+
+    @staticmethod
+    def numbered_examples(data):
+        """
+        (flashcard_num, datum, flashcard) of every example, numbered in
+        the order of the page, so a rerun gives an example the same number.
+        """
+        examples = [
+            (datum, flashcard)
+            for datum in data
+            for flashcard in datum['examples']
+        ]
+        return [
+            (flashcard_num, datum, flashcard)
+            for flashcard_num, (datum, flashcard) in enumerate(examples, 1)
+        ]
+
+    def missing_audio(self, word, work_dir, examples):
+        """The examples without an up to date mp3 file."""
+        return [
+            (flashcard_num, datum, flashcard)
+            for flashcard_num, datum, flashcard in examples
+            if not self.stage_done(
+                word, 'audio', input_digest(flashcard['audio']),
+                work_dir.joinpath(f'{flashcard_num}.mp3'), flashcard_num
+            )
+        ]
+
+    def collect_flashcards(self, word, examples, downloaded):
+        """
+        Returns (flashcard_num, datum, flashcard, audio_file) of the
+        examples with audio, audio_file is None when the mp3 file is
+        already done. A failed download drops the flashcard, but it keeps
+        its number.
+        """
+        flashcards = []
+        for flashcard_num, datum, flashcard in examples:
+            audio_file = downloaded.get(flashcard_num)
+            if flashcard_num in downloaded and not audio_file:
+                self.record_stage(
+                    word, 'audio', input_digest(flashcard['audio']), None,
+                    error='download failed', item=flashcard_num
+                )
+                continue
+            flashcards.append((flashcard_num, datum, flashcard, audio_file))
+        return flashcards
+
+    def flashcard_digest(self, orig_word, datum, flashcard):
+        """The inputs of the json file of a flashcard."""
+        return input_digest(
+            self.translations.lang,
+            orig_word,
+            {key: value for key, value in datum.items() if key != 'examples'},
+            flashcard['eng_text']
+        )
 
-    def translate(self, text):
-        url = 'https://translate.yandex.net/api/v1.5/tr.json/translate'
+    def pending_flashcards(self, orig_word, word, work_dir, flashcards):
+        """The flashcards without an up to date translated json file."""
+        return [
+            (flashcard_num, datum, flashcard, audio_file)
+            for flashcard_num, datum, flashcard, audio_file in flashcards
+            if not self.stage_done(
+                word, 'translation',
+                self.flashcard_digest(orig_word, datum, flashcard),
+                work_dir.joinpath(f'{flashcard_num}.json'), flashcard_num
+            )
+        ]
+
+    @staticmethod
+    def flashcard_texts(orig_word, flashcards):
+        # The word and all its examples are translated together.
+        return [orig_word] + [
+            flashcard['eng_text'] for _, _, flashcard, _ in flashcards
+        ]
+
+    def save_flashcards(
+            self, orig_word, word, work_dir, flashcards, pending, translations
+    ):
+        """
+        Writes the json files of the pending flashcards and the downloaded
+        mp3 files of all of them.
+        """
+        pending_nums = {flashcard_num for flashcard_num, *_ in pending}
+        for flashcard_num, datum, flashcard, audio_file in flashcards:
+            if flashcard_num in pending_nums:
+                question = translations[flashcard['eng_text']]
+                self.save_flashcard(
+                    work_dir=work_dir,
+                    flashcard_num=flashcard_num,
+                    flashcard=flashcard,
+                    question=question,
+                    explanation=self.flashcard_explanation(
+                        orig_word=orig_word,
+                        datum=datum,
+                        word_translation=translations[orig_word]
+                    ),
+                    audio_file=audio_file
+                )
+                # A flashcard without translations is redone next time.
+                self.record_stage(
+                    word, 'translation',
+                    self.flashcard_digest(orig_word, datum, flashcard),
+                    work_dir.joinpath(f'{flashcard_num}.json'),
+                    error=(
+                        None if question and translations[orig_word]
+                        else 'not translated'
+                    ),
+                    item=flashcard_num
+                )
+            elif audio_file is not None:
+                self.save_audio(work_dir, flashcard_num, audio_file)
+
+            if audio_file is not None:
+                self.record_stage(
+                    word, 'audio', input_digest(flashcard['audio']),
+                    work_dir.joinpath(f'{flashcard_num}.mp3'),
+                    item=flashcard_num
+                )
+
+    @staticmethod
+    def flashcard_explanation(orig_word, datum, word_translation):
+        explanation = f'{orig_word.upper()} -- '
+        if 'sing_post' in datum:
+            explanation += f'[{datum["sing_post"]}] '
+        if 'definition' in datum:
+            explanation += f'({datum["definition"]}) '
+        if 'explanation' in datum:
+            explanation += f'{datum["explanation"]} '
+        if word_translation:
+            explanation += f'{word_translation}'
+        return explanation.strip()
+
+    @staticmethod
+    def save_flashcard(
+            work_dir, flashcard_num, flashcard, question, explanation,
+            audio_file
+    ):
+        output_json = os.path.join(work_dir, f'{flashcard_num}.json')
+        with open(output_json, 'w') as fh:
+            json.dump({
+                'question': question,
+                'answer': flashcard['eng_text'],
+                'explanation': explanation
+            }, fh, ensure_ascii=False, indent=4)
+
+        if audio_file is not None:
+            GetVocabulary.save_audio(work_dir, flashcard_num, audio_file)
+
+    @staticmethod
+    def save_audio(work_dir, flashcard_num, audio_file):
+        output_mp3 = work_dir.joinpath(f'{flashcard_num}.mp3')
+        output_mp3.write_bytes(audio_file)
+
+    def translate_request(self, texts):
         api_key = os.getenv('YANDEX_TRANSLATE_API_KEY')
         params = urllib.parse.urlencode({
             'key': api_key,
-            'text': text,
-            'lang': 'en-ru'
+            'lang': self.translations.lang
         })
-        data = {}
-
-        http_request = HTTPRequest(
-            f'{url}?{params}',
-            method='POST',
-            body=json.dumps(data)
+        # The endpoint takes any number of `text` params, in the body they
+        # are not limited by the url length.
+        body = urllib.parse.urlencode([('text', text) for text in texts])
+
+        return Request(
+            'POST',
+            f'{self.TRANSLATE_URL}?{params}',
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            body=body.encode()
         )
 
+    def translate(self, text):
+        return self.translate_many([text])[text]
+
+    def translate_many(self, texts):
+        return self.translations.translate_many(texts, self.translate_batch)
+
+    def translate_batch(self, texts):
         try:
-            response: HTTPResponse = self.http_client.fetch(
-                http_request,
-                # argument only affects the `HTTPError` raised
-                # when a non-200 response code is
-                # used, instead of suppressing all errors.
-                raise_error=False
-            )
+            response = self.transport.fetch(self.translate_request(texts))
         except Exception as err:
             logger.exception(f'YaTranslate error: {err}')
             return None
 
+        return self.parse_translate_response(response)
+
+    @staticmethod
+    def parse_translate_response(response: Response):
         if response.code == 200:
             try:
                 data = json.loads(response.body)
                 if data['code'] == 200:
-                    return data['text'][0]
+                    return data['text']
             except Exception as err:
                 logger.exception(f'YaTranslate error: {err}')
 
         logger.error(f'YaTranslate error: {response.body}')
 
     def download_audio(self, audio_url):
-        http_request = HTTPRequest(f'{audio_url}', method='GET')
+        with self.metrics.measure('audio'):
+            try:
+                code, body = self.fetch_url(
+                    audio_url, self.get_fetcher(f'{audio_url}')
+                )
+            except CacheMiss:
+                raise
+            except Exception as err:
+                logger.exception(f'Download audio error: {err}')
+                return None
+
+            return self.parse_audio_response(code, body)
+
+    @staticmethod
+    def parse_audio_response(code, body):
+        if code == 200:
+            return body
+        logger.error(f'Download audio error: {body}')
+
+
+class AsyncGetVocabulary(GetVocabulary):
+    """
+    Processes all the words concurrently: page downloads, audio downloads
+    and translations of different words overlap, and only the number of
+    simultaneous requests per host is limited. The requests go through
+    the same transport as in the sync mode.
+    """
+
+    def __init__(
+            self, cache: typing.Optional[HTTPCache] = None,
+            translations: typing.Optional[TranslationService] = None,
+            parser=None, ledger: typing.Optional[JobLedger] = None,
+            transport: typing.Optional[Transport] = None,
+            metrics: typing.Optional[Instrumentation] = None,
+            search_index: typing.Optional[SearchIndex] = None,
+            max_per_host=4, host_limits=None, max_clients=30
+    ):
+        super().__init__(
+            cache=cache, translations=translations, parser=parser,
+            ledger=ledger, transport=transport, metrics=metrics,
+            search_index=search_index
+        )
+        self.max_per_host = max_per_host
+        self.host_limits = host_limits
+        self.max_clients = max_clients
+        self.async_transport = None
+
+    def __call__(self, args: argparse.Namespace):
+        self.WORDS_DIR.mkdir(exist_ok=True)
+
+        words: typing.List[str] = args.words
+        asyncio.run(self.process_words(words))
+
+    async def process_words(self, words):
+        # The semaphores of the hosts are bound to the running event loop.
+        self.async_transport = AsyncTransport(
+            self.transport, self.max_per_host, self.host_limits,
+            self.max_clients
+        )
+        try:
+            await asyncio.gather(*(self.process_word(word) for word in words))
+        finally:
+            self.async_transport.close()
 
+    async def process_word(self, orig_word):
+        logger.info('Processing the word: %s', orig_word)
+        word = self.normalize_word(orig_word)
         try:
-            response: HTTPResponse = self.http_client.fetch(
-                http_request,
-                # argument only affects the `HTTPError` raised
-                # when a non-200 response code is
-                # used, instead of suppressing all errors.
-                raise_error=False
+            with self.metrics.measure('html'):
+                html_file = self.done_html(word)
+                if html_file is None:
+                    html_file = await self.get_word_html_async(word)
+                    self.record_html(word, html_file)
+            if html_file is None:
+                logger.error('Could not get html: %s', word)
+                return
+
+            with self.metrics.measure('parse'):
+                json_file_path = self.word_json(word, html_file)
+            await self.make_flashcards_async(
+                orig_word=orig_word, word=word, json_file_path=json_file_path
             )
+        except CacheMiss:
+            raise
         except Exception as err:
-            logger.exception(f'Download audio error: {err}')
+            logger.exception(f'Processing word="{word}" error: {err}')
+
+    async def fetch(self, request: Request) -> Response:
+        return await self.async_transport.fetch(request)
+
+    async def fetch_url_async(self, url, do_fetch):
+        if self.cache is None:
+            code, _, body = await do_fetch({})
+            return code, body
+        return await self.cache.fetch_async(url, do_fetch)
+
+    async def fetch_get_async(self, url):
+        async def do_fetch(headers):
+            response = await self.fetch(Request('GET', url, headers))
+            return response.code, response.headers, response.body
+
+        return await self.fetch_url_async(url, do_fetch)
+
+    async def get_word_html_async(self, word):
+        code, body = await self.fetch_get_async(
+            self.DICTIONARY_URL.format(word=word)
+        )
+        if code != 200:
+            err_msg = f'[{code}] {body.decode(errors="replace")}'
+            logger.error('Getting word="%s" html ERROR="%s"', word, err_msg)
             return None
 
-        if response.code == 200:
+        return self.save_word_html(word, body.decode('utf-8'))
+
+    async def make_flashcards_async(self, orig_word, word, json_file_path):
+        with open(json_file_path) as fh:
+            data = json.load(fh)
+
+        work_dir = self.WORDS_DIR.joinpath(f'{word}_flashcards')
+        work_dir.mkdir(exist_ok=True)
+
+        examples = self.numbered_examples(data)
+        missing = self.missing_audio(word, work_dir, examples)
+        audio_files = await asyncio.gather(*(
+            self.download_audio_async(audio_url=flashcard['audio'])
+            for _, _, flashcard in missing
+        ))
+        downloaded = {
+            flashcard_num: audio_file
+            for (flashcard_num, _, _), audio_file in zip(missing, audio_files)
+        }
+        flashcards = self.collect_flashcards(word, examples, downloaded)
+
+        pending = self.pending_flashcards(orig_word, word, work_dir, flashcards)
+        translations = {}
+        if pending:
+            with self.metrics.measure('translate'):
+                translations = await self.translations.translate_many_async(
+                    self.flashcard_texts(orig_word, pending),
+                    self.translate_batch_async
+                )
+
+        with self.metrics.measure('write'):
+            self.save_flashcards(
+                orig_word, word, work_dir, flashcards, pending, translations
+            )
+
+    async def translate_batch_async(self, texts):
+        try:
+            response = await self.fetch(self.translate_request(texts))
+        except Exception as err:
+            logger.exception(f'YaTranslate error: {err}')
+            return None
+
+        return self.parse_translate_response(response)
+
+    async def download_audio_async(self, audio_url):
+        with self.metrics.measure('audio'):
             try:
-                return response.body
+                code, body = await self.fetch_get_async(f'{audio_url}')
+            except CacheMiss:
+                raise
             except Exception as err:
                 logger.exception(f'Download audio error: {err}')
-        logger.error(f'Download audio error: {response.body}')
+                return None
+
+            return self.parse_audio_response(code, body)
+
+
+def parse_host_limits(values, type=int):
+    """
+    >>> parse_host_limits(['translate.yandex.net=2'])
+    {'translate.yandex.net': 2}
+    >>> parse_host_limits(['www.ldoceonline.com=0.5'], type=float)
+    {'www.ldoceonline.com': 0.5}
+    """
+    host_limits = {}
+    for value in values:
+        host, limit = value.rsplit('=', 1)
+        host_limits[host.strip()] = type(limit)
+    return host_limits
+
+
+def get_vocabulary(args: argparse.Namespace):
+    translation_store = TranslationStore(args.translations_db)
+    translations = TranslationService(store=translation_store)
+    parser = PARSERS[args.parser]()
+    ledger = None
+    if not args.no_ledger:
+        ledger = JobLedger(args.ledger)
+        if args.force:
+            for word in args.words:
+                ledger.forget(GetVocabulary.normalize_word(word))
+    search_index = None
+    if not args.no_search_index:
+        search_index = SearchIndex(args.search_index)
+    cache = None
+    if not args.no_cache:
+        cache = HTTPCache(
+            GetVocabulary.CACHE_DIR,
+            ttl=args.cache_ttl,
+            max_size=args.cache_max_size * 1024 * 1024,
+            offline=args.offline
+        )
+
+    transport = Transport(
+        timeout=args.timeout,
+        retry=RetryPolicy(max_retries=args.retries),
+        default_rate=args.default_rate,
+        host_rates=parse_host_limits(args.rate_limit, type=float)
+    )
+    metrics = Instrumentation()
+    profiler = Profiler(args.profile, args.tracemalloc)
+
+    if args.async_mode:
+        vocabulary = AsyncGetVocabulary(
+            cache=cache,
+            translations=translations,
+            parser=parser,
+            ledger=ledger,
+            transport=transport,
+            metrics=metrics,
+            search_index=search_index,
+            max_per_host=args.max_per_host,
+            host_limits=parse_host_limits(args.host_limit)
+        )
+    else:
+        vocabulary = GetVocabulary(
+            cache=cache, translations=translations, parser=parser,
+            ledger=ledger, transport=transport, metrics=metrics,
+            search_index=search_index
+        )
+
+    try:
+        with profiler:
+            vocabulary(args)
+        if args.deck:
+            export(argparse.Namespace(
+                deck=args.deck, words=args.words,
+                words_dir=vocabulary.WORDS_DIR
+            ))
+    except CacheMiss as err:
+        logger.error('Offline mode, the url is not cached: %s', err)
+        raise SystemExit(1)
+    finally:
+        metrics.log_summary()
+        transport.stats.log_summary()
+        if args.metrics:
+            write_report(
+                metrics.report(
+                    transport=transport, cache=cache,
+                    translations=translations, ledger=ledger,
+                    profiler=profiler
+                ),
+                args.metrics,
+                args.metrics_format
+            )
+        transport.close()
+        if cache is not None:
+            logger.info(
+                'Http cache: hits=%s misses=%s revalidations=%s',
+                cache.hits, cache.misses, cache.revalidations
+            )
+            cache.close()
+        logger.info(
+            'Translations: hits=%s misses=%s',
+            translations.hits, translations.misses
+        )
+        translation_store.close()
+        if ledger is not None:
+            logger.info('Ledger: skipped stages=%s', ledger.skipped)
+            ledger.close()
+        if search_index is not None:
+            search_index.close()
+
+
+def export(args: argparse.Namespace):
+    """Packs the flashcards of the words, all of them by default, into a deck."""
+    done = set(flashcard_words(args.words_dir))
+    words = [GetVocabulary.normalize_word(word) for word in args.words]
+    missing = [word for word in words if word not in done]
+    if missing:
+        logger.error('No flashcards to export: %s', ', '.join(missing))
+    words = [word for word in words if word in done]
+    if args.words and not words:
+        return
+    stats = export_words(args.words_dir, args.deck, words)
+    logger.info(
+        'Deck %s: words=%s flashcards=%s audio blobs=%s audio bytes=%s',
+        args.deck, stats['words'], stats['flashcards'],
+        stats['audio_blobs'], stats['audio_bytes']
+    )
+
+
+def reparse_pages(args: argparse.Namespace):
+    ledger = None if args.no_ledger else JobLedger(args.ledger)
+    search_index = (
+        None if args.no_search_index else SearchIndex(args.search_index)
+    )
+    try:
+        report = reparse(
+            args.words_dir,
+            parser_name=args.parser,
+            ledger=ledger,
+            words=[GetVocabulary.normalize_word(word) for word in args.words],
+            jobs=args.jobs,
+            chunksize=args.chunksize,
+            force=args.force,
+            search_index=search_index
+        )
+    finally:
+        if ledger is not None:
+            ledger.close()
+        if search_index is not None:
+            search_index.close()
+    logger.info(
+        'Reparsed pages=%s skipped=%s failed=%s in %.2fs, %.1f pages/s',
+        report.parsed, report.skipped, report.failed, report.elapsed,
+        report.pages_per_second
+    )
+
+
+def search_import(args: argparse.Namespace):
+    """Indexes the json files of the words, all of them by default."""
+    search_index = SearchIndex(args.index)
+    try:
+        words = [GetVocabulary.normalize_word(word) for word in args.words]
+        start = time.perf_counter()
+        added, total = search_index.import_dir(args.words_dir, words)
+        logger.info(
+            'Indexed %s of %s words in %.2fs, %s',
+            added, total, time.perf_counter() - start, search_index.stats()
+        )
+    finally:
+        search_index.close()
 
 
-if __name__ == '__main__':
-    get_vocabulary = GetVocabulary()
+def search(args: argparse.Namespace):
+    search_index = SearchIndex(args.index)
+    try:
+        start = time.perf_counter()
+        hits = search_index.search(
+            ' '.join(args.phrase), args.limit, args.field, args.raw
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        search_index.close()
+    for hit in hits:
+        print('\t'.join([
+            hit.word, hit.sign_post or '', hit.definition or '',
+            hit.eng_text, hit.explanation
+        ]))
+    print(f'{len(hits)} examples in {elapsed * 1000:.1f} ms', file=sys.stderr)
+
+
+def status(args: argparse.Namespace):
+    ledger = JobLedger(args.ledger)
+    try:
+        words = [GetVocabulary.normalize_word(word) for word in args.words]
+        summary = ledger.summary(words)
+        print(format_summary(summary))
+        if args.failures:
+            for word in summary:
+                for record in ledger.failures(word):
+                    print(
+                        f'{word} {record.stage} {record.item or "-"}: '
+                        f'{record.error}'
+                    )
+    finally:
+        ledger.close()
 
+
+if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers(required=True, dest='')
 
     parser_get_vocabulary = subparsers.add_parser('get-vocabulary')
     parser_get_vocabulary.add_argument('words', nargs='+')
+    parser_get_vocabulary.add_argument(
+        '--async', dest='async_mode', action='store_true',
+        help='process the words concurrently'
+    )
+    parser_get_vocabulary.add_argument(
+        '--max-per-host', type=int, default=4,
+        help='concurrent requests per host in the async mode'
+    )
+    parser_get_vocabulary.add_argument(
+        '--host-limit', action='append', default=[], metavar='HOST=N',
+        help='overrides --max-per-host for the given host'
+    )
+    parser_get_vocabulary.add_argument(
+        '--default-rate', type=float, default=0.0,
+        help='requests per second to every host, 0 is not limited'
+    )
+    parser_get_vocabulary.add_argument(
+        '--rate-limit', action='append', default=[], metavar='HOST=RATE',
+        help='overrides --default-rate for the given host'
+    )
+    parser_get_vocabulary.add_argument(
+        '--retries', type=int, default=4,
+        help='retries of a request on 429, 5xx and connection errors'
+    )
+    parser_get_vocabulary.add_argument(
+        '--timeout', type=float, default=30,
+        help='seconds to connect and to wait for a response'
+    )
+    parser_get_vocabulary.add_argument(
+        '--offline', action='store_true',
+        help='serve pages and audio only from the http cache'
+    )
+    parser_get_vocabulary.add_argument(
+        '--no-cache', action='store_true',
+        help='always download pages and audio'
+    )
+    parser_get_vocabulary.add_argument(
+        '--cache-ttl', type=int, default=7 * 24 * 3600,
+        help='seconds before a cached response is revalidated'
+    )
+    parser_get_vocabulary.add_argument(
+        '--cache-max-size', type=int, default=512,
+        help='size of the http cache in MB'
+    )
+    parser_get_vocabulary.add_argument(
+        '--translations-db', default=GetVocabulary.TRANSLATIONS_DB,
+        help='sqlite file where the translations are kept between runs'
+    )
+    parser_get_vocabulary.add_argument(
+        '--parser', choices=sorted(PARSERS), default=LxmlParser.name,
+        help='html parser backend, bs4 is the reference one'
+    )
+    parser_get_vocabulary.add_argument(
+        '--ledger', default=GetVocabulary.LEDGER_DB,
+        help='sqlite file where the done stages of the words are kept'
+    )
+    parser_get_vocabulary.add_argument(
+        '--no-ledger', action='store_true',
+        help='redo every stage and do not record them'
+    )
+    parser_get_vocabulary.add_argument(
+        '--force', action='store_true',
+        help='forget the recorded stages of the words and redo them'
+    )
+    parser_get_vocabulary.add_argument(
+        '--search-index', default=GetVocabulary.SEARCH_DB,
+        help='sqlite file of the full text index of the examples'
+    )
+    parser_get_vocabulary.add_argument(
+        '--no-search-index', action='store_true',
+        help='do not index the parsed pages for search'
+    )
+    parser_get_vocabulary.add_argument(
+        '--deck', help='also pack the flashcards of the words into this deck'
+    )
+    parser_get_vocabulary.add_argument(
+        '--metrics',
+        help='write the stage times, http, cache and translation stats here'
+    )
+    parser_get_vocabulary.add_argument(
+        '--metrics-format', choices=['json', 'prometheus'],
+        help='json for a .json file and prometheus text otherwise by default'
+    )
+    parser_get_vocabulary.add_argument(
+        '--profile', help='dump the cProfile stats of the run to this file'
+    )
+    parser_get_vocabulary.add_argument(
+        '--tracemalloc', type=int, default=0, metavar='N',
+        help='add the N biggest allocation sites to the metrics'
+    )
     parser_get_vocabulary.set_defaults(func=get_vocabulary)
 
+    parser_export = subparsers.add_parser('export')
+    parser_export.add_argument('deck', help='sqlite index of the deck')
+    parser_export.add_argument(
+        'words', nargs='*', help='all the words with flashcards by default'
+    )
+    parser_export.add_argument('--words-dir', default=GetVocabulary.WORDS_DIR)
+    parser_export.set_defaults(func=export)
+
+    parser_reparse = subparsers.add_parser('reparse')
+    parser_reparse.add_argument(
+        'words', nargs='*', help='all the saved pages by default'
+    )
+    parser_reparse.add_argument('--words-dir', default=GetVocabulary.WORDS_DIR)
+    parser_reparse.add_argument(
+        '--parser', choices=sorted(PARSERS), default=LxmlParser.name
+    )
+    parser_reparse.add_argument(
+        '--jobs', type=int, default=os.cpu_count(),
+        help='parser processes'
+    )
+    parser_reparse.add_argument(
+        '--chunksize', type=int, default=32,
+        help='pages handed to a process at a time'
+    )
+    parser_reparse.add_argument('--ledger', default=GetVocabulary.LEDGER_DB)
+    parser_reparse.add_argument(
+        '--no-ledger', action='store_true',
+        help='reparse every page and do not record them'
+    )
+    parser_reparse.add_argument(
+        '--force', action='store_true', help='reparse the done pages too'
+    )
+    parser_reparse.add_argument(
+        '--search-index', default=GetVocabulary.SEARCH_DB
+    )
+    parser_reparse.add_argument(
+        '--no-search-index', action='store_true',
+        help='do not index the reparsed pages for search'
+    )
+    parser_reparse.set_defaults(func=reparse_pages)
+
+    parser_search = subparsers.add_parser('search')
+    parser_search.add_argument('phrase', nargs='+')
+    parser_search.add_argument('--index', default=GetVocabulary.SEARCH_DB)
+    parser_search.add_argument('--limit', type=int, default=20)
+    parser_search.add_argument(
+        '--field', choices=FIELDS, help='search only this field'
+    )
+    parser_search.add_argument(
+        '--raw', action='store_true', help='the phrase is an FTS5 query'
+    )
+    parser_search.set_defaults(func=search)
+
+    parser_search_import = subparsers.add_parser('search-import')
+    parser_search_import.add_argument(
+        'words', nargs='*', help='all the json files by default'
+    )
+    parser_search_import.add_argument(
+        '--words-dir', default=GetVocabulary.WORDS_DIR
+    )
+    parser_search_import.add_argument('--index', default=GetVocabulary.SEARCH_DB)
+    parser_search_import.set_defaults(func=search_import)
+
+    parser_status = subparsers.add_parser('status')
+    parser_status.add_argument(
+        'words', nargs='*', help='all the recorded words by default'
+    )
+    parser_status.add_argument('--ledger', default=GetVocabulary.LEDGER_DB)
+    parser_status.add_argument(
+        '--failures', action='store_true', help='list the failed stages'
+    )
+    parser_status.set_defaults(func=status)
+
     args = parser.parse_args()
     args.func(args)
@@ -0,0 +1,395 @@
+import re
+import json
+import bisect
+import os.path
+import pathlib
+import unittest
+import collections
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+
+EXAMPLE_EXPLANATION_RE = re.compile(r'\(\=.*\)')
+
+
+def split_example_text(text):
+    """
+    Moves the `(=...)` explanation out of the example text.
+    >>> split_example_text(' I get it (=understand).')
+    ('I get it  .', ' (=understand)')
+    """
+    text = text.strip().replace('’', "'")
+    explanation = ''
+    match = EXAMPLE_EXPLANATION_RE.search(text)
+    if match:
+        explanation = ' ' + match.group()
+        text = EXAMPLE_EXPLANATION_RE.sub(' ', text)
+    return text, explanation
+
+
+def collo_explanation(geo, registerlab):
+    if geo or registerlab:
+        return '[{}]  '.format(
+            ','.join(i.strip() for i in [geo, registerlab] if i.strip())
+        )
+    return ''
+
+
+class BeautifulSoupParser:
+    """
+    The reference parser. It searches every sense and example subtree
+    again, which is slow on long entries.
+    """
+    name = 'bs4'
+
+    def parse(self, html_doc):
+        soup = BeautifulSoup(html_doc, 'html.parser')
+        senses = soup.find_all("span", attrs={"class": "Sense"})
+
+        data = []
+        for sense in senses:
+            datum = {}
+            number = sense.attrs['id'].split('__')[1]
+            if number:
+                datum['number'] = number.strip()
+
+            sign_post = sense.find('span', attrs={'class': 'signpost'.upper()})
+            if sign_post and sign_post.parent == sense:
+                datum['sign_post'] = sign_post.text.strip()
+
+            definition = sense.find('span', attrs={'class': 'def'.upper()})
+            if definition and definition.parent == sense:
+                datum['definition'] = definition.text.strip()
+
+            datum['examples'] = []
+
+            examples = sense.find_all(
+                "span", attrs={"class": "example".upper()}
+            )
+            for example in examples:
+                if example.span and 'data-src-mp3' in example.span.attrs:
+                    explanation = ''
+                    parent_tag = example.parent
+
+                    parent_classes = (
+                        parent_tag.attrs.get('class') or [] if parent_tag else []
+                    )
+                    if parent_tag and 'GramExa' in parent_classes:
+                        prop_form = parent_tag.find(
+                            "span", attrs={"class": "propform".upper()}
+                        )
+                        if prop_form and prop_form.parent == parent_tag:
+                            explanation += prop_form.text
+
+                        gloss = parent_tag.find(
+                            "span", attrs={"class": "gloss".upper()}
+                        )
+                        if gloss and gloss.parent == parent_tag:
+                            explanation += gloss.text
+
+                    if parent_tag and 'ColloExa' in parent_classes:
+                        geo = parent_tag.find(
+                            "span", attrs={"class": 'geo'.upper()}
+                        )
+                        if geo and geo.parent == parent_tag:
+                            geo = geo.text
+                        else:
+                            geo = ''
+
+                        registerlab = parent_tag.find(
+                            "span", attrs={"class": 'registerlab'.upper()}
+                        )
+                        if registerlab and registerlab.parent == parent_tag:
+                            registerlab = registerlab.text
+                        else:
+                            registerlab = ''
+
+                        explanation += collo_explanation(geo, registerlab)
+
+                        for item_tag in ['collo', 'gloss']:
+                            item = parent_tag.find(
+                                "span", attrs={"class": item_tag.upper()}
+                            )
+                            if item and item.parent == parent_tag:
+                                explanation += item.text
+
+                    text, text_explanation = split_example_text(example.text)
+                    explanation += text_explanation
+
+                    datum['examples'].append({
+                        'explanation': explanation,
+                        'audio': example.span.attrs['data-src-mp3'],
+                        'eng_text': text
+                    })
+
+            if datum['examples']:
+                data.append(datum)
+        return data
+
+
+class SpanIndex:
+    """
+    Positions of the span elements in the document order, collected in one
+    walk over the tree. The spans under an element are the positions in
+    `bounds[element]`, so the first span of a class under an element is
+    found by bisection instead of a subtree search.
+    """
+
+    def __init__(self, root, classes):
+        self.spans = []
+        self.bounds = {}
+        self.classes = {}
+        self.positions = collections.defaultdict(list)
+
+        starts = {}
+        for event, element in etree.iterwalk(root, events=('start', 'end')):
+            if not isinstance(element.tag, str):
+                # Comments and processing instructions.
+                continue
+            if event == 'end':
+                self.bounds[element] = (starts.pop(element), len(self.spans))
+                continue
+
+            element_classes = (element.get('class') or '').split()
+            self.classes[element] = element_classes
+            if element.tag == 'span':
+                position = len(self.spans)
+                self.spans.append(element)
+                for cls in element_classes:
+                    if cls in classes:
+                        self.positions[cls].append(position)
+            # The element itself is not in its own range.
+            starts[element] = len(self.spans)
+
+    def find_all(self, element, cls):
+        start, end = self.bounds[element]
+        positions = self.positions[cls]
+        return [
+            self.spans[position] for position in positions[
+                bisect.bisect_left(positions, start):
+                bisect.bisect_left(positions, end)
+            ]
+        ]
+
+    def find(self, element, cls=None):
+        start, end = self.bounds[element]
+        if cls is None:
+            return self.spans[start] if start < end else None
+
+        positions = self.positions[cls]
+        i = bisect.bisect_left(positions, start)
+        if i < len(positions) and positions[i] < end:
+            return self.spans[positions[i]]
+        return None
+
+    def find_child(self, element, cls):
+        """The first span of the class, if it is a child of the element."""
+        found = self.find(element, cls)
+        if found is not None and found.getparent() is element:
+            return found
+        return None
+
+
+class LxmlParser:
+    """
+    Produces the same data as `BeautifulSoupParser`. The tree is walked
+    once to build a `SpanIndex`, all the lookups afterwards are bisections.
+    """
+    name = 'lxml'
+
+    CLASSES = {
+        'Sense', 'SIGNPOST', 'DEF', 'EXAMPLE', 'PROPFORM', 'GLOSS', 'GEO',
+        'REGISTERLAB', 'COLLO'
+    }
+    # The text like bs4 `.text`: without scripts, styles and comments.
+    TEXTS = etree.XPath(
+        './/text()[not(ancestor::script) and not(ancestor::style)]'
+    )
+
+    def text(self, element):
+        return ''.join(self.TEXTS(element))
+
+    def parse(self, html_doc):
+        root = etree.HTML(html_doc)
+        if root is None:
+            return []
+        index = SpanIndex(root, self.CLASSES)
+
+        data = []
+        for sense in index.positions['Sense']:
+            sense = index.spans[sense]
+            datum = {}
+            number = sense.get('id').split('__')[1]
+            if number:
+                datum['number'] = number.strip()
+
+            sign_post = index.find_child(sense, 'SIGNPOST')
+            if sign_post is not None:
+                datum['sign_post'] = self.text(sign_post).strip()
+
+            definition = index.find_child(sense, 'DEF')
+            if definition is not None:
+                datum['definition'] = self.text(definition).strip()
+
+            datum['examples'] = []
+
+            for example in index.find_all(sense, 'EXAMPLE'):
+                audio = index.find(example)
+                if audio is None or audio.get('data-src-mp3') is None:
+                    continue
+
+                explanation = ''
+                parent_tag = example.getparent()
+                parent_classes = index.classes[parent_tag]
+
+                if 'GramExa' in parent_classes:
+                    for cls in ['PROPFORM', 'GLOSS']:
+                        item = index.find_child(parent_tag, cls)
+                        if item is not None:
+                            explanation += self.text(item)
+
+                if 'ColloExa' in parent_classes:
+                    geo, registerlab = [
+                        self.text(item) if item is not None else ''
+                        for item in [
+                            index.find_child(parent_tag, 'GEO'),
+                            index.find_child(parent_tag, 'REGISTERLAB')
+                        ]
+                    ]
+                    explanation += collo_explanation(geo, registerlab)
+
+                    for cls in ['COLLO', 'GLOSS']:
+                        item = index.find_child(parent_tag, cls)
+                        if item is not None:
+                            explanation += self.text(item)
+
+                text, text_explanation = split_example_text(self.text(example))
+                explanation += text_explanation
+
+                datum['examples'].append({
+                    'explanation': explanation,
+                    'audio': audio.get('data-src-mp3'),
+                    'eng_text': text
+                })
+
+            if datum['examples']:
+                data.append(datum)
+        return data
+
+
+# Bump it when the extraction rules change, the saved json files of all
+# the pages are then out of date and reparsed.
+PARSER_VERSION = 2
+
+PARSERS = {
+    parser.name: parser for parser in [BeautifulSoupParser, LxmlParser]
+}
+
+
+class TestCase(unittest.TestCase):
+    """
+    Both parsers must produce the same json: the fixture below and the
+    expected `{word}.json` of every page in `test_pages`.
+    """
+    PAGES_DIR = pathlib.Path(os.path.join(
+        os.path.abspath(os.path.dirname(__file__)),
+        'test_pages'
+    ))
+
+    FIXTURE = '''
+        <html><body><div class="entry">
+        <span class="Sense" id="get__1">
+            <span class="sensenum">1</span>
+            <span class="SIGNPOST">OBTAIN</span>
+            <span class="DEF">to receive &amp; keep something</span>
+            <span class="GramExa">
+                <span class="PROPFORM">get something from somebody</span>
+                <span class="GLOSS"> (=buy)</span>
+                <span class="EXAMPLE">
+                    <span class="speaker" data-src-mp3="https://a/1.mp3"></span>
+                    I’ll get it from him (=ask him for it).
+                </span>
+            </span>
+            <span class="ColloExa">
+                <span class="COLLO">get a job</span>
+                <span class="GEO">British English</span>
+                <span class="REGISTERLAB">informal</span>
+                <span class="EXAMPLE">
+                    <span class="speaker" data-src-mp3="https://a/2.mp3"></span>
+                    She got a job <b>at last</b>.
+                </span>
+            </span>
+            <span class="EXAMPLE">No audio.</span>
+            <span class="Subsense" id="get__1a">
+                <span class="DEF">nested definition</span>
+                <span class="EXAMPLE">
+                    <span data-src-mp3="https://a/3.mp3"></span>Nested.
+                </span>
+            </span>
+        </span>
+        <span class="Sense" id="get__">
+            <span class="Crossref"><span class="SIGNPOST">NOT A CHILD</span></span>
+            <span class="SIGNPOST">SKIPPED</span>
+            <span class="EXAMPLE"><span data-src-mp3="https://a/4.mp3"></span>Unnumbered.</span>
+        </span>
+        <span class="Sense" id="get__3"><span class="DEF">no examples</span></span>
+        </div></body></html>
+    '''
+
+    def assert_same_json(self, html_doc, expected=None):
+        data = BeautifulSoupParser().parse(html_doc)
+        self.assertEqual(LxmlParser().parse(html_doc), data)
+        if expected is not None:
+            self.assertEqual(data, expected)
+        return data
+
+    def test_fixture(self):
+        data = LxmlParser().parse(self.FIXTURE)
+        self.assertEqual([datum.get('number') for datum in data], ['1', None])
+        self.assertEqual(data[0]['sign_post'], 'OBTAIN')
+        self.assertNotIn('sign_post', data[1])
+        self.assertEqual(len(data[0]['examples']), 3)
+        self.assertEqual(data[0]['examples'][0], {
+            'explanation': 'get something from somebody (=buy) (=ask him for it)',
+            'audio': 'https://a/1.mp3',
+            'eng_text': "I'll get it from him  ."
+        })
+        self.assertEqual(
+            data[0]['examples'][1]['explanation'],
+            '[British English,informal]  get a job'
+        )
+        self.assert_same_json(self.FIXTURE)
+
+    def test_saved_pages(self):
+        html_files = sorted(self.PAGES_DIR.glob('*.html'))
+        self.assertTrue(html_files)
+        for html_file in html_files:
+            with self.subTest(html_file.name):
+                with open(html_file.with_suffix('.json')) as fh:
+                    expected = json.load(fh)
+                with open(html_file) as fh:
+                    self.assert_same_json(fh.read(), expected)
+
+    def test_scripts_and_unclassed_parents(self):
+        data = self.assert_same_json('''
+            <span class="Sense" id="go__1">
+                <span class="DEF">to leave<script>ad("def");</script></span>
+                <div><span class="EXAMPLE">
+                    <span data-src-mp3="https://a/1.mp3"></span>
+                    Go<style>.a {}</style> away<!-- note -->.
+                </span></div>
+            </span>
+        ''')
+        self.assertEqual(data, [{
+            'number': '1',
+            'definition': 'to leave',
+            'examples': [{
+                'explanation': '', 'audio': 'https://a/1.mp3',
+                'eng_text': 'Go away.'
+            }]
+        }])
+
+
+if __name__ == '__main__':
+    unittest.main()
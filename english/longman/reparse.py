@@ -0,0 +1,249 @@
+"""
+Reparses the saved html pages of words_data into their json files in a
+process pool, without fetching anything.
+
+    python main.py reparse --jobs 4
+    python main.py reparse get take-it --parser bs4
+
+A page is skipped when the ledger has its json done from the same html,
+parser and `PARSER_VERSION`, the json file is replaced atomically.
+"""
+import os
+import json
+import time
+import pathlib
+import tempfile
+import unittest
+import unittest.mock
+import concurrent.futures
+
+from typing import List, NamedTuple, Optional
+
+from parsers import PARSERS, PARSER_VERSION
+from ledger import JobLedger, input_digest, sha256_file
+
+
+def parse_digest(html_digest, parser_name):
+    """The inputs of the json file of a page."""
+    return input_digest(html_digest, parser_name, PARSER_VERSION)
+
+
+def write_json_atomic(path, data):
+    """Readers see either the old file or the whole new one."""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix='.', suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(data, fh, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ReparseTask(NamedTuple):
+    word: str
+    html_path: str
+    json_path: str
+    digest: str
+
+
+class ReparseResult(NamedTuple):
+    task: ReparseTask
+    error: Optional[str]
+
+
+class ReparseReport(NamedTuple):
+    parsed: int
+    skipped: int
+    failed: int
+    elapsed: float
+
+    @property
+    def pages_per_second(self):
+        return self.parsed / self.elapsed if self.elapsed else 0.0
+
+
+# The parser of a worker process.
+worker_parser = None
+
+
+def init_worker(parser_name):
+    global worker_parser
+    worker_parser = PARSERS[parser_name]()
+
+
+def parse_page(task: ReparseTask) -> ReparseResult:
+    try:
+        with open(task.html_path) as fh:
+            html_doc = fh.read()
+        write_json_atomic(task.json_path, worker_parser.parse(html_doc))
+    except Exception as err:
+        return ReparseResult(task, f'{type(err).__name__}: {err}')
+    return ReparseResult(task, None)
+
+
+def html_pages(words_dir, words=None):
+    """(word, html path) of the saved pages, of all of them by default."""
+    words_dir = pathlib.Path(words_dir)
+    if words:
+        paths = [words_dir.joinpath(f'{word}.html') for word in words]
+        return [(path.stem, str(path)) for path in paths if path.exists()]
+    return [(path.stem, str(path)) for path in sorted(words_dir.glob('*.html'))]
+
+
+def plan(words_dir, parser_name, ledger: Optional[JobLedger] = None,
+         words=None, force=False):
+    """Returns the tasks of the pages to parse and the number of skipped ones."""
+    tasks: List[ReparseTask] = []
+    skipped = 0
+    for word, html_path in html_pages(words_dir, words):
+        json_path = os.path.join(words_dir, f'{word}.json')
+        digest = parse_digest(sha256_file(html_path), parser_name)
+        if not force and ledger is not None and ledger.is_done(
+                word, 'json', digest, json_path
+        ):
+            skipped += 1
+            continue
+        tasks.append(ReparseTask(word, html_path, json_path, digest))
+    return tasks, skipped
+
+
+def reparse(words_dir, parser_name='lxml', ledger: Optional[JobLedger] = None,
+            words=None, jobs=1, chunksize=32, force=False,
+            search_index=None) -> ReparseReport:
+    """
+    Parses the pages that are not done, in jobs processes that take
+    chunksize pages at a time, records them in the ledger and indexes
+    the new json files in the `SearchIndex`.
+    """
+    start = time.perf_counter()
+    tasks, skipped = plan(words_dir, parser_name, ledger, words, force)
+
+    executor = None
+    if jobs > 1 and len(tasks) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_worker, initargs=(parser_name,)
+        )
+        results = executor.map(parse_page, tasks, chunksize=chunksize)
+    else:
+        init_worker(parser_name)
+        results = map(parse_page, tasks)
+
+    failed = 0
+    try:
+        for result in results:
+            task = result.task
+            failed += result.error is not None
+            if search_index is not None and result.error is None:
+                search_index.add_json(task.word, task.json_path, commit=False)
+            if ledger is None:
+                continue
+            if result.error is None:
+                ledger.mark_done(task.word, 'json', task.digest, task.json_path)
+            else:
+                ledger.mark_failed(task.word, 'json', task.digest, result.error)
+    finally:
+        if search_index is not None:
+            search_index.commit()
+        if executor is not None:
+            executor.shutdown()
+
+    return ReparseReport(
+        parsed=len(tasks) - failed,
+        skipped=skipped,
+        failed=failed,
+        elapsed=time.perf_counter() - start
+    )
+
+
+class TestCase(unittest.TestCase):
+
+    PAGE = '''
+        <span class="Sense" id="{word}__1">
+            <span class="DEF">{definition}</span>
+            <span class="EXAMPLE">
+                <span data-src-mp3="http://audio/{word}.mp3"></span>Example.
+            </span>
+        </span>
+    '''
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.words_dir = pathlib.Path(tmp_dir.name)
+        self.ledger = JobLedger(self.words_dir.joinpath('ledger.sqlite'))
+        self.addCleanup(self.ledger.close)
+        for word in ['be', 'go', 'do']:
+            self.write_page(word, f'to {word}')
+
+    def write_page(self, word, definition):
+        self.words_dir.joinpath(f'{word}.html').write_text(
+            self.PAGE.format(word=word, definition=definition)
+        )
+
+    def definition(self, word):
+        data = json.loads(self.words_dir.joinpath(f'{word}.json').read_text())
+        return data[0]['definition']
+
+    def test_reparse_only_changed_pages(self):
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                report = reparse(
+                    self.words_dir, ledger=self.ledger, jobs=jobs, chunksize=2,
+                    force=True
+                )
+                self.assertEqual(report[:3], (3, 0, 0))
+                self.assertEqual(self.definition('go'), 'to go')
+
+        report = reparse(self.words_dir, ledger=self.ledger, jobs=2)
+        self.assertEqual(report[:3], (0, 3, 0))
+
+        self.write_page('go', 'to leave')
+        report = reparse(self.words_dir, ledger=self.ledger, jobs=2)
+        self.assertEqual(report[:3], (1, 2, 0))
+        self.assertEqual(self.definition('go'), 'to leave')
+
+        # Another parser makes other json files.
+        report = reparse(self.words_dir, 'bs4', ledger=self.ledger, words=['be'])
+        self.assertEqual(report[:3], (1, 0, 0))
+
+    def test_parser_version_changes_the_digest(self):
+        digest = parse_digest('html digest', 'lxml')
+        with unittest.mock.patch(
+                f'{__name__}.PARSER_VERSION', PARSER_VERSION + 1
+        ):
+            self.assertNotEqual(parse_digest('html digest', 'lxml'), digest)
+
+    def test_search_index(self):
+        from search_index import SearchIndex
+
+        index = SearchIndex(self.words_dir.joinpath('search.sqlite'))
+        self.addCleanup(index.close)
+        reparse(self.words_dir, search_index=index)
+        self.assertEqual(index.stats(), {'words': 3, 'examples': 3})
+        self.write_page('go', 'to leave')
+        reparse(self.words_dir, ledger=self.ledger, search_index=index)
+        self.assertEqual(
+            [hit.word for hit in index.search('leave', field='definition')],
+            ['go']
+        )
+
+    def test_failed_page(self):
+        self.words_dir.joinpath('bad.html').write_text(
+            '<span class="Sense"><span class="DEF">x</span></span>'
+        )
+        report = reparse(self.words_dir, ledger=self.ledger)
+        self.assertEqual(report[:3], (3, 0, 1))
+        self.assertFalse(self.words_dir.joinpath('bad.json').exists())
+        self.assertEqual(
+            [record.stage for record in self.ledger.failures('bad')], ['json']
+        )
+        self.assertEqual(
+            [path.name for path in self.words_dir.glob('.*.tmp')], []
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,341 @@
+"""
+A full text index of the parsed pages: one row per example with the
+sign post and definition of its sense, in sqlite FTS5.
+
+    python main.py search "make a decision"
+    python main.py search decision --field definition --limit 50
+    python main.py search-import
+
+The index is filled as get-vocabulary and reparse write the json files,
+search-import adds the json files written before.
+"""
+import json
+import time
+import logging
+import sqlite3
+import hashlib
+import pathlib
+import unittest
+import tempfile
+
+from typing import List, NamedTuple, Optional
+
+
+FIELDS = ('sign_post', 'definition', 'explanation', 'eng_text')
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHit(NamedTuple):
+    word: str
+    number: Optional[str]
+    sign_post: Optional[str]
+    definition: Optional[str]
+    explanation: str
+    eng_text: str
+    audio: Optional[str]
+
+
+def match_query(text, field=None):
+    """
+    The words of the text one after another, in one of FIELDS or in any
+    of them. Every word is a string, so FTS5 operators and punctuation in
+    the text are searched as words.
+    >>> match_query('give  up', 'eng_text')
+    'eng_text : "give" + "up"'
+    >>> match_query('near(a b)')
+    '"near(a" + "b)"'
+    """
+    query = ' + '.join(
+        '"{}"'.format(word.replace('"', '""')) for word in text.split()
+    ) or '""'
+    return query if field is None else f'{field} : {query}'
+
+
+def data_rows(data):
+    """(number, sign_post, definition, explanation, eng_text, audio) rows."""
+    return [
+        (
+            datum.get('number'),
+            datum.get('sign_post'),
+            datum.get('definition'),
+            example.get('explanation', '').strip(),
+            example['eng_text'],
+            example.get('audio'),
+        )
+        for datum in data
+        for example in datum['examples']
+    ]
+
+
+class SearchIndex:
+    """
+    words keeps the sha256 of the json each word is indexed from,
+    examples the rows and example_text the FTS5 index over them.
+    """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(str(db_path))
+        with self.db:
+            self.db.executescript('''
+                CREATE TABLE IF NOT EXISTS words (
+                    word TEXT PRIMARY KEY,
+                    json_sha256 TEXT NOT NULL,
+                    indexed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS examples (
+                    id INTEGER PRIMARY KEY,
+                    word TEXT NOT NULL,
+                    number TEXT,
+                    sign_post TEXT,
+                    definition TEXT,
+                    explanation TEXT NOT NULL,
+                    eng_text TEXT NOT NULL,
+                    audio TEXT
+                );
+                CREATE INDEX IF NOT EXISTS examples_word ON examples (word);
+                CREATE VIRTUAL TABLE IF NOT EXISTS example_text USING fts5 (
+                    sign_post, definition, explanation, eng_text,
+                    content='examples', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+            ''')
+
+    def close(self):
+        self.db.close()
+
+    def _remove_word(self, word):
+        # FTS5 does not store the examples, it drops the tokens of the
+        # old text it is given.
+        self.db.execute(
+            "INSERT INTO example_text (example_text, rowid, sign_post, "
+            "definition, explanation, eng_text) "
+            "SELECT 'delete', id, sign_post, definition, explanation, eng_text "
+            "FROM examples WHERE word = ?",
+            (word,)
+        )
+        self.db.execute('DELETE FROM examples WHERE word = ?', (word,))
+        self.db.execute('DELETE FROM words WHERE word = ?', (word,))
+
+    def _add_word(self, word, data, digest):
+        self._remove_word(word)
+        self.db.execute(
+            'INSERT INTO words (word, json_sha256, indexed_at) VALUES (?, ?, ?)',
+            (word, digest, time.time())
+        )
+        rows = data_rows(data)
+        if not rows:
+            return
+        first_id = self.db.execute(
+            'SELECT COALESCE(MAX(id), 0) + 1 FROM examples'
+        ).fetchone()[0]
+        self.db.executemany(
+            'INSERT INTO examples (id, word, number, sign_post, definition, '
+            'explanation, eng_text, audio) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(first_id + i, word, *row) for i, row in enumerate(rows)]
+        )
+        self.db.execute(
+            'INSERT INTO example_text (rowid, sign_post, definition, '
+            'explanation, eng_text) '
+            'SELECT id, sign_post, definition, explanation, eng_text '
+            'FROM examples WHERE id >= ?',
+            (first_id,)
+        )
+
+    def indexed_digest(self, word):
+        row = self.db.execute(
+            'SELECT json_sha256 FROM words WHERE word = ?', (word,)
+        ).fetchone()
+        return row and row[0]
+
+    def add_json(self, word, json_path, commit=True):
+        """
+        Indexes the json file of the word unless it is indexed already,
+        returns whether it was.
+        """
+        content = pathlib.Path(json_path).read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        if self.indexed_digest(word) == digest:
+            return False
+        self._add_word(word, json.loads(content), digest)
+        if commit:
+            self.commit()
+        return True
+
+    def commit(self):
+        self.db.commit()
+
+    def import_dir(self, words_dir, words=None, batch=1000):
+        """
+        Indexes the {word}.json files of the directory, all of them by
+        default, committing every batch words. Returns (added, total), the
+        given words without a json file are in total but not added.
+        """
+        words_dir = pathlib.Path(words_dir)
+        if words:
+            paths = [words_dir.joinpath(f'{word}.json') for word in words]
+            missing = [path.stem for path in paths if not path.exists()]
+            if missing:
+                logger.warning('No json file to index: %s', ', '.join(missing))
+            total = len(paths)
+            paths = [path for path in paths if path.exists()]
+        else:
+            paths = sorted(words_dir.glob('*.json'))
+            total = len(paths)
+        added = 0
+        try:
+            for i, path in enumerate(paths, 1):
+                added += self.add_json(path.stem, path, commit=False)
+                if i % batch == 0:
+                    self.commit()
+        finally:
+            self.commit()
+        return added, total
+
+    def search(self, query, limit=20, field=None, raw=False) -> List[SearchHit]:
+        """
+        The best matching examples of the phrase, in one of FIELDS or in
+        all of them, or of an FTS5 query with raw.
+        """
+        if field is not None and field not in FIELDS:
+            raise ValueError(f'Unknown field {field}, expected one of {FIELDS}')
+        return [SearchHit(*row) for row in self.db.execute(
+            'SELECT examples.word, examples.number, examples.sign_post, '
+            'examples.definition, examples.explanation, examples.eng_text, '
+            'examples.audio '
+            'FROM example_text JOIN examples ON examples.id = example_text.rowid '
+            'WHERE example_text MATCH ? '
+            'ORDER BY example_text.rank LIMIT ?',
+            (query if raw else match_query(query, field), limit)
+        )]
+
+    def stats(self):
+        words, = self.db.execute('SELECT COUNT(*) FROM words').fetchone()
+        examples, = self.db.execute('SELECT COUNT(*) FROM examples').fetchone()
+        return {'words': words, 'examples': examples}
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.words_dir = pathlib.Path(tmp_dir.name)
+        self.index = SearchIndex(self.words_dir.joinpath('search.sqlite'))
+        self.addCleanup(self.index.close)
+        self.write_json('decide', [
+            {
+                'number': '1',
+                'sign_post': 'CHOOSE',
+                'definition': 'to make a choice',
+                'examples': [
+                    {'explanation': '', 'audio': 'a1.mp3',
+                     'eng_text': 'We need to make a decision soon.'},
+                    {'explanation': ' (=choose)', 'audio': 'a2.mp3',
+                     'eng_text': 'I decided on the blue one.'},
+                ]
+            },
+        ])
+        self.write_json('make', [
+            {
+                'definition': 'to produce something',
+                'examples': [
+                    {'explanation': 'make a decision', 'audio': 'b1.mp3',
+                     'eng_text': 'She made a cake.'},
+                ]
+            },
+        ])
+
+    def write_json(self, word, data):
+        self.words_dir.joinpath(f'{word}.json').write_text(json.dumps(data))
+
+    def test_search(self):
+        self.assertEqual(self.index.import_dir(self.words_dir), (2, 2))
+        self.assertEqual(self.index.stats(), {'words': 2, 'examples': 3})
+
+        hits = self.index.search('make a decision')
+        self.assertEqual(
+            sorted((hit.word, hit.eng_text) for hit in hits),
+            [('decide', 'We need to make a decision soon.'),
+             ('make', 'She made a cake.')]
+        )
+        hits = self.index.search('make a decision', field='eng_text')
+        self.assertEqual([hit.word for hit in hits], ['decide'])
+        self.assertEqual(hits[0].sign_post, 'CHOOSE')
+        self.assertEqual(hits[0].audio, 'a1.mp3')
+
+        self.assertEqual(
+            [hit.audio for hit in self.index.search('choose', field='explanation')],
+            ['a2.mp3']
+        )
+        self.assertEqual(
+            len(self.index.search('sign_post : choose AND blue', raw=True)), 1
+        )
+        # Operators and punctuation are words.
+        self.assertEqual(
+            [hit.audio for hit in self.index.search('decision soon.')], ['a1.mp3']
+        )
+        self.assertEqual(self.index.search('decision NOT'), [])
+        with self.assertRaises(ValueError):
+            self.index.search('x', field='audio')
+
+    def test_reimport_only_changed_words(self):
+        self.index.import_dir(self.words_dir)
+        self.assertEqual(self.index.import_dir(self.words_dir), (0, 2))
+
+        self.write_json('make', [{'examples': [
+            {'explanation': '', 'audio': None, 'eng_text': 'Make up your mind.'}
+        ]}])
+        self.assertEqual(self.index.import_dir(self.words_dir, ['make']), (1, 1))
+        with self.assertLogs(logger, 'WARNING') as logs:
+            self.assertEqual(
+                self.index.import_dir(self.words_dir, ['never', 'make']),
+                (0, 2)
+            )
+        self.assertIn('never', logs.output[0])
+        self.assertEqual(self.index.search('cake'), [])
+        self.assertEqual(
+            [hit.word for hit in self.index.search('up your mind')], ['make']
+        )
+        self.assertEqual(self.index.stats(), {'words': 2, 'examples': 3})
+
+    def test_filled_by_get_vocabulary(self):
+        import argparse
+        import http.server
+        import threading
+
+        import main
+        from http_cache import StandInHandler
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        server.requests = []
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        server.pages = {
+            '/dictionary/test': f'''
+                <span class="Sense" id="test__1">
+                    <span class="DEF">a way of checking</span>
+                    <span class="EXAMPLE">
+                        <span data-src-mp3="{base_url}/1.mp3"></span>Pass the test.
+                    </span>
+                </span>
+            '''.encode(),
+            '/1.mp3': b'mp3',
+        }
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        class GetVocabulary(main.GetVocabulary):
+            WORDS_DIR = self.words_dir.joinpath('words_data')
+            DICTIONARY_URL = f'{base_url}/dictionary/{{word}}'
+
+            def translate_batch(self, texts):
+                return texts
+
+        GetVocabulary(search_index=self.index)(argparse.Namespace(words=['test']))
+        hits = self.index.search('checking', field='definition')
+        self.assertEqual([hit.eng_text for hit in hits], ['Pass the test.'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import sqlite3
+import asyncio
+import unittest
+import tempfile
+import os.path
+
+from typing import Dict, List, Optional
+
+
+class TranslationStore:
+    """Persistent key-value store of translations, keyed by (lang, text)."""
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(str(db_path))
+        with self.db:
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS translations (
+                    lang TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    PRIMARY KEY (lang, text)
+                )
+            ''')
+
+    def close(self):
+        self.db.close()
+
+    def get_many(self, lang, texts) -> Dict[str, str]:
+        found = {}
+        # Keeps the number of the sql variables under the sqlite limit.
+        for start in range(0, len(texts), 500):
+            chunk = texts[start:start + 500]
+            rows = self.db.execute(
+                'SELECT text, translation FROM translations '
+                'WHERE lang = ? AND text IN ({})'.format(
+                    ','.join('?' * len(chunk))
+                ),
+                [lang, *chunk]
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, lang, translations: Dict[str, str]):
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO translations (lang, text, translation) '
+                'VALUES (?, ?, ?)',
+                [(lang, text, tr) for text, tr in translations.items()]
+            )
+
+
+class TranslationService:
+    """
+    Translates texts at most once: within a run the results are memoized,
+    across runs they are kept in the store. The texts that are not known
+    yet are packed into batches, one request per batch.
+
+    translate_batch(texts) returns the list of translations in the same
+    order, or None when the request failed. In the async mode a text that
+    is being translated for another word is awaited, not sent again.
+    """
+
+    def __init__(
+            self, store: Optional[TranslationStore] = None, lang='en-ru',
+            batch_size=100, max_chars=9000
+    ):
+        self.store = store
+        self.lang = lang
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.memo: Dict[str, Optional[str]] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def translate_many(self, texts, translate_batch):
+        missing = self.lookup(texts)
+        for batch in self.batches(missing):
+            self.save(batch, translate_batch(batch))
+        return {text: self.memo[text] for text in texts}
+
+    async def translate_many_async(self, texts, translate_batch):
+        in_flight = {
+            self.pending[text] for text in texts if text in self.pending
+        }
+        missing = self.lookup(texts)
+        done = asyncio.get_running_loop().create_future()
+        self.pending.update(dict.fromkeys(missing, done))
+        try:
+            batches = self.batches(missing)
+            results = await asyncio.gather(
+                *(translate_batch(batch) for batch in batches)
+            )
+            for batch, translations in zip(batches, results):
+                self.save(batch, translations)
+        finally:
+            for text in missing:
+                del self.pending[text]
+            done.set_result(None)
+        await asyncio.gather(*in_flight)
+        # The texts of a request that raised for another word are unknown.
+        return {text: self.memo.get(text) for text in texts}
+
+    def lookup(self, texts) -> List[str]:
+        """
+        Returns the distinct texts which are neither memoized nor stored
+        nor being translated.
+        """
+        unknown = [
+            text for text in dict.fromkeys(texts)
+            if text not in self.memo and text not in self.pending
+        ]
+        self.hits += len(texts) - len(unknown)
+
+        if self.store is not None and unknown:
+            stored = self.store.get_many(self.lang, unknown)
+            self.memo.update(stored)
+            self.hits += len(stored)
+            unknown = [text for text in unknown if text not in stored]
+
+        self.misses += len(unknown)
+        return unknown
+
+    def batches(self, texts) -> List[List[str]]:
+        batches = []
+        batch, batch_chars = [], 0
+        for text in texts:
+            if batch and (
+                    len(batch) == self.batch_size or
+                    batch_chars + len(text) > self.max_chars
+            ):
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append(text)
+            batch_chars += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def save(self, texts, translations):
+        if translations is None or len(translations) != len(texts):
+            # Failed texts are not retried within the run.
+            self.memo.update(dict.fromkeys(texts))
+            return
+
+        translated = dict(zip(texts, translations))
+        self.memo.update(translated)
+        if self.store is not None:
+            self.store.put_many(self.lang, translated)
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.requests = []
+
+    def translate_batch(self, texts):
+        self.requests.append(texts)
+        return [text.upper() for text in texts]
+
+    def make_service(self, **kwargs):
+        store = TranslationStore(os.path.join(self.tmp_dir.name, 'db.sqlite'))
+        self.addCleanup(store.close)
+        return TranslationService(store=store, **kwargs)
+
+    def test_deduplication_and_batching(self):
+        service = self.make_service(batch_size=2)
+        translations = service.translate_many(
+            ['a', 'b', 'a', 'c', 'b'], self.translate_batch
+        )
+        self.assertEqual(translations, {'a': 'A', 'b': 'B', 'c': 'C'})
+        self.assertEqual(self.requests, [['a', 'b'], ['c']])
+        self.assertEqual((service.hits, service.misses), (2, 3))
+
+    def test_max_chars(self):
+        service = self.make_service(max_chars=3)
+        service.translate_many(['aa', 'bb', 'c'], self.translate_batch)
+        self.assertEqual(self.requests, [['aa'], ['bb', 'c']])
+
+    def test_persistence(self):
+        self.make_service().translate_many(['a', 'b'], self.translate_batch)
+        service = self.make_service()
+        translations = service.translate_many(['b', 'c'], self.translate_batch)
+        self.assertEqual(translations, {'b': 'B', 'c': 'C'})
+        self.assertEqual(self.requests, [['a', 'b'], ['c']])
+        self.assertEqual((service.hits, service.misses), (1, 1))
+
+    def test_failed_batch(self):
+        service = self.make_service()
+        translations = service.translate_many(['a'], lambda texts: None)
+        self.assertEqual(translations, {'a': None})
+        service = self.make_service()
+        service.translate_many(['a'], self.translate_batch)
+        self.assertEqual(self.requests, [['a']])
+
+    def test_async(self):
+        async def translate_batch(texts):
+            return self.translate_batch(texts)
+
+        service = self.make_service(batch_size=1)
+        translations = asyncio.run(
+            service.translate_many_async(['a', 'b', 'a'], translate_batch)
+        )
+        self.assertEqual(translations, {'a': 'A', 'b': 'B'})
+        self.assertEqual(self.requests, [['a'], ['b']])
+
+    def test_async_in_flight(self):
+        async def translate_batch(texts):
+            await asyncio.sleep(0.01)
+            return self.translate_batch(texts)
+
+        async def translate_words(service):
+            return await asyncio.gather(
+                service.translate_many_async(['a', 'shared'], translate_batch),
+                service.translate_many_async(['shared', 'b'], translate_batch),
+            )
+
+        service = self.make_service()
+        first, second = asyncio.run(translate_words(service))
+        self.assertEqual(first, {'a': 'A', 'shared': 'SHARED'})
+        self.assertEqual(second, {'shared': 'SHARED', 'b': 'B'})
+        self.assertEqual(self.requests, [['a', 'shared'], ['b']])
+        self.assertEqual((service.hits, service.misses), (1, 3))
+        self.assertEqual(service.pending, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,477 @@
+"""
+The http transport of all the longman requests: one `requests.Session`
+keeps the connections to every host alive, a token bucket per host limits
+the request rate, 429 and 5xx responses are retried with jittered
+exponential backoff and the latency of every request is recorded.
+
+The async mode runs the same transport in a thread pool, so both modes
+share the connection pool, the rate limits and the metrics.
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+import unittest
+import itertools
+import statistics
+import http.server
+import urllib.parse
+import collections
+import concurrent.futures
+
+from typing import Dict, NamedTuple, Optional
+
+import requests
+import requests.adapters
+
+from tornado.locks import Semaphore
+
+
+logger = logging.getLogger(__name__)
+
+
+class Request(NamedTuple):
+    method: str
+    url: str
+    headers: Optional[Dict[str, str]] = None
+    body: Optional[bytes] = None
+
+
+class Response(NamedTuple):
+    code: int
+    headers: requests.structures.CaseInsensitiveDict
+    body: bytes
+
+
+def host_of(url):
+    return urllib.parse.urlsplit(url).hostname
+
+
+class TokenBucket:
+    """
+    `rate` requests per second on average with bursts of up to `burst`.
+    A request reserves a token even when the bucket is empty, so waiting
+    callers are served in order.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns the seconds to wait before using it."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RetryPolicy:
+    """
+    Full jitter backoff: the n-th retry waits a random time up to
+    base_delay * 2 ** n, at most max_delay, or the Retry-After seconds of
+    the response when it has them.
+    """
+    RETRY_CODES = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, max_retries=4, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, attempt, code=None):
+        """code is None when the request raised a connection error."""
+        return attempt < self.max_retries and (
+            code is None or code in self.RETRY_CODES
+        )
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(self.max_delay, max(0.0, float(retry_after)))
+            except ValueError:
+                # An http date, the backoff is used instead.
+                pass
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt)
+        )
+
+
+class LatencyStats:
+    """
+    Latencies, response codes, body bytes and retries of the requests per
+    host. The worker threads of `AsyncTransport` update it concurrently,
+    every counter is changed under the lock.
+    """
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.codes = collections.defaultdict(collections.Counter)
+        self.bytes = collections.Counter()
+        self.retries = collections.Counter()
+        self.errors = collections.Counter()
+        self.throttled = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, host, seconds, code, size=0):
+        with self.lock:
+            self.latencies[host].append(seconds)
+            self.codes[host][code] += 1
+            self.bytes[host] += size
+
+    def record_error(self, host):
+        with self.lock:
+            self.errors[host] += 1
+
+    def record_retry(self, host):
+        with self.lock:
+            self.retries[host] += 1
+
+    def record_throttled(self, host, seconds):
+        with self.lock:
+            self.throttled[host] += seconds
+
+    def summary(self):
+        with self.lock:
+            return self._summary()
+
+    def _summary(self):
+        """
+        Every host with a request, an error, a retry or a wait. A host
+        without a response, e.g. whose connections all failed, has no
+        latencies.
+        """
+        hosts = dict.fromkeys(itertools.chain(
+            self.latencies, self.codes, self.errors, self.retries,
+            self.throttled
+        ))
+        summary = {}
+        for host in hosts:
+            ordered = sorted(self.latencies.get(host, ()))
+            stats = summary[host] = {
+                'requests': len(ordered),
+                'retries': self.retries[host],
+                'errors': self.errors[host],
+                'bytes': self.bytes[host],
+                'throttled_seconds': self.throttled[host],
+                'codes': dict(self.codes.get(host, {})),
+            }
+            if ordered:
+                stats.update({
+                    'total_seconds': sum(ordered),
+                    'p50': statistics.median(ordered),
+                    'p95': ordered[
+                        min(len(ordered) - 1, int(len(ordered) * 0.95))
+                    ],
+                    'max': ordered[-1],
+                })
+        return summary
+
+    def log_summary(self):
+        for host, stats in self.summary().items():
+            latency = ''
+            if stats['requests']:
+                latency = ' p50={:.3f}s p95={:.3f}s max={:.3f}s'.format(
+                    stats['p50'], stats['p95'], stats['max']
+                )
+            logger.info(
+                'Http %s: requests=%s retries=%s errors=%s codes=%s%s '
+                'throttled=%.2fs',
+                host, stats['requests'], stats['retries'], stats['errors'],
+                stats['codes'], latency, stats['throttled_seconds']
+            )
+
+
+class Transport:
+    """
+    Sends the requests through one session. host_rates overrides the
+    default_rate, requests per second, of a host, a rate of 0 is not
+    limited.
+    """
+
+    def __init__(
+            self, timeout=(5, 30), retry: Optional[RetryPolicy] = None,
+            default_rate=0.0, host_rates=None, pool_size=32,
+            sleep=time.sleep
+    ):
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.default_rate = default_rate
+        self.host_rates = host_rates or {}
+        self.buckets: Dict[str, Optional[TokenBucket]] = {}
+        self.buckets_lock = threading.Lock()
+        self.stats = LatencyStats()
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def bucket(self, host) -> Optional[TokenBucket]:
+        with self.buckets_lock:
+            if host not in self.buckets:
+                rate = self.host_rates.get(host, self.default_rate)
+                self.buckets[host] = TokenBucket(rate) if rate > 0 else None
+            return self.buckets[host]
+
+    def throttle(self, host):
+        bucket = self.bucket(host)
+        if bucket is not None:
+            delay = bucket.reserve()
+            if delay:
+                self.stats.record_throttled(host, delay)
+                self.sleep(delay)
+
+    def send(self, request: Request) -> Response:
+        res = self.session.request(
+            request.method,
+            request.url,
+            headers=request.headers,
+            data=request.body,
+            timeout=self.timeout
+        )
+        return Response(res.status_code, res.headers, res.content)
+
+    def fetch(self, request: Request) -> Response:
+        """
+        Returns the last response, a 429 or 5xx one when the retries run
+        out. Raises the connection error of the last attempt.
+        """
+        host = host_of(request.url)
+        attempt = 0
+        while True:
+            self.throttle(host)
+            start = time.perf_counter()
+            try:
+                response = self.send(request)
+            except requests.RequestException as err:
+                self.stats.record_error(host)
+                if not self.retry.should_retry(attempt):
+                    raise
+                logger.warning('Retrying %s: %s', request.url, err)
+                retry_after = None
+            else:
+                self.stats.record(
+                    host, time.perf_counter() - start, response.code,
+                    len(response.body)
+                )
+                if not self.retry.should_retry(attempt, response.code):
+                    return response
+                logger.warning('Retrying %s: [%s]', request.url, response.code)
+                retry_after = response.headers.get('Retry-After')
+
+            self.stats.record_retry(host)
+            self.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+
+
+class HostLimiter:
+    """
+    Hands out a semaphore per host, so that every host has its own limit
+    of concurrent requests.
+    """
+
+    def __init__(self, max_per_host, host_limits=None):
+        self.max_per_host = max_per_host
+        self.host_limits = host_limits or {}
+        self.semaphores = {}
+
+    def __call__(self, url) -> Semaphore:
+        host = host_of(url)
+        if host not in self.semaphores:
+            self.semaphores[host] = Semaphore(
+                self.host_limits.get(host, self.max_per_host)
+            )
+        return self.semaphores[host]
+
+
+class AsyncTransport:
+    """
+    Awaits the requests of a `Transport` in a thread pool. At most
+    max_per_host requests of a host are in flight.
+    """
+
+    def __init__(
+            self, transport: Transport, max_per_host=4, host_limits=None,
+            max_workers=30
+    ):
+        self.transport = transport
+        self.host_limiter = HostLimiter(max_per_host, host_limits)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def close(self):
+        self.executor.shutdown()
+
+    async def fetch(self, request: Request) -> Response:
+        async with self.host_limiter(request.url):
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.transport.fetch, request
+            )
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        from http_cache import StandInHandler
+
+        class ThrottlingHandler(StandInHandler):
+            """
+            Keeps the connections alive and answers with the codes of
+            `server.throttle[path]` before serving the page.
+            """
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.server.connections.add(self.client_address)
+                codes = self.server.throttle.get(self.path)
+                if codes:
+                    self.server.requests.append(self.path)
+                    code = codes.pop(0)
+                    self.send_response(code)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                super().do_GET()
+
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), ThrottlingHandler
+        )
+        self.server.requests = []
+        self.server.pages = {'/a': b'page a', '/b': b'page b'}
+        self.server.throttle = {}
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self.sleeps = []
+        self.transport = Transport(sleep=self.sleeps.append)
+        self.addCleanup(self.transport.close)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for path in ['/a', '/b', '/a']:
+            response = self.transport.fetch(Request('GET', self.base_url + path))
+            self.assertEqual(response.code, 200)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retry_on_throttling(self):
+        self.server.throttle['/a'] = [429, 503]
+        response = self.transport.fetch(Request('GET', f'{self.base_url}/a'))
+        self.assertEqual((response.code, response.body), (200, b'page a'))
+        self.assertEqual(self.server.requests, ['/a'] * 3)
+        # Retry-After: 0 of the throttling responses.
+        self.assertEqual(self.sleeps, [0.0, 0.0])
+        stats = self.transport.stats.summary()['127.0.0.1']
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(stats['codes'], {429: 1, 503: 1, 200: 1})
+        self.assertEqual(stats['bytes'], len(b'page a'))
+
+    def test_retries_run_out(self):
+        self.transport.retry = RetryPolicy(max_retries=1)
+        self.server.throttle['/a'] = [500, 500, 500]
+        response = self.transport.fetch(Request('GET', f'{self.base_url}/a'))
+        self.assertEqual(response.code, 500)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_not_found_is_not_retried(self):
+        response = self.transport.fetch(Request('GET', f'{self.base_url}/c'))
+        self.assertEqual(response.code, 404)
+        self.assertEqual(self.sleeps, [])
+
+    def test_backoff_is_jittered(self):
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        delays = [policy.delay(attempt) for attempt in range(10)]
+        self.assertTrue(all(0 <= delay <= min(5, 2 ** i)
+                            for i, delay in enumerate(delays)))
+        self.assertEqual(policy.delay(0, retry_after='2'), 2.0)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0.5, 1.0])
+        now[0] = 3.0
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_rate_limit(self):
+        # The sleeps are not waited, the time stands still.
+        self.transport.buckets['127.0.0.1'] = TokenBucket(10, clock=lambda: 0.0)
+        for _ in range(3):
+            self.transport.fetch(Request('GET', f'{self.base_url}/a'))
+        self.assertEqual(self.sleeps, [0.1, 0.2])
+        stats = self.transport.stats.summary()['127.0.0.1']
+        self.assertAlmostEqual(stats['throttled_seconds'], 0.3)
+
+    def test_stats_from_threads(self):
+        stats = LatencyStats()
+
+        def update():
+            for _ in range(10000):
+                stats.record('a', 0.1, 200)
+                stats.record_retry('a')
+                stats.record_error('a')
+                stats.record_throttled('a', 1)
+
+        threads = [threading.Thread(target=update) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = stats.summary()['a']
+        self.assertEqual(
+            [summary[key] for key in
+             ['requests', 'retries', 'errors', 'throttled_seconds']],
+            [40000] * 4
+        )
+
+    def test_failing_host_is_summarized(self):
+        stats = LatencyStats()
+        stats.record_throttled('down', 0.5)
+        stats.record_error('down')
+        stats.record_retry('down')
+        stats.record_error('down')
+        self.assertEqual(stats.summary(), {'down': {
+            'requests': 0, 'retries': 1, 'errors': 2, 'bytes': 0,
+            'throttled_seconds': 0.5, 'codes': {},
+        }})
+        with self.assertLogs(logger, 'INFO'):
+            stats.log_summary()
+
+    def test_async(self):
+        self.server.throttle['/b'] = [429]
+        async_transport = AsyncTransport(self.transport, max_per_host=2)
+        self.addCleanup(async_transport.close)
+
+        async def fetch_all():
+            return await asyncio.gather(*(
+                async_transport.fetch(Request('GET', self.base_url + path))
+                for path in ['/a', '/b', '/a', '/b']
+            ))
+
+        responses = asyncio.run(fetch_all())
+        self.assertEqual(
+            [response.body for response in responses],
+            [b'page a', b'page b', b'page a', b'page b']
+        )
+        self.assertLessEqual(len(self.server.connections), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,428 @@
+"""
+Slices many audio/srt pairs listed in a manifest in one process.
+
+The manifest is either JSONL or CSV with the columns audio_file_path,
+srt_file_path, output_dir and optionally audio_format. Relative paths are
+relative to the manifest. A pair is skipped when its output directory has
+a stamp of the same sources, compared by mtime and, if the mtime changed,
+by sha256.
+
+    python batch.py --manifest episodes.jsonl --jobs 16
+"""
+import os
+import csv
+import json
+import logging
+import hashlib
+import argparse
+import tempfile
+import unittest
+import collections
+import concurrent.futures
+
+from typing import NamedTuple
+
+from pydub import AudioSegment
+
+from main import SILENCE_FILE
+from srt import parse_srt, cue_slices
+from streaming import PcmSource, Progress, make_executor, submit_slices
+from index import CueIndex
+
+
+STAMP_FILE = '.slices.json'
+
+logger = logging.getLogger(__name__)
+
+
+class Episode(NamedTuple):
+    audio_file_path: str
+    srt_file_path: str
+    output_dir: str
+    audio_format: str = 'mp3'
+
+    def sources(self):
+        return {'audio': self.audio_file_path, 'srt': self.srt_file_path}
+
+    def stamp_path(self):
+        return os.path.join(self.output_dir, STAMP_FILE)
+
+
+def read_manifest(manifest_path):
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline='') as fh:
+        if manifest_path.endswith('.csv'):
+            rows = list(csv.DictReader(fh))
+        else:
+            rows = [json.loads(line) for line in fh if line.strip()]
+
+    episodes = []
+    for row in rows:
+        row = {key: value for key, value in row.items() if value}
+        for key in ['audio_file_path', 'srt_file_path', 'output_dir']:
+            row[key] = os.path.join(base_dir, row[key])
+        episodes.append(Episode(**row))
+    return episodes
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256_file(path)
+    }
+
+
+def load_stamp(episode: Episode):
+    try:
+        with open(episode.stamp_path()) as fh:
+            stamp = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
+    return stamp if isinstance(stamp, dict) else None
+
+
+def write_stamp(episode: Episode, outputs):
+    stamp = {
+        'audio_format': episode.audio_format,
+        'sources': {
+            key: file_stamp(path) for key, path in episode.sources().items()
+        },
+        'outputs': outputs
+    }
+    tmp_path = episode.stamp_path() + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(stamp, fh, indent=4)
+    os.replace(tmp_path, episode.stamp_path())
+
+
+def is_up_to_date(episode: Episode):
+    """
+    A missing source or a malformed stamp is not up to date, the episode
+    then fails or is sliced again.
+    """
+    try:
+        return _is_up_to_date(episode)
+    except (OSError, KeyError, TypeError) as err:
+        logger.warning('Not up to date %s: %r', episode.output_dir, err)
+        return False
+
+
+def _is_up_to_date(episode: Episode):
+    stamp = load_stamp(episode)
+    if stamp is None or stamp['audio_format'] != episode.audio_format:
+        return False
+
+    touched = False
+    for key, path in episode.sources().items():
+        recorded = stamp['sources'][key]
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) == (
+                recorded['size'], recorded['mtime_ns']
+        ):
+            continue
+        if stat.st_size != recorded['size']:
+            return False
+        if sha256_file(path) != recorded['sha256']:
+            return False
+        # The same content with a new mtime, e.g. after a copy.
+        recorded['mtime_ns'] = stat.st_mtime_ns
+        touched = True
+
+    outputs = stamp['outputs']
+    if not all(
+            os.path.exists(os.path.join(episode.output_dir, output))
+            for output in outputs
+    ):
+        return False
+
+    if touched:
+        with open(episode.stamp_path(), 'w') as fh:
+            json.dump(stamp, fh, indent=4)
+    return True
+
+
+def prepare_output_dir(episode: Episode):
+    """Removes the outputs of the previous run of a stale episode."""
+    os.makedirs(episode.output_dir, exist_ok=True)
+    stamp = load_stamp(episode)
+    if stamp is not None:
+        os.remove(episode.stamp_path())
+        for output in stamp.get('outputs') or []:
+            try:
+                os.remove(os.path.join(episode.output_dir, output))
+            except FileNotFoundError:
+                pass
+
+
+def finish_episode(
+        episode: Episode, source: PcmSource, futures, slices, progress,
+        index: CueIndex = None
+):
+    exported = 0
+    try:
+        for future in futures:
+            future.result()
+            exported += 1
+            progress.update()
+
+        outputs = []
+        for srt_line, _, _, text in slices:
+            with open(f'{episode.output_dir}/{srt_line}.txt', 'w') as fh:
+                fh.write(text)
+            outputs += [f'{srt_line}.{episode.audio_format}', f'{srt_line}.txt']
+        write_stamp(episode, outputs)
+        if index is not None:
+            index.add_episode(
+                episode.output_dir, episode.srt_file_path, slices,
+                episode.audio_format
+            )
+    except Exception as err:
+        logger.error('Failed %s: %s', episode.audio_file_path, err)
+        # The workers may still read the decoded file.
+        concurrent.futures.wait(futures)
+        if exported < len(slices):
+            progress.update(len(slices) - exported)
+    finally:
+        source.close()
+
+
+def main(manifest_path, jobs=os.cpu_count(), max_decoded=2, index_path=None):
+    """
+    Slices of all the episodes go to one process pool. At most
+    max_decoded episodes are kept decoded on the disk at a time, the next
+    one is decoded while the pool encodes the slices of the previous ones.
+    The cues of the sliced episodes are added to the index at index_path,
+    and those of the up to date ones unless it has them.
+    """
+    index = CueIndex(index_path) if index_path else None
+    try:
+        slice_episodes(read_manifest(manifest_path), jobs, max_decoded, index)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def slice_episodes(episodes, jobs, max_decoded, index: CueIndex = None):
+    pending = []
+    for episode in episodes:
+        if not is_up_to_date(episode):
+            pending.append(episode)
+        elif index is not None:
+            index.add_srt(
+                episode.output_dir, episode.srt_file_path,
+                episode.audio_format
+            )
+    logger.info(
+        '%s of %s episodes are up to date',
+        len(episodes) - len(pending), len(episodes)
+    )
+    if not pending:
+        return
+
+    plans = []
+    for episode in pending:
+        try:
+            plans.append((episode, cue_slices(parse_srt(episode.srt_file_path))))
+        except Exception as err:
+            logger.error('Failed %s: %s', episode.srt_file_path, err)
+    progress = Progress(sum(len(slices) for _, slices in plans))
+    silence_2_seconds = AudioSegment.from_mp3(SILENCE_FILE)[:2000]
+
+    in_flight = collections.deque()
+    with make_executor(jobs, silence_2_seconds) as executor:
+        for episode, slices in plans:
+            while len(in_flight) >= max_decoded:
+                finish_episode(*in_flight.popleft(), progress, index)
+
+            try:
+                source = PcmSource.decode(episode.audio_file_path)
+            except Exception as err:
+                logger.error('Failed %s: %s', episode.audio_file_path, err)
+                progress.update(len(slices))
+                continue
+
+            prepare_output_dir(episode)
+            futures = submit_slices(
+                executor,
+                source,
+                [
+                    (
+                        f'{episode.output_dir}/{srt_line}.{episode.audio_format}',
+                        start_time,
+                        end_time + 1
+                    )
+                    for srt_line, start_time, end_time, _ in slices
+                ],
+                episode.audio_format
+            )
+            in_flight.append((episode, source, futures, slices))
+
+        while in_flight:
+            finish_episode(*in_flight.popleft(), progress, index)
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        for name in ['ep.mp3', 'ep.srt']:
+            with open(os.path.join(self.tmp_dir, name), 'w') as fh:
+                fh.write(name)
+        self.episode = Episode(
+            os.path.join(self.tmp_dir, 'ep.mp3'),
+            os.path.join(self.tmp_dir, 'ep.srt'),
+            os.path.join(self.tmp_dir, 'out')
+        )
+
+    def test_read_manifest(self):
+        jsonl_path = os.path.join(self.tmp_dir, 'manifest.jsonl')
+        with open(jsonl_path, 'w') as fh:
+            fh.write(json.dumps({
+                'audio_file_path': 'ep.mp3',
+                'srt_file_path': 'ep.srt',
+                'output_dir': 'out'
+            }) + '\n\n')
+        csv_path = os.path.join(self.tmp_dir, 'manifest.csv')
+        with open(csv_path, 'w') as fh:
+            fh.write(
+                'audio_file_path,srt_file_path,output_dir,audio_format\n'
+                'ep.mp3,ep.srt,out,\n'
+            )
+        self.assertEqual(read_manifest(jsonl_path), [self.episode])
+        self.assertEqual(read_manifest(csv_path), [self.episode])
+
+    def test_is_up_to_date(self):
+        self.assertFalse(is_up_to_date(self.episode))
+
+        prepare_output_dir(self.episode)
+        with open(os.path.join(self.episode.output_dir, '1.txt'), 'w'):
+            pass
+        write_stamp(self.episode, ['1.txt'])
+        self.assertTrue(is_up_to_date(self.episode))
+
+        # The same content with a new mtime.
+        os.utime(self.episode.srt_file_path, ns=(0, 0))
+        self.assertTrue(is_up_to_date(self.episode))
+        self.assertEqual(load_stamp(self.episode)['sources']['srt']['mtime_ns'], 0)
+
+        with open(self.episode.srt_file_path, 'w') as fh:
+            fh.write('ep.SRT')
+        self.assertFalse(is_up_to_date(self.episode))
+
+    def write_srt(self, path, text):
+        with open(path, 'w') as fh:
+            fh.write(text)
+
+    def test_malformed_srt(self):
+        good = Episode(
+            SILENCE_FILE,
+            os.path.join(self.tmp_dir, 'good.srt'),
+            os.path.join(self.tmp_dir, 'good')
+        )
+        self.write_srt(
+            good.srt_file_path,
+            '1\n00:00:01,000 --> 00:00:02,000\nFirst.\n\n'
+            '2\n00:00:03,000 --> 00:00:04,000\nSecond.\n\n'
+        )
+        with open(self.episode.srt_file_path, 'wb') as fh:
+            fh.write(b'1\n\xff\xfe not utf-8\n')
+
+        with self.assertLogs(logger, 'ERROR') as logs:
+            slice_episodes([self.episode, good], jobs=1, max_decoded=1)
+        self.assertIn(self.episode.srt_file_path, logs.output[0])
+        self.assertTrue(is_up_to_date(good))
+        self.assertFalse(is_up_to_date(self.episode))
+
+    def test_failed_slices_complete_the_progress(self):
+        class Source:
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        futures = [concurrent.futures.Future() for _ in range(3)]
+        futures[0].set_result(None)
+        futures[1].set_exception(OSError('disk full'))
+        futures[2].set_result(None)
+        slices = [(str(i), 0, 1, 'text') for i in range(3)]
+        progress = Progress(3, file=open(os.devnull, 'w'))
+        self.addCleanup(progress.file.close)
+        source = Source()
+
+        with self.assertLogs(logger, 'ERROR'):
+            finish_episode(self.episode, source, futures, slices, progress)
+        self.assertEqual(progress.done, 3)
+        self.assertTrue(source.closed)
+        self.assertFalse(os.path.exists(self.episode.stamp_path()))
+
+    def test_missing_source_or_malformed_stamp(self):
+        prepare_output_dir(self.episode)
+        write_stamp(self.episode, [])
+        self.assertTrue(is_up_to_date(self.episode))
+
+        with open(self.episode.stamp_path(), 'w') as fh:
+            json.dump({'audio_format': 'mp3', 'outputs': []}, fh)
+        with self.assertLogs(logger, 'WARNING'):
+            self.assertFalse(is_up_to_date(self.episode))
+
+        write_stamp(self.episode, [])
+        os.remove(self.episode.audio_file_path)
+        with self.assertLogs(logger, 'WARNING'):
+            self.assertFalse(is_up_to_date(self.episode))
+
+        # The episode fails on its own, the batch goes on.
+        good = Episode(
+            SILENCE_FILE,
+            os.path.join(self.tmp_dir, 'good.srt'),
+            os.path.join(self.tmp_dir, 'good')
+        )
+        self.write_srt(
+            good.srt_file_path, '1\n00:00:01,000 --> 00:00:02,000\nFirst.\n\n'
+        )
+        self.write_srt(
+            self.episode.srt_file_path,
+            '1\n00:00:01,000 --> 00:00:02,000\nLost.\n\n'
+        )
+        with self.assertLogs(logger) as logs:
+            slice_episodes([self.episode, good], jobs=1, max_decoded=1)
+        self.assertTrue(any(
+            self.episode.audio_file_path in line and 'ERROR' in line
+            for line in logs.output
+        ))
+        self.assertTrue(is_up_to_date(good))
+
+    def test_missing_output(self):
+        prepare_output_dir(self.episode)
+        write_stamp(self.episode, ['1.txt'])
+        self.assertFalse(is_up_to_date(self.episode))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--manifest', required=True)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument(
+        '--max-decoded', type=int, default=2,
+        help='episodes kept decoded on the disk at a time'
+    )
+    parser.add_argument(
+        '--index', help='add the cues to this sqlite index for index.py query'
+    )
+    args = parser.parse_args()
+    main(
+        args.manifest, jobs=args.jobs, max_decoded=args.max_decoded,
+        index_path=args.index
+    )
@@ -0,0 +1,63 @@
+"""
+Slices per second of `export_slices` against the number of jobs, on a
+synthetic sine wave cut into evenly spaced slices.
+
+    python benchmark.py --duration 600 --slices 200 --jobs 1 2 4 8 16
+"""
+import os
+import wave
+import math
+import array
+import argparse
+import tempfile
+
+from pydub import AudioSegment
+
+from streaming import PcmSource, export_slices
+
+
+def write_synthetic_wav(wav_path, duration, frame_rate=44100):
+    samples = array.array('h', (
+        int(10000 * math.sin(2 * math.pi * 440 * i / frame_rate))
+        for i in range(frame_rate)
+    ))
+    with wave.open(wav_path, 'wb') as fh:
+        fh.setnchannels(1)
+        fh.setsampwidth(2)
+        fh.setframerate(frame_rate)
+        # One second of the tone repeated.
+        for _ in range(duration):
+            fh.writeframes(samples.tobytes())
+
+
+def main(duration, num_slices, jobs_list, audio_format):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        wav_path = os.path.join(tmp_dir, 'source.wav')
+        write_synthetic_wav(wav_path, duration)
+        silence = AudioSegment.silent(duration=2000, frame_rate=44100)
+
+        step = duration * 1000 // num_slices
+        print(f'{"jobs":>6} {"seconds":>10} {"slices/s":>10}')
+        with PcmSource(wav_path) as source:
+            for jobs in jobs_list:
+                output_dir = os.path.join(tmp_dir, f'jobs_{jobs}')
+                os.mkdir(output_dir)
+                slices = [
+                    (f'{output_dir}/{i}.{audio_format}', i * step, (i + 1) * step)
+                    for i in range(num_slices)
+                ]
+                progress = export_slices(
+                    source, silence, slices, audio_format, jobs
+                )
+                elapsed = progress.done / progress.rate()
+                print(f'{jobs:>6} {elapsed:>10.2f} {progress.rate():>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=int, default=600, help='seconds')
+    parser.add_argument('--slices', type=int, default=200)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--audio-format', default='mp3')
+    args = parser.parse_args()
+    main(args.duration, args.slices, args.jobs, args.audio_format)
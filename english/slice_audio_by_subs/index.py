@@ -0,0 +1,319 @@
+"""
+A full text index of the sliced cues of many episodes, kept in sqlite
+FTS5 next to the episode and millisecond range of every clip. FTS5 keeps
+the positions of the tokens, so a phrase matches only its words in order.
+
+    python index.py add cues.sqlite --manifest episodes.jsonl
+    python index.py query cues.sqlite "take it easy" --limit 20
+
+main.py and batch.py add the episodes as they slice them with --index.
+An episode is indexed again only when its srt file changes.
+"""
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import unittest
+
+from typing import List, NamedTuple
+
+from srt import parse_srt, cue_slices, generate_srt
+
+
+class Clip(NamedTuple):
+    output_dir: str
+    srt_line: str
+    start_ms: int
+    end_ms: int
+    text: str
+    audio_format: str
+
+    @property
+    def audio_path(self):
+        return os.path.join(self.output_dir, f'{self.srt_line}.{self.audio_format}')
+
+
+def phrase_query(text):
+    """
+    A phrase of the words of the text, quotes are doubled for FTS5.
+    >>> phrase_query('say "hi" now')
+    '"say ""hi"" now"'
+    """
+    return '"{}"'.format(' '.join(text.split()).replace('"', '""'))
+
+
+def file_digest(path):
+    with open(path, 'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+class CueIndex:
+    """
+    episodes are keyed by their output directory, cues hold the clips and
+    cue_text is the FTS5 index over the text of the cues.
+    """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(str(db_path))
+        with self.db:
+            self.db.executescript('''
+                CREATE TABLE IF NOT EXISTS episodes (
+                    id INTEGER PRIMARY KEY,
+                    output_dir TEXT NOT NULL UNIQUE,
+                    srt_file_path TEXT NOT NULL,
+                    srt_sha256 TEXT NOT NULL,
+                    audio_format TEXT NOT NULL,
+                    indexed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cues (
+                    id INTEGER PRIMARY KEY,
+                    episode_id INTEGER NOT NULL REFERENCES episodes (id),
+                    srt_line TEXT NOT NULL,
+                    start_ms INTEGER NOT NULL,
+                    end_ms INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS cues_episode ON cues (episode_id);
+                CREATE VIRTUAL TABLE IF NOT EXISTS cue_text USING fts5 (
+                    text, content='cues', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+            ''')
+
+    def close(self):
+        self.db.close()
+
+    def is_indexed(self, output_dir, srt_file_path):
+        row = self.db.execute(
+            'SELECT srt_sha256 FROM episodes WHERE output_dir = ?',
+            (os.path.abspath(output_dir),)
+        ).fetchone()
+        return row is not None and row[0] == file_digest(srt_file_path)
+
+    def remove_episode(self, output_dir):
+        with self.db:
+            self._remove_episode(os.path.abspath(output_dir))
+
+    def _remove_episode(self, output_dir):
+        row = self.db.execute(
+            'SELECT id FROM episodes WHERE output_dir = ?', (output_dir,)
+        ).fetchone()
+        if row is None:
+            return
+        # An external content table is told the removed text.
+        self.db.execute(
+            "INSERT INTO cue_text (cue_text, rowid, text) "
+            "SELECT 'delete', id, text FROM cues WHERE episode_id = ?",
+            row
+        )
+        self.db.execute('DELETE FROM cues WHERE episode_id = ?', row)
+        self.db.execute('DELETE FROM episodes WHERE id = ?', row)
+
+    def add_episode(self, output_dir, srt_file_path, slices, audio_format='mp3'):
+        """
+        Replaces the cues of the episode by slices, the (srt_line,
+        start_time, end_time, text) of `cue_slices`.
+        """
+        output_dir = os.path.abspath(output_dir)
+        with self.db:
+            self._remove_episode(output_dir)
+            episode_id = self.db.execute(
+                'INSERT INTO episodes (output_dir, srt_file_path, srt_sha256, '
+                'audio_format, indexed_at) VALUES (?, ?, ?, ?, ?)',
+                (output_dir, os.path.abspath(srt_file_path),
+                 file_digest(srt_file_path), audio_format, time.time())
+            ).lastrowid
+            first_id = self.db.execute(
+                'SELECT COALESCE(MAX(id), 0) + 1 FROM cues'
+            ).fetchone()[0]
+            self.db.executemany(
+                'INSERT INTO cues (id, episode_id, srt_line, start_ms, end_ms, '
+                'text) VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (first_id + i, episode_id, srt_line, start_ms, end_ms,
+                     text.strip())
+                    for i, (srt_line, start_ms, end_ms, text) in enumerate(slices)
+                ]
+            )
+            self.db.execute(
+                'INSERT INTO cue_text (rowid, text) '
+                'SELECT id, text FROM cues WHERE episode_id = ?',
+                (episode_id,)
+            )
+
+    def add_srt(self, output_dir, srt_file_path, audio_format='mp3'):
+        """Indexes an episode from its srt file unless it is up to date."""
+        if self.is_indexed(output_dir, srt_file_path):
+            return False
+        self.add_episode(
+            output_dir, srt_file_path, cue_slices(parse_srt(srt_file_path)),
+            audio_format
+        )
+        return True
+
+    def search(self, query, limit=20, raw=False, output_dir=None) -> List[Clip]:
+        """
+        The best matching clips of the phrase, or of an FTS5 query with
+        raw, in the episode of output_dir or in all of them.
+        """
+        sql = (
+            'SELECT episodes.output_dir, cues.srt_line, cues.start_ms, '
+            'cues.end_ms, cues.text, episodes.audio_format '
+            'FROM cue_text '
+            'JOIN cues ON cues.id = cue_text.rowid '
+            'JOIN episodes ON episodes.id = cues.episode_id '
+            'WHERE cue_text MATCH ?'
+        )
+        params = [query if raw else phrase_query(query)]
+        if output_dir is not None:
+            sql += ' AND episodes.output_dir = ?'
+            params.append(os.path.abspath(output_dir))
+        sql += ' ORDER BY cue_text.rank LIMIT ?'
+        params.append(limit)
+        return [Clip(*row) for row in self.db.execute(sql, params)]
+
+    def stats(self):
+        episodes, = self.db.execute('SELECT COUNT(*) FROM episodes').fetchone()
+        cues, = self.db.execute('SELECT COUNT(*) FROM cues').fetchone()
+        return {'episodes': episodes, 'cues': cues}
+
+
+def format_ms(ms):
+    """
+    >>> format_ms(3723045)
+    '01:02:03.045'
+    """
+    return '{:02}:{:02}:{:02}.{:03}'.format(
+        ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000
+    )
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.index = CueIndex(os.path.join(self.tmp_dir, 'cues.sqlite'))
+        self.addCleanup(self.index.close)
+        self.srt_path = os.path.join(self.tmp_dir, 'ep1.srt')
+        self.write_srt(self.srt_path, [
+            ('00:00:01,000', '00:00:02,000', 'Take it easy.'),
+            ('00:00:03,000', '00:00:04,000', 'It is easy to take'),
+            ('00:00:04,500', '00:00:05,000', 'the café.'),
+        ])
+
+    def write_srt(self, path, cues):
+        with open(path, 'w', encoding='utf-8') as fh:
+            for i, (start, end, text) in enumerate(cues, 1):
+                fh.write(f'{i}\n{start} --> {end}\n{text}\n\n')
+
+    def test_phrase_search(self):
+        self.assertTrue(self.index.add_srt('out1', self.srt_path))
+        clips = self.index.search('take it')
+        self.assertEqual(
+            [(clip.srt_line, clip.start_ms, clip.end_ms) for clip in clips],
+            [('1', 1000, 2990)]
+        )
+        self.assertEqual(clips[0].audio_path, os.path.abspath('out1/1.mp3'))
+        # The merged cue 2 and 3, with diacritics removed.
+        self.assertEqual(
+            [clip.text for clip in self.index.search('to take the cafe')],
+            ['It is easy to take the café.']
+        )
+        self.assertEqual(len(self.index.search('easy')), 2)
+        self.assertEqual(len(self.index.search('easy NOT take', raw=True)), 0)
+
+    def test_incremental(self):
+        self.assertTrue(self.index.add_srt('out1', self.srt_path))
+        self.assertFalse(self.index.add_srt('out1', self.srt_path))
+
+        srt2 = os.path.join(self.tmp_dir, 'ep2.srt')
+        self.write_srt(srt2, [('00:10:00,000', '00:10:01,000', 'Take it back.')])
+        self.index.add_srt('out2', srt2)
+        self.assertEqual(len(self.index.search('take it')), 2)
+        self.assertEqual(
+            len(self.index.search('take it', output_dir='out2')), 1
+        )
+
+        self.write_srt(self.srt_path, [
+            ('00:00:01,000', '00:00:02,000', 'Give it back.')
+        ])
+        self.assertTrue(self.index.add_srt('out1', self.srt_path))
+        self.assertEqual(
+            sorted(clip.output_dir for clip in self.index.search('it back')),
+            [os.path.abspath('out1'), os.path.abspath('out2')]
+        )
+        self.assertEqual(self.index.search('take it easy'), [])
+        self.assertEqual(self.index.stats(), {'episodes': 2, 'cues': 2})
+
+    def test_many_episodes(self):
+        for i in range(100):
+            srt_path = os.path.join(self.tmp_dir, f'gen{i}.srt')
+            generate_srt(srt_path, 300, seed=i)
+            self.index.add_srt(os.path.join(self.tmp_dir, f'gen{i}'), srt_path)
+        start = time.perf_counter()
+        clips = self.index.search('word1 word2', limit=1000)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertTrue(clips)
+        self.assertTrue(all('word1 word2' in clip.text for clip in clips))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='index sliced episodes')
+    add_parser.add_argument('index')
+    add_parser.add_argument('--manifest', help='the manifest of batch.py')
+    add_parser.add_argument('--srt-file-path')
+    add_parser.add_argument('--output-dir')
+    add_parser.add_argument('--audio-format', default='mp3')
+
+    query_parser = subparsers.add_parser('query', help='find the clips of a phrase')
+    query_parser.add_argument('index')
+    query_parser.add_argument('phrase', nargs='+')
+    query_parser.add_argument('--limit', type=int, default=20)
+    query_parser.add_argument(
+        '--raw', action='store_true', help='the phrase is an FTS5 query'
+    )
+    query_parser.add_argument('--output-dir', help='search only this episode')
+
+    args = parser.parse_args()
+    index = CueIndex(args.index)
+    try:
+        if args.command == 'add':
+            if args.manifest:
+                from batch import read_manifest
+
+                episodes = [
+                    (episode.output_dir, episode.srt_file_path,
+                     episode.audio_format)
+                    for episode in read_manifest(args.manifest)
+                ]
+            elif args.srt_file_path and args.output_dir:
+                episodes = [
+                    (args.output_dir, args.srt_file_path, args.audio_format)
+                ]
+            else:
+                parser.error('give --manifest or --srt-file-path and --output-dir')
+            added = sum(index.add_srt(*episode) for episode in episodes)
+            print(f'{added} of {len(episodes)} episodes indexed, {index.stats()}')
+
+        elif args.command == 'query':
+            start = time.perf_counter()
+            clips = index.search(
+                ' '.join(args.phrase), args.limit, args.raw, args.output_dir
+            )
+            elapsed = time.perf_counter() - start
+            for clip in clips:
+                print(
+                    f'{clip.audio_path}\t{clip.start_ms}\t{clip.end_ms}\t'
+                    f'{format_ms(clip.start_ms)}\t{clip.text}'
+                )
+            print(f'{len(clips)} clips in {elapsed * 1000:.1f} ms', file=sys.stderr)
+    finally:
+        index.close()
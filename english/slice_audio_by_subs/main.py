@@ -5,6 +5,15 @@ import argparse
 
 from pydub import AudioSegment
 
+from srt import parse_srt, cue_slices
+from streaming import PcmSource, export_slices
+from index import CueIndex
+
+
+SILENCE_FILE = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'silence_1_min.mp3'
+)
+
 
 def convert_time_str_to_milliseconds(time_str):
     """
@@ -62,17 +71,46 @@ def process_srt_file(srt_file_path):
     return data
 
 
-def main(audio_file_path, srt_file_path, output_dir, audio_format='mp3'):
-    srt_data_dict: dict = process_srt_file(srt_file_path)
-    silence_audio_file = AudioSegment.from_mp3('silence_1_min.mp3')
-    silence_2_seconds = silence_audio_file[:2000]
-    audio_file = getattr(AudioSegment, f'from_{audio_format}')(audio_file_path)
-    os.mkdir(output_dir)
+def main(
+        audio_file_path, srt_file_path, output_dir, audio_format='mp3',
+        streaming=False, jobs=1, index_path=None
+):
+    index = CueIndex(index_path) if index_path else None
+    try:
+        # The workers of the process pool read the slices from the decoded
+        # file.
+        if streaming or jobs > 1:
+            # Decodes the source once into a memory-mapped WAV file and
+            # reads only the slices from it.
+            with PcmSource.decode(audio_file_path) as audio_file:
+                slice_audio(
+                    audio_file, srt_file_path, output_dir, audio_format, jobs,
+                    index
+                )
+        else:
+            audio_file = getattr(AudioSegment, f'from_{audio_format}')(
+                audio_file_path
+            )
+            slice_audio(
+                audio_file, srt_file_path, output_dir, audio_format,
+                index=index
+            )
+    finally:
+        if index is not None:
+            index.close()
+
 
-    delta_threshold = 1000
+def compute_slices(srt_data_dict, delta_threshold=1000):
+    """
+    Returns (srt_line, start_time, end_time, text) of every slice. A slice
+    is extended into the pauses around it, by at most delta_threshold.
+
+    The reference for `srt.cue_slices`, which is used for slicing.
+    """
     srt_data_list: list = list(srt_data_dict.items())
     srt_data_list.sort(key=lambda i: int(i[0]))
 
+    slices = []
     for ind, (srt_line, srt_datum) in enumerate(srt_data_list):
         current_start_time = convert_time_str_to_milliseconds(
             srt_datum['start_time_str'][0]
@@ -102,18 +140,36 @@ def main(audio_file_path, srt_file_path, output_dir, audio_format='mp3'):
         else:
             end_time = current_end_time
 
-        audio_slice = (
-            silence_2_seconds +
-            audio_file[start_time:end_time + 1] +
-            silence_2_seconds
-        )
-        audio_slice.export(
-            f'{output_dir}/{srt_line}.{audio_format}',
-            format=audio_format
-        )
+        slices.append((srt_line, start_time, end_time, srt_datum['text']))
+    return slices
+
+
+def slice_audio(
+        audio_file, srt_file_path, output_dir, audio_format, jobs=1,
+        index: CueIndex = None
+):
+    slices = cue_slices(parse_srt(srt_file_path))
+    silence_audio_file = AudioSegment.from_mp3(SILENCE_FILE)
+    silence_2_seconds = silence_audio_file[:2000]
+    os.mkdir(output_dir)
 
+    export_slices(
+        audio_file,
+        silence_2_seconds,
+        [
+            (f'{output_dir}/{srt_line}.{audio_format}', start_time, end_time + 1)
+            for srt_line, start_time, end_time, _ in slices
+        ],
+        audio_format,
+        jobs
+    )
+
+    for srt_line, _, _, text in slices:
         with open(f'{output_dir}/{srt_line}.txt', 'w') as fh:
-            fh.write(srt_datum['text'])
+            fh.write(text)
+
+    if index is not None:
+        index.add_episode(output_dir, srt_file_path, slices, audio_format)
 
 
 if __name__ == '__main__':
@@ -121,10 +177,24 @@ if __name__ == '__main__':
     parser.add_argument('--audio-file-path', required=True)
     parser.add_argument('--srt-file-path', required=True)
     parser.add_argument('--output-dir', required=True)
+    parser.add_argument(
+        '--streaming', action='store_true',
+        help='decode the audio once into a temporary file instead of memory'
+    )
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help='number of processes encoding the slices, implies --streaming'
+    )
+    parser.add_argument(
+        '--index', help='add the cues to this sqlite index for index.py query'
+    )
     args = parser.parse_args()
     main(
         audio_file_path=args.audio_file_path,
         srt_file_path=args.srt_file_path,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        streaming=args.streaming,
+        jobs=args.jobs,
+        index_path=args.index
     )
 
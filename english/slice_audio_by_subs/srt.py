@@ -0,0 +1,193 @@
+import re
+import os
+import random
+import tempfile
+import unittest
+
+from typing import List, NamedTuple
+
+import numpy as np
+
+
+# re.ASCII makes every matched time span exactly 29 ascii characters.
+TIME_SPAN_RE = re.compile(
+    r'\d\d:\d\d:\d\d,\d\d\d\s-->\s\d\d:\d\d:\d\d,\d\d\d$', re.ASCII
+)
+TIME_SPAN_WIDTH = 29
+END_TEXT_SYMBOLS = ('.',)
+
+
+class CueTable(NamedTuple):
+    """
+    Merged cues sorted by their srt line number: a cue continues until its
+    text ends with a full stop. start_ms is the start of its first time
+    span and end_ms the end of its last one.
+    """
+    srt_lines: List[str]
+    start_ms: np.ndarray
+    end_ms: np.ndarray
+    texts: List[str]
+
+    def __len__(self):
+        return len(self.srt_lines)
+
+
+def time_spans_to_milliseconds(time_spans):
+    """
+    Converts the time span lines all at once.
+    >>> time_spans_to_milliseconds(['00:01:16,326 --> 01:00:00,001'])
+    (array([76326]), array([3600001]))
+    """
+    if not time_spans:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    digits = np.frombuffer(
+        ''.join(time_spans).encode('ascii'), dtype=np.uint8
+    ).reshape(-1, TIME_SPAN_WIDTH).astype(np.int64) - ord('0')
+
+    def milliseconds(offset):
+        d = digits[:, offset:offset + 12]
+        return (
+            (d[:, 0] * 10 + d[:, 1]) * 3600000 +
+            (d[:, 3] * 10 + d[:, 4]) * 60000 +
+            (d[:, 6] * 10 + d[:, 7]) * 1000 +
+            d[:, 9] * 100 + d[:, 10] * 10 + d[:, 11]
+        )
+
+    return milliseconds(0), milliseconds(17)
+
+
+def parse_srt(srt_file_path) -> CueTable:
+    """
+    The same merging as `main.process_srt_file`. The lines are classified
+    in one pass and the time spans are converted to milliseconds together
+    at the end.
+    """
+    srt_lines = []
+    texts = []
+    # The slot of the current cue of every srt line number, a repeated
+    # number replaces the previous cue like in the dict of process_srt_file.
+    slots = {}
+    time_spans = []
+    time_span_slots = []
+
+    current = None
+    is_time_span = TIME_SPAN_RE.match
+    with open(srt_file_path, encoding='utf-8-sig') as fh:
+        for line in fh:
+            line = line.strip()
+
+            if not line:
+                continue
+
+            if line.isdecimal():
+                if (
+                        current is None or
+                        not texts[current] or
+                        texts[current][-1][-1] in END_TEXT_SYMBOLS
+                ):
+                    current = len(srt_lines)
+                    slots[line] = current
+                    srt_lines.append(line)
+                    texts.append([])
+
+            elif current is None:
+                # Nothing before the first srt line number belongs to a cue.
+                continue
+
+            elif is_time_span(line):
+                time_spans.append(line)
+                time_span_slots.append(current)
+
+            else:
+                texts[current].append(line)
+
+    starts, ends = time_spans_to_milliseconds(time_spans)
+    time_span_slots = np.array(time_span_slots, dtype=np.int64)
+
+    # The first and the last time span of every slot.
+    num_slots = len(srt_lines)
+    start_ms = np.full(num_slots, -1, dtype=np.int64)
+    end_ms = np.full(num_slots, -1, dtype=np.int64)
+    slot_ids, first = np.unique(time_span_slots, return_index=True)
+    start_ms[slot_ids] = starts[first]
+    slot_ids, last = np.unique(time_span_slots[::-1], return_index=True)
+    end_ms[slot_ids] = ends[::-1][last]
+
+    kept = np.array(sorted(
+        (slot for slot in slots.values() if start_ms[slot] >= 0),
+        key=lambda slot: int(srt_lines[slot])
+    ), dtype=np.int64)
+    return CueTable(
+        srt_lines=[srt_lines[slot] for slot in kept],
+        start_ms=start_ms[kept],
+        end_ms=end_ms[kept],
+        texts=[''.join(f'{part} ' for part in texts[slot]) for slot in kept]
+    )
+
+
+def slice_bounds(cues: CueTable, delta_threshold=1000):
+    """
+    Extends every cue into the pauses around it by at most delta_threshold.
+    >>> cues = CueTable(['1', '2', '3'], np.array([0, 1500, 5000]),
+    ...                 np.array([1000, 2000, 6000]), ['a', 'b', 'c'])
+    >>> slice_bounds(cues)
+    (array([   0, 1010, 4010]), array([1490, 2990, 6000]))
+    """
+    gaps = np.minimum(cues.start_ms[1:] - cues.end_ms[:-1], delta_threshold)
+    start = cues.start_ms.copy()
+    start[1:] -= gaps - 10
+    end = cues.end_ms.copy()
+    end[:-1] += gaps - 10
+    return start, end
+
+
+def cue_slices(cues: CueTable, delta_threshold=1000):
+    """Returns (srt_line, start_time, end_time, text) of every slice."""
+    start, end = slice_bounds(cues, delta_threshold)
+    return list(zip(cues.srt_lines, start.tolist(), end.tolist(), cues.texts))
+
+
+def generate_srt(srt_file_path, num_cues, seed=0):
+    """Writes a random srt file, some cues continue the sentence."""
+    rnd = random.Random(seed)
+    time = 0
+    with open(srt_file_path, 'w', encoding='utf-8') as fh:
+        for i in range(1, num_cues + 1):
+            start = time + rnd.randint(0, 3000)
+            end = start + rnd.randint(500, 5000)
+            time = end
+
+            def time_str(ms):
+                return '{:02}:{:02}:{:02},{:03}'.format(
+                    ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000
+                )
+
+            lines = [f'word{j}' for j in range(rnd.randint(1, 6))]
+            if rnd.random() < 0.7:
+                lines[-1] += '.'
+            fh.write(f'{i}\n{time_str(start)} --> {time_str(end)}\n')
+            fh.write(' '.join(lines[:3]) + '\n')
+            if lines[3:]:
+                fh.write(' '.join(lines[3:]) + '\n')
+            fh.write('\n')
+
+
+class TestCase(unittest.TestCase):
+
+    def test_same_as_process_srt_file(self):
+        from main import process_srt_file, compute_slices
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srt_file_path = os.path.join(tmp_dir, 'test.srt')
+            for seed in range(5):
+                generate_srt(srt_file_path, 300, seed=seed)
+                with self.subTest(seed=seed):
+                    self.assertEqual(
+                        cue_slices(parse_srt(srt_file_path)),
+                        compute_slices(process_srt_file(srt_file_path))
+                    )
+
+
+if __name__ == '__main__':
+    unittest.main()
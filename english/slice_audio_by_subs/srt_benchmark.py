@@ -0,0 +1,45 @@
+"""
+The columnar `srt.parse_srt` against `main.process_srt_file`, both with
+the computation of the slice bounds, on a generated subtitle file.
+
+    python srt_benchmark.py --cues 50000
+"""
+import os
+import argparse
+import tempfile
+import timeit
+
+from main import process_srt_file, compute_slices
+from srt import generate_srt, parse_srt, cue_slices
+
+
+def main(num_cues, repeat):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        srt_file_path = os.path.join(tmp_dir, 'benchmark.srt')
+        generate_srt(srt_file_path, num_cues)
+
+        candidates = {
+            'process_srt_file': lambda: compute_slices(
+                process_srt_file(srt_file_path)
+            ),
+            'parse_srt': lambda: cue_slices(parse_srt(srt_file_path)),
+        }
+        results = {name: func() for name, func in candidates.items()}
+        assert results['parse_srt'] == results['process_srt_file']
+
+        timings = {}
+        for name, func in candidates.items():
+            timings[name] = min(timeit.repeat(func, number=1, repeat=repeat))
+            print(f'{name:>20} {timings[name]:>8.3f}s')
+        print(
+            f'{"speedup":>20} '
+            f'{timings["process_srt_file"] / timings["parse_srt"]:>8.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cues', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.cues, args.repeat)
@@ -0,0 +1,299 @@
+import os
+import sys
+import mmap
+import time
+import wave
+import struct
+import tempfile
+import unittest
+import subprocess
+import collections
+import concurrent.futures
+
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError, TooManyMissingFrames
+
+
+def decode_to_wav(audio_file_path, wav_path):
+    """
+    Decodes the audio file into a 16 bit PCM WAV file with ffmpeg. The
+    output goes to a file, not to a pipe, so the audio is never held in
+    memory.
+    """
+    conversion_command = [
+        AudioSegment.converter,
+        '-v', 'error',
+        '-y',
+        '-i', audio_file_path,
+        '-vn',
+        '-acodec', 'pcm_s16le',
+        '-f', 'wav',
+        wav_path
+    ]
+    p = subprocess.run(conversion_command, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise CouldntDecodeError(
+            f'Decoding failed. ffmpeg returned error code: {p.returncode}\n\n'
+            f'{p.stderr.decode(errors="ignore")}'
+        )
+
+
+def read_wav_header(buffer):
+    """
+    Returns (channels, frame_rate, sample_width, data_offset, data_size).
+    """
+    if buffer[:4] != b'RIFF' or buffer[8:12] != b'WAVE':
+        raise CouldntDecodeError('Not a WAV file')
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(buffer):
+        chunk_id = buffer[pos:pos + 4]
+        chunk_size, = struct.unpack_from('<I', buffer, pos + 4)
+        pos += 8
+        if chunk_id == b'fmt ':
+            _, channels, frame_rate, _, _, bits_per_sample = struct.unpack_from(
+                '<HHIIHH', buffer, pos
+            )
+            fmt = channels, frame_rate, bits_per_sample // 8
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise CouldntDecodeError('WAV data chunk before fmt chunk')
+            # The size is not reliable for the files over 4GB.
+            data_size = min(chunk_size, len(buffer) - pos)
+            return (*fmt, pos, data_size)
+        pos += chunk_size + chunk_size % 2
+    raise CouldntDecodeError('WAV file without data chunk')
+
+
+class PcmSource:
+    """
+    The source audio decoded once into a temporary WAV file and memory
+    mapped. Slicing by milliseconds works like `AudioSegment` slicing, but
+    only the bytes of the slice are read, so the memory does not depend on
+    the length of the source.
+    """
+
+    def __init__(self, wav_path, owns_file=False):
+        self.wav_path = wav_path
+        self.owns_file = owns_file
+        self.fh = open(wav_path, 'rb')
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            self.channels, self.frame_rate, self.sample_width,
+            self.data_offset, self.data_size
+        ) = read_wav_header(self.mm)
+        self.frame_width = self.channels * self.sample_width
+
+    @classmethod
+    def decode(cls, audio_file_path, tmp_dir=None):
+        fd, wav_path = tempfile.mkstemp(suffix='.wav', dir=tmp_dir)
+        os.close(fd)
+        try:
+            decode_to_wav(audio_file_path, wav_path)
+            return cls(wav_path, owns_file=True)
+        except BaseException:
+            os.remove(wav_path)
+            raise
+
+    def close(self):
+        self.mm.close()
+        self.fh.close()
+        if self.owns_file:
+            os.remove(self.wav_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def frame_count(self):
+        return self.data_size // self.frame_width
+
+    def __len__(self):
+        return round(1000 * (self.frame_count() / self.frame_rate))
+
+    def frame_position(self, ms):
+        return int(ms * (self.frame_rate / 1000.0))
+
+    def __getitem__(self, millisecond: slice) -> AudioSegment:
+        start = millisecond.start if millisecond.start is not None else 0
+        end = millisecond.stop if millisecond.stop is not None else len(self)
+        return self.frames(*self.frame_range(start, end))
+
+    def frame_range(self, start_ms, end_ms):
+        return (
+            self.frame_position(min(start_ms, len(self))),
+            self.frame_position(min(end_ms, len(self)))
+        )
+
+    def frames(self, start_frame, end_frame) -> AudioSegment:
+        start = start_frame * self.frame_width
+        end = end_frame * self.frame_width
+        data = self.mm[
+            self.data_offset + start:self.data_offset + min(end, self.data_size)
+        ]
+
+        # The same padding as in `AudioSegment.__getitem__`.
+        missing_frames = (end - start - len(data)) // self.frame_width
+        if missing_frames:
+            if missing_frames > self.frame_position(2):
+                raise TooManyMissingFrames(
+                    f'missing frames: {missing_frames}'
+                )
+            data += b'\0' * (missing_frames * self.frame_width)
+        return self.spawn(data)
+
+    def spawn(self, data) -> AudioSegment:
+        return AudioSegment(
+            data=data,
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
+
+
+class Progress:
+    """Prints the number of exported slices and the throughput."""
+
+    def __init__(self, total, interval=1.0, file=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.file = file
+        self.done = 0
+        self.start = self.last_report = time.perf_counter()
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed else 0.0
+
+    def update(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval or self.done == self.total:
+            self.last_report = now
+            print(
+                f'{self.done}/{self.total} slices, {self.rate():.1f} slices/s',
+                file=self.file, flush=True
+            )
+
+
+def export_slice(silence, audio_slice, output_path, audio_format):
+    (silence + audio_slice + silence).export(output_path, format=audio_format)
+    return output_path
+
+
+# The state of a pool worker: the padding silence and the WAV files which
+# are currently mapped.
+_worker = {}
+MAX_OPEN_SOURCES = 4
+
+
+def init_worker(silence_data, silence_params):
+    _worker['silence'] = AudioSegment(data=silence_data, **silence_params)
+    _worker['sources'] = collections.OrderedDict()
+
+
+def worker_source(wav_path):
+    sources = _worker['sources']
+    if wav_path in sources:
+        sources.move_to_end(wav_path)
+        return sources[wav_path]
+
+    source = sources[wav_path] = PcmSource(wav_path)
+    while len(sources) > MAX_OPEN_SOURCES:
+        _, old_source = sources.popitem(last=False)
+        old_source.close()
+    return source
+
+
+def export_frames(wav_path, output_path, start_frame, end_frame, audio_format):
+    return export_slice(
+        _worker['silence'],
+        worker_source(wav_path).frames(start_frame, end_frame),
+        output_path,
+        audio_format
+    )
+
+
+def make_executor(jobs, silence) -> concurrent.futures.ProcessPoolExecutor:
+    """The silence is decoded once and sent to every worker at start."""
+    silence_params = {
+        'sample_width': silence.sample_width,
+        'frame_rate': silence.frame_rate,
+        'channels': silence.channels
+    }
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_worker,
+        initargs=(silence.raw_data, silence_params)
+    )
+
+
+def submit_slices(executor, source: PcmSource, slices, audio_format):
+    return [
+        executor.submit(
+            export_frames, source.wav_path, output_path,
+            *source.frame_range(start, end), audio_format
+        )
+        for output_path, start, end in slices
+    ]
+
+
+def export_slices(audio_file, silence, slices, audio_format, jobs=1):
+    """
+    Exports slices given as (output_path, start_ms, end_ms) padded with
+    silence. With several jobs, audio_file must be a PcmSource: every
+    worker maps the same WAV file and receives only the frame ranges.
+    """
+    progress = Progress(len(slices))
+    if jobs == 1:
+        for output_path, start, end in slices:
+            export_slice(silence, audio_file[start:end], output_path, audio_format)
+            progress.update()
+        return progress
+
+    with make_executor(jobs, silence) as executor:
+        futures = submit_slices(executor, audio_file, slices, audio_format)
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+            progress.update()
+    return progress
+
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.wav_path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        self.addCleanup(os.remove, self.wav_path)
+        with wave.open(self.wav_path, 'wb') as fh:
+            fh.setnchannels(2)
+            fh.setsampwidth(2)
+            fh.setframerate(44100)
+            fh.writeframes(bytes(i % 251 for i in range(4 * 44100 * 3)))
+
+    def test_slices_match_audio_segment(self):
+        audio = AudioSegment.from_wav(self.wav_path)
+        with PcmSource(self.wav_path) as source:
+            self.assertEqual(len(source), len(audio))
+            for start, end in [
+                (0, 1), (10, 1011), (1234, 2999), (2990, 3001), (3001, 4000)
+            ]:
+                with self.subTest((start, end)):
+                    self.assertEqual(
+                        source[start:end].raw_data, audio[start:end].raw_data
+                    )
+
+    def test_read_wav_header(self):
+        with PcmSource(self.wav_path) as source:
+            self.assertEqual(
+                (source.channels, source.frame_rate, source.sample_width),
+                (2, 44100, 2)
+            )
+            self.assertEqual(source.frame_count(), 3 * 44100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,333 @@
+"""
+Checks that the solution_*.py variants of every problem agree on random
+inputs and times them across input sizes.
+
+    python benchmark.py check --seeds 200
+    python benchmark.py run --output results.json
+    python benchmark.py compare baseline.json results.json --threshold 0.1
+
+The results record the git commit they were measured on, `compare`
+reports the variants whose median time grew by more than the threshold
+and exits with 1 if there are any.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import unittest
+import statistics
+import subprocess
+import importlib.util
+
+from typing import Any, Callable, Dict, List, NamedTuple
+
+
+LEETCODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ProblemSpec(NamedTuple):
+    """
+    function is the name of the function every solution defines,
+    make_input(rng, size) makes a random input, prepare(input) the
+    arguments of one call out of the timed region and call(function, args)
+    the output to compare.
+    """
+    function: str
+    make_input: Callable[[random.Random, int], Any]
+    prepare: Callable[[Any], Any]
+    call: Callable[[Callable, Any], Any]
+    sizes: List[int]
+
+
+def make_matrix(rng: random.Random, size):
+    return [[rng.randrange(1000) for _ in range(size)] for _ in range(size)]
+
+
+def rotate_in_place(function, matrix):
+    function(matrix)
+    return matrix
+
+
+def make_sudoku_boards(rng: random.Random, size):
+    """size boards, shuffled solved boards with holes and a few changes."""
+    boards = []
+    for _ in range(size):
+        digits = rng.sample('123456789', 9)
+        board = [
+            [
+                digits[(3 * (r % 3) + r // 3 + c) % 9]
+                if rng.random() < 0.4 else '.'
+                for c in range(9)
+            ]
+            for r in range(9)
+        ]
+        for _ in range(rng.randrange(3)):
+            board[rng.randrange(9)][rng.randrange(9)] = rng.choice('123456789.')
+        boards.append(board)
+    return boards
+
+
+def validate_each(function, boards):
+    return [function(board) for board in boards]
+
+
+PROBLEMS: Dict[str, ProblemSpec] = {
+    'rotate_image': ProblemSpec(
+        function='rotate_ninety_degree_clockwise',
+        make_input=make_matrix,
+        prepare=copy.deepcopy,
+        call=rotate_in_place,
+        sizes=[4, 16, 64, 256]
+    ),
+    'valid_sudoku': ProblemSpec(
+        function='is_valid_sudoku',
+        make_input=make_sudoku_boards,
+        # The boards are only read.
+        prepare=lambda boards: boards,
+        call=validate_each,
+        sizes=[1, 100, 1000]
+    ),
+}
+
+
+def discover(problem_dir) -> Dict[str, Any]:
+    """
+    Imports every solution_*.py of the directory by its path, so the
+    variants of different problems do not clash in sys.modules.
+    """
+    problem = os.path.basename(os.path.normpath(problem_dir))
+    solutions = {}
+    for file_name in sorted(os.listdir(problem_dir)):
+        if not (file_name.startswith('solution_') and file_name.endswith('.py')):
+            continue
+        name = file_name[:-len('.py')]
+        spec = importlib.util.spec_from_file_location(
+            f'{problem}.{name}', os.path.join(problem_dir, file_name)
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        solutions[name] = module
+    return solutions
+
+
+def solution_functions(problem, problem_dir=None):
+    spec = PROBLEMS[problem]
+    modules = discover(problem_dir or os.path.join(LEETCODE_DIR, problem))
+    return {
+        name: getattr(module, spec.function) for name, module in modules.items()
+    }
+
+
+def check(problem, seeds=100, problem_dir=None):
+    """
+    Runs every variant on random inputs of the two smallest sizes.
+    Returns the disagreements as (seed, size, variant, reference variant).
+    """
+    spec = PROBLEMS[problem]
+    functions = solution_functions(problem, problem_dir)
+    disagreements = []
+    for seed in range(seeds):
+        for size in spec.sizes[:2]:
+            data = spec.make_input(random.Random(seed), size)
+            outputs = {
+                name: spec.call(function, spec.prepare(data))
+                for name, function in functions.items()
+            }
+            reference, expected = next(iter(outputs.items()))
+            for name, output in outputs.items():
+                if output != expected:
+                    disagreements.append((seed, size, name, reference))
+    return disagreements
+
+
+def time_calls(spec: ProblemSpec, function, data, warmup, repeat):
+    for _ in range(warmup):
+        spec.call(function, spec.prepare(data))
+    times = []
+    for _ in range(repeat):
+        args = spec.prepare(data)
+        start = time.perf_counter()
+        spec.call(function, args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def measure(problem, sizes=None, warmup=2, repeat=10, seed=0, problem_dir=None):
+    spec = PROBLEMS[problem]
+    functions = solution_functions(problem, problem_dir)
+    results = []
+    for size in sizes or spec.sizes:
+        data = spec.make_input(random.Random(seed), size)
+        for name, function in functions.items():
+            times = time_calls(spec, function, data, warmup, repeat)
+            results.append({
+                'problem': problem,
+                'solution': name,
+                'size': size,
+                'repeat': repeat,
+                'min': min(times),
+                'median': statistics.median(times),
+                'mean': statistics.mean(times),
+                'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+            })
+    return results
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(
+            ['git', *args], cwd=LEETCODE_DIR, capture_output=True, text=True
+        )
+    head = git('rev-parse', 'HEAD')
+    if head.returncode != 0:
+        return None, None
+    dirty = bool(git('status', '--porcelain', '--', '.').stdout.strip())
+    return head.stdout.strip(), dirty
+
+
+def run(problems, sizes=None, warmup=2, repeat=10, output=None):
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': [],
+    }
+    print(f'{"problem":<14} {"solution":<16} {"size":>6} {"median ms":>11} {"stdev ms":>10}')
+    for problem in problems:
+        for result in measure(problem, sizes, warmup, repeat):
+            report['results'].append(result)
+            print(
+                f'{problem:<14} {result["solution"]:<16} {result["size"]:>6} '
+                f'{result["median"] * 1000:>11.3f} {result["stdev"] * 1000:>10.3f}'
+            )
+    if output:
+        with open(output, 'w') as fh:
+            json.dump(report, fh, indent=4)
+    return report
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Returns the rows (problem, solution, size, baseline median, median,
+    ratio) of the timings in both reports and the regressions among them.
+    """
+    def key(result):
+        return result['problem'], result['solution'], result['size']
+
+    baseline_medians = {key(r): r['median'] for r in baseline['results']}
+    rows = []
+    regressions = []
+    for result in current['results']:
+        if key(result) not in baseline_medians:
+            continue
+        old = baseline_medians[key(result)]
+        ratio = result['median'] / old if old else float('inf')
+        row = (*key(result), old, result['median'], ratio)
+        rows.append(row)
+        if ratio > 1 + threshold:
+            regressions.append(row)
+    return rows, regressions
+
+
+class TestCase(unittest.TestCase):
+
+    def test_discover(self):
+        self.assertEqual(
+            list(discover(os.path.join(LEETCODE_DIR, 'valid_sudoku'))),
+            ['solution_one', 'solution_three', 'solution_two']
+        )
+
+    def test_variants_agree(self):
+        for problem in PROBLEMS:
+            with self.subTest(problem=problem):
+                self.assertEqual(check(problem, seeds=5), [])
+
+    def test_disagreement(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            problem_dir = os.path.join(tmp_dir, 'rotate_image')
+            os.mkdir(problem_dir)
+            with open(os.path.join(problem_dir, 'solution_one.py'), 'w') as fh:
+                fh.write(
+                    'def rotate_ninety_degree_clockwise(matrix):\n'
+                    '    matrix[:] = [list(row) for row in zip(*matrix[::-1])]\n'
+                )
+            with open(os.path.join(problem_dir, 'solution_two.py'), 'w') as fh:
+                fh.write('def rotate_ninety_degree_clockwise(matrix):\n    pass\n')
+            disagreements = check('rotate_image', 2, problem_dir)
+        self.assertEqual(
+            [name for _, _, name, _ in disagreements], ['solution_two'] * 4
+        )
+
+    def test_compare(self):
+        baseline = {'results': [
+            {'problem': 'p', 'solution': 's', 'size': 1, 'median': 1.0},
+            {'problem': 'p', 'solution': 's', 'size': 2, 'median': 1.0},
+        ]}
+        current = {'results': [
+            {'problem': 'p', 'solution': 's', 'size': 1, 'median': 1.05},
+            {'problem': 'p', 'solution': 's', 'size': 2, 'median': 1.5},
+            {'problem': 'p', 'solution': 'new', 'size': 1, 'median': 9.0},
+        ]}
+        rows, regressions = compare(baseline, current)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(regressions, [('p', 's', 2, 1.0, 1.5, 1.5)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    check_parser = subparsers.add_parser('check')
+    check_parser.add_argument('problems', nargs='*', default=list(PROBLEMS))
+    check_parser.add_argument('--seeds', type=int, default=100)
+
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('problems', nargs='*', default=list(PROBLEMS))
+    run_parser.add_argument('--sizes', type=int, nargs='+')
+    run_parser.add_argument('--warmup', type=int, default=2)
+    run_parser.add_argument('--repeat', type=int, default=10)
+    run_parser.add_argument('--output', help='a JSON file for the results')
+
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='the allowed relative growth of a median time'
+    )
+
+    args = parser.parse_args()
+    if args.command == 'check':
+        failed = False
+        for problem in args.problems:
+            disagreements = check(problem, args.seeds)
+            for seed, size, name, reference in disagreements:
+                print(f'{problem}: {name} differs from {reference}, seed {seed}, size {size}')
+            print(f'{problem}: {len(disagreements)} disagreements')
+            failed = failed or bool(disagreements)
+        sys.exit(1 if failed else 0)
+
+    elif args.command == 'run':
+        run(args.problems, args.sizes, args.warmup, args.repeat, args.output)
+
+    elif args.command == 'compare':
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        with open(args.current) as fh:
+            current = json.load(fh)
+        rows, regressions = compare(baseline, current, args.threshold)
+        for problem, name, size, old, new, ratio in rows:
+            mark = ' REGRESSION' if ratio > 1 + args.threshold else ''
+            print(
+                f'{problem:<14} {name:<16} {size:>6} {old * 1000:>10.3f} '
+                f'{new * 1000:>10.3f} {ratio:>6.2f}x{mark}'
+            )
+        sys.exit(1 if regressions else 0)
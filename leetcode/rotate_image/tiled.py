@@ -0,0 +1,240 @@
+"""
+Rotates NumPy arrays, buffer protocol objects and memory mapped .npy files
+clockwise by 90, 180 or 270 degrees, tile by tile.
+
+The first two axes are the rows and the columns, the other axes, e.g. the
+channels of an image, move with their pixel. A square array is rotated in
+place: 90 degrees is a transpose and a reverse of every row, 270 degrees
+a transpose and a reverse of the row order. The transpose swaps pairs of
+tiles, so both passes touch only two tiles at a time. A non-square array
+is written into an out buffer tile by tile.
+
+    python tiled.py image.npy rotated.npy --degrees 90
+    python tiled.py image.npy --degrees 180 --in-place
+"""
+import os
+import argparse
+import tempfile
+import unittest
+
+import numpy as np
+
+
+TILE = 256
+
+
+def as_array(buffer) -> np.ndarray:
+    """A view of an array or of a buffer protocol object, never a copy."""
+    array = buffer if isinstance(buffer, np.ndarray) else np.asarray(buffer)
+    if array.ndim < 2:
+        raise ValueError(f'Expected at least 2 dimensions, got {array.shape}')
+    if not isinstance(buffer, np.ndarray) and not np.shares_memory(
+            array, np.asarray(buffer)
+    ):
+        raise ValueError('The buffer cannot be viewed as an array')
+    return array
+
+
+def quarter_turns(degrees):
+    if degrees % 90:
+        raise ValueError(f'Degrees must be a multiple of 90, got {degrees}')
+    return degrees // 90 % 4
+
+
+def rotated_shape(shape, k):
+    return (shape[1], shape[0], *shape[2:]) if k % 2 else tuple(shape)
+
+
+def tiles(size, tile):
+    return [(start, min(start + tile, size)) for start in range(0, size, tile)]
+
+
+def transpose_in_place(a: np.ndarray, tile=TILE):
+    """Swaps the tiles above the diagonal with the ones below it."""
+    blocks = tiles(len(a), tile)
+    for bi, (i0, i1) in enumerate(blocks):
+        diagonal = a[i0:i1, i0:i1]
+        diagonal[...] = diagonal.swapaxes(0, 1).copy()
+        for j0, j1 in blocks[bi + 1:]:
+            upper = a[i0:i1, j0:j1].copy()
+            a[i0:i1, j0:j1] = a[j0:j1, i0:i1].swapaxes(0, 1)
+            a[j0:j1, i0:i1] = upper.swapaxes(0, 1)
+
+
+def reverse_columns(a: np.ndarray, tile=TILE):
+    """Reverses every row, a band of rows at a time."""
+    for i0, i1 in tiles(len(a), tile):
+        a[i0:i1] = a[i0:i1, ::-1].copy()
+
+
+def reverse_rows(a: np.ndarray, tile=TILE):
+    """Reverses the order of the rows, swapping bands from both ends."""
+    n = len(a)
+    for i0, i1 in tiles(n // 2, tile):
+        top = a[i0:i1].copy()
+        a[i0:i1] = a[n - i1:n - i0][::-1]
+        a[n - i1:n - i0] = top[::-1]
+
+
+def rotate_in_place(a: np.ndarray, k, tile=TILE):
+    if a.shape[0] != a.shape[1]:
+        raise ValueError(f'Only a square array rotates in place, got {a.shape}')
+    if k == 1:
+        transpose_in_place(a, tile)
+        reverse_columns(a, tile)
+    elif k == 2:
+        reverse_rows(a, tile)
+        reverse_columns(a, tile)
+    elif k == 3:
+        transpose_in_place(a, tile)
+        reverse_rows(a, tile)
+
+
+def rotate_into(a: np.ndarray, out: np.ndarray, k, tile=TILE):
+    """Writes every tile of a into its place in out."""
+    if np.shares_memory(a, out):
+        raise ValueError('out must not overlap the array')
+    h, w = a.shape[:2]
+    for i0, i1 in tiles(h, tile):
+        for j0, j1 in tiles(w, tile):
+            block = a[i0:i1, j0:j1]
+            if k == 0:
+                out[i0:i1, j0:j1] = block
+            elif k == 1:
+                out[j0:j1, h - i1:h - i0] = block.swapaxes(0, 1)[:, ::-1]
+            elif k == 2:
+                out[h - i1:h - i0, w - j1:w - j0] = block[::-1, ::-1]
+            else:
+                out[w - j1:w - j0, i0:i1] = block.swapaxes(0, 1)[::-1]
+
+
+def rotate(buffer, degrees=90, out=None, tile=TILE):
+    """
+    Rotates clockwise like `np.rot90(a, -degrees // 90)`. Without out a
+    square array is rotated in place and returned, a non-square one is
+    rotated into a new array.
+    >>> rotate(np.arange(6).reshape(2, 3))
+    array([[3, 0],
+           [4, 1],
+           [5, 2]])
+    """
+    a = as_array(buffer)
+    k = quarter_turns(degrees)
+    if out is None:
+        if a.shape[0] == a.shape[1]:
+            rotate_in_place(a, k, tile)
+            return a
+        out = np.empty(rotated_shape(a.shape, k), dtype=a.dtype)
+
+    out_array = as_array(out)
+    if out_array.shape != rotated_shape(a.shape, k) or out_array.dtype != a.dtype:
+        raise ValueError(
+            f'out must be {rotated_shape(a.shape, k)} {a.dtype}, '
+            f'got {out_array.shape} {out_array.dtype}'
+        )
+    rotate_into(a, out_array, k, tile)
+    return out_array
+
+
+def rotate_file(path, out_path=None, degrees=90, tile=TILE):
+    """
+    Rotates a .npy file through memory maps, so only a few tiles are in
+    memory at a time. Without out_path a square array is rotated in the
+    file itself.
+    """
+    k = quarter_turns(degrees)
+    if out_path is None:
+        a = np.load(path, mmap_mode='r+')
+        rotate_in_place(a, k, tile)
+        a.flush()
+        return
+
+    a = np.load(path, mmap_mode='r')
+    out = np.lib.format.open_memmap(
+        out_path, mode='w+', dtype=a.dtype, shape=rotated_shape(a.shape, k)
+    )
+    rotate_into(a, out, k, tile)
+    out.flush()
+
+
+class TestCase(unittest.TestCase):
+
+    def arrays(self):
+        rng = np.random.default_rng(0)
+        yield rng.integers(0, 255, (13, 13), dtype=np.uint8)
+        yield rng.random((16, 16))
+        yield rng.random((9, 9, 3)).astype(np.float32)
+        yield (rng.random((11, 11)) + 1j).astype(np.complex128)
+        yield rng.integers(0, 1000, (7, 12, 2), dtype=np.int64)
+        yield np.zeros((5, 3), dtype=[('r', 'u1'), ('g', 'f4')])
+
+    def test_same_as_rot90(self):
+        for a in self.arrays():
+            for degrees in [0, 90, 180, 270, -90, 450]:
+                for tile in [1, 4, 256]:
+                    with self.subTest(shape=a.shape, degrees=degrees, tile=tile):
+                        expected = np.rot90(a, -(degrees // 90))
+                        out = np.empty_like(expected)
+                        self.assertIs(rotate(a, degrees, out, tile), out)
+                        np.testing.assert_array_equal(out, expected)
+
+                        b = a.copy()
+                        result = rotate(b, degrees, tile=tile)
+                        np.testing.assert_array_equal(result, expected)
+                        if a.shape[0] == a.shape[1]:
+                            self.assertIs(result, b)
+
+    def test_same_as_solution_one(self):
+        from solution_one import rotate_ninety_degree_clockwise
+
+        matrix = np.arange(49).reshape(7, 7)
+        expected = matrix.tolist()
+        rotate_ninety_degree_clockwise(expected)
+        self.assertEqual(rotate(matrix, tile=3).tolist(), expected)
+
+    def test_memoryview(self):
+        data = bytearray(range(16))
+        view = memoryview(data).cast('B', (4, 4))
+        expected = np.rot90(np.arange(16, dtype=np.uint8).reshape(4, 4), -1)
+        rotate(view, tile=3)
+        np.testing.assert_array_equal(np.frombuffer(data, np.uint8).reshape(4, 4), expected)
+
+        out = bytearray(16)
+        rotate(memoryview(bytes(range(16))).cast('B', (4, 4)), 270,
+               memoryview(out).cast('B', (4, 4)))
+        np.testing.assert_array_equal(
+            np.frombuffer(out, np.uint8).reshape(4, 4), np.rot90(expected, 2)
+        )
+
+    def test_overlapping_out(self):
+        a = np.zeros((4, 4))
+        with self.assertRaises(ValueError):
+            rotate(a, 90, out=a.T)
+
+    def test_rotate_file(self):
+        a = np.arange(30 * 20 * 3, dtype=np.uint16).reshape(30, 20, 3)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'a.npy')
+            out_path = os.path.join(tmp_dir, 'b.npy')
+            np.save(path, a)
+            rotate_file(path, out_path, 90, tile=8)
+            np.testing.assert_array_equal(np.load(out_path), np.rot90(a, -1))
+
+            np.save(path, a[:20])
+            rotate_file(path, None, 270, tile=8)
+            np.testing.assert_array_equal(np.load(path), np.rot90(a[:20], 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='a .npy file')
+    parser.add_argument('out_path', nargs='?', help='the rotated .npy file')
+    parser.add_argument('--degrees', type=int, default=90)
+    parser.add_argument('--tile', type=int, default=TILE)
+    parser.add_argument(
+        '--in-place', action='store_true', help='rotate a square array in its file'
+    )
+    args = parser.parse_args()
+    if bool(args.out_path) == args.in_place:
+        parser.error('give either out_path or --in-place')
+    rotate_file(args.path, args.out_path, args.degrees, args.tile)
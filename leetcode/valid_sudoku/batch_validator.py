@@ -0,0 +1,245 @@
+"""
+Validates many sudoku boards at once.
+
+The boards are an (N, n, n) uint8 array with 0 for an empty cell and
+1..n for the digits, n = 9 for the usual boards and any square number in
+general. A packed text file has a board per line of n * n characters: '.'
+or '0' for an empty cell and '1'..'9', 'A'..'Z' for the digits.
+
+    python batch_validator.py boards.txt
+"""
+import os
+import math
+import argparse
+import tempfile
+import itertools
+import unittest
+
+from typing import List
+
+import numpy as np
+
+
+EMPTY_CHARS = b'.0'
+DIGIT_CHARS = b'123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# The boards are checked a chunk at a time to bound the temporary arrays.
+CHUNK_BOARDS = 1 << 16
+
+
+def board_side(boards: np.ndarray):
+    if boards.ndim != 3 or boards.shape[1] != boards.shape[2]:
+        raise ValueError(f'Boards must be (N, n, n), got {boards.shape}')
+    n = boards.shape[1]
+    box = math.isqrt(n)
+    if box * box != n:
+        raise ValueError(f'The side of a board must be a square, got {n}')
+    return n, box
+
+
+def digit_bits(n):
+    """The lookup table of the bit of every digit, 0 for an empty cell."""
+    for dtype in (np.uint16, np.uint32, np.uint64):
+        # The sum of the bits of a unit must not overflow.
+        if n << (n - 1) < np.iinfo(dtype).max:
+            break
+    else:
+        raise ValueError(f'Boards up to 49 x 49 are supported, got {n}')
+    return np.array([0] + [1 << digit for digit in range(n)], dtype=dtype)
+
+
+def unit_conflicts(boards: np.ndarray, box: int) -> np.ndarray:
+    """
+    (N, 3 * n) booleans: if the rows, then the columns, then the boxes of
+    every board repeat a digit. The boxes go row by row. The bits of the
+    digits of a unit add up to their bitwise or only when every digit is
+    different.
+    """
+    num_boards, n, _ = boards.shape
+    bits = digit_bits(n)[boards]
+    boxes = bits.reshape(num_boards, box, box, box, box).swapaxes(2, 3).reshape(
+        num_boards, n, n
+    )
+    return np.concatenate([
+        units.sum(axis=2, dtype=bits.dtype) != np.bitwise_or.reduce(units, axis=2)
+        for units in (bits, bits.swapaxes(1, 2), boxes)
+    ], axis=1)
+
+
+def validate_boards(boards, chunk_boards=CHUNK_BOARDS):
+    """
+    Returns (valid, first_conflict): if every board is valid and the first
+    unit with a repeated digit, rows 0..n-1, columns n..2n-1 and boxes
+    2n..3n-1, -1 for a valid board.
+    """
+    boards = np.asarray(boards, dtype=np.uint8)
+    n, box = board_side(boards)
+    if boards.size and boards.max() > n:
+        raise ValueError(f'The digits of a board must be 0..{n}')
+
+    first_conflict = np.empty(len(boards), dtype=np.int16)
+    for start in range(0, len(boards), chunk_boards):
+        conflicts = unit_conflicts(boards[start:start + chunk_boards], box)
+        first = conflicts.argmax(axis=1)
+        first[~conflicts.any(axis=1)] = -1
+        first_conflict[start:start + chunk_boards] = first
+    return first_conflict == -1, first_conflict
+
+
+def char_table():
+    table = np.full(256, 255, dtype=np.uint8)
+    for char in EMPTY_CHARS:
+        table[char] = 0
+    for digit, char in enumerate(DIGIT_CHARS, 1):
+        table[char] = table[ord(chr(char).lower())] = digit
+    return table
+
+
+CHAR_TABLE = char_table()
+
+
+def parse_boards(lines: List[bytes]) -> np.ndarray:
+    """
+    >>> parse_boards([b'..3...1.12..2...'])[0]
+    array([[0, 0, 3, 0],
+           [0, 0, 1, 0],
+           [1, 2, 0, 0],
+           [2, 0, 0, 0]], dtype=uint8)
+    """
+    lines = [line.strip() for line in lines]
+    width = len(lines[0])
+    n = math.isqrt(width)
+    if n * n != width or n < 4 or any(len(line) != width for line in lines):
+        raise ValueError(
+            f'Boards must be lines of n * n characters, got {width}'
+        )
+    boards = CHAR_TABLE[np.frombuffer(b''.join(lines), dtype=np.uint8)]
+    if (boards == 255).any():
+        raise ValueError('Boards have unknown characters')
+    return boards.reshape(len(lines), n, n)
+
+
+def read_boards(path, chunk_boards=CHUNK_BOARDS):
+    """Yields the boards of a packed text file a chunk at a time."""
+    with open(path, 'rb') as fh:
+        lines = (line for line in fh if line.strip())
+        while True:
+            chunk = list(itertools.islice(lines, chunk_boards))
+            if not chunk:
+                return
+            yield parse_boards(chunk)
+
+
+def validate_file(path, chunk_boards=CHUNK_BOARDS):
+    results = [
+        validate_boards(boards, chunk_boards)
+        for boards in read_boards(path, chunk_boards)
+    ]
+    if not results:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int16)
+    return (
+        np.concatenate([valid for valid, _ in results]),
+        np.concatenate([first for _, first in results])
+    )
+
+
+def unit_name(unit, n=9):
+    """
+    >>> unit_name(0), unit_name(10), unit_name(26)
+    ('row 0', 'col 1', 'box 8')
+    """
+    kind, index = divmod(int(unit), n)
+    return f'{("row", "col", "box")[kind]} {index}'
+
+
+class TestCase(unittest.TestCase):
+
+    def random_boards(self, num_boards, n=9, seed=0):
+        """Shuffled valid boards with a few cells changed."""
+        rng = np.random.default_rng(seed)
+        box = math.isqrt(n)
+        r = np.arange(n)
+        # The pattern of a solved board.
+        solved = (box * (r[:, None] % box) + r[:, None] // box + r) % n + 1
+        boards = np.empty((num_boards, n, n), dtype=np.uint8)
+        for i in range(num_boards):
+            board = rng.permutation(n + 1)[1:][solved - 1]
+            board[rng.random((n, n)) < 0.6] = 0
+            for _ in range(rng.integers(0, 3)):
+                board[rng.integers(0, n), rng.integers(0, n)] = rng.integers(
+                    0, n + 1
+                )
+            boards[i] = board
+        return boards
+
+    def test_same_as_solution_three(self):
+        from solution_three import is_valid_sudoku
+
+        boards = self.random_boards(2000)
+        valid, first_conflict = validate_boards(boards, chunk_boards=300)
+        self.assertTrue(0 < valid.sum() < len(boards))
+        for board, is_valid in zip(boards, valid):
+            self.assertEqual(is_valid, is_valid_sudoku(
+                [[str(cell) if cell else '.' for cell in row] for row in board]
+            ))
+        self.assertTrue((valid == (first_conflict == -1)).all())
+
+    def test_first_conflict(self):
+        board = np.zeros((9, 9), dtype=np.uint8)
+        board[4, 1] = board[4, 7] = 5
+        board[0, 2] = board[8, 2] = 3
+        board[6, 6] = board[8, 8] = 9
+        boards = np.stack([board, board.T, np.zeros_like(board)])
+        self.assertEqual(validate_boards(boards)[1].tolist(), [4, 2, -1])
+        board[4, 7] = 0
+        self.assertEqual(validate_boards(board[None])[1].tolist(), [11])
+
+    def test_boards_of_every_size(self):
+        for n in [4, 16, 25, 36, 49]:
+            with self.subTest(n=n):
+                boards = self.random_boards(20, n=n, seed=n)
+                valid, _ = validate_boards(boards)
+                for board, is_valid in zip(boards, valid):
+                    units = [
+                        *board, *board.T,
+                        *board.reshape(
+                            math.isqrt(n), math.isqrt(n), math.isqrt(n), -1
+                        ).swapaxes(1, 2).reshape(n, n)
+                    ]
+                    digits = [unit[unit > 0].tolist() for unit in units]
+                    self.assertEqual(is_valid, all(
+                        len(set(unit)) == len(unit) for unit in digits
+                    ))
+
+    def test_16x16_boards_from_file(self):
+        boards = self.random_boards(50, n=16)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'boards.txt')
+            with open(path, 'wb') as fh:
+                for board in boards:
+                    fh.write(b''.join(
+                        DIGIT_CHARS[cell - 1:cell] if cell else b'.'
+                        for cell in board.ravel().tolist()
+                    ) + b'\n')
+            valid, first_conflict = validate_file(path, chunk_boards=7)
+        np.testing.assert_array_equal(
+            first_conflict, validate_boards(boards)[1]
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='a packed text file of boards')
+    parser.add_argument('--chunk-boards', type=int, default=CHUNK_BOARDS)
+    parser.add_argument(
+        '--show-invalid', type=int, default=10, metavar='N',
+        help='print the first conflict of up to N invalid boards'
+    )
+    args = parser.parse_args()
+
+    valid, first_conflict = validate_file(args.path, args.chunk_boards)
+    print(f'{valid.sum()} of {len(valid)} boards are valid')
+    invalid = np.flatnonzero(~valid)[:args.show_invalid]
+    with open(args.path, 'rb') as fh:
+        n = math.isqrt(len(fh.readline().strip()))
+    for i in invalid.tolist():
+        print(f'board {i}: {unit_name(first_conflict[i], n)}')
@@ -0,0 +1,324 @@
+"""
+Solves sudoku boards of any n x n size with n a square number.
+
+The digits of the rows, columns and boxes are kept in bitmasks like in
+solution_two, the bit of the digit v is 1 << v. A placed digit is recorded
+on a trail, so a dead end of the search is undone by popping the trail
+instead of copying the board. Every node of the search places the naked
+singles, the cells with one candidate, and the hidden singles, the
+digits with one place left in a unit, then branches on the empty cell
+with the fewest candidates.
+
+    python solver.py puzzles.txt --jobs 4 --output solutions.txt
+"""
+import os
+import sys
+import math
+import argparse
+import unittest
+import concurrent.futures
+
+from typing import List, Optional
+
+import numpy as np
+
+from batch_validator import DIGIT_CHARS, EMPTY_CHARS, validate_boards
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+class Grid:
+    """The cells of a board in a flat list, 0 for an empty cell."""
+
+    def __init__(self, cells: List[int]):
+        n = math.isqrt(len(cells))
+        box = math.isqrt(n)
+        if n * n != len(cells) or box * box != n:
+            raise ValueError(f'A board must have n**4 cells, got {len(cells)}')
+        self.n = n
+        self.full = ((1 << n) - 1) << 1
+        self.cells = list(cells)
+        self.row_of = [i // n for i in range(n * n)]
+        self.col_of = [i % n for i in range(n * n)]
+        self.block_of = [
+            box * (i // n // box) + i % n // box for i in range(n * n)
+        ]
+        self.units = (
+            [[r * n + c for c in range(n)] for r in range(n)] +
+            [[r * n + c for r in range(n)] for c in range(n)] +
+            [
+                [
+                    (box * (b // box) + r) * n + box * (b % box) + c
+                    for r in range(box) for c in range(box)
+                ]
+                for b in range(n)
+            ]
+        )
+
+        self.rows_mask = [0] * n
+        self.cols_mask = [0] * n
+        self.blocks_mask = [0] * n
+        self.trail = []
+        self.nodes = 0
+        self.valid = True
+        for cell, value in enumerate(cells):
+            if value:
+                self.cells[cell] = 0
+                if not self.candidates(cell) & 1 << value:
+                    self.valid = False
+                self.place(cell, value)
+        self.trail = []
+
+    def candidates(self, cell):
+        return self.full & ~(
+            self.rows_mask[self.row_of[cell]] |
+            self.cols_mask[self.col_of[cell]] |
+            self.blocks_mask[self.block_of[cell]]
+        )
+
+    def place(self, cell, value):
+        bit = 1 << value
+        self.cells[cell] = value
+        self.rows_mask[self.row_of[cell]] |= bit
+        self.cols_mask[self.col_of[cell]] |= bit
+        self.blocks_mask[self.block_of[cell]] |= bit
+        self.trail.append(cell)
+
+    def undo(self, trail_length):
+        while len(self.trail) > trail_length:
+            cell = self.trail.pop()
+            bit = ~(1 << self.cells[cell])
+            self.cells[cell] = 0
+            self.rows_mask[self.row_of[cell]] &= bit
+            self.cols_mask[self.col_of[cell]] &= bit
+            self.blocks_mask[self.block_of[cell]] &= bit
+
+    def propagate(self):
+        """
+        Places the singles until there are none, False on a contradiction:
+        a cell without candidates or a digit without a place in a unit.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for cell in range(len(self.cells)):
+                if self.cells[cell]:
+                    continue
+                candidates = self.candidates(cell)
+                if not candidates:
+                    return False
+                if not candidates & (candidates - 1):
+                    self.place(cell, candidates.bit_length() - 1)
+                    changed = True
+
+            for unit in self.units:
+                once = twice = placed = 0
+                for cell in unit:
+                    if self.cells[cell]:
+                        placed |= 1 << self.cells[cell]
+                        continue
+                    candidates = self.candidates(cell)
+                    twice |= once & candidates
+                    once |= candidates
+                if once | placed != self.full:
+                    return False
+                hidden = once & ~twice & ~placed
+                while hidden:
+                    bit = hidden & -hidden
+                    hidden ^= bit
+                    for cell in unit:
+                        if not self.cells[cell] and self.candidates(cell) & bit:
+                            self.place(cell, bit.bit_length() - 1)
+                            changed = True
+                            break
+                    else:
+                        # The cell was taken by a hidden single before.
+                        return False
+        return True
+
+    def most_constrained_cell(self):
+        """The empty cell with the fewest candidates, None if solved."""
+        best = None
+        best_count = self.n + 1
+        for cell in range(len(self.cells)):
+            if self.cells[cell]:
+                continue
+            count = popcount(self.candidates(cell))
+            if count < best_count:
+                best, best_count = cell, count
+                if count <= 2:
+                    break
+        return best
+
+    def search(self):
+        self.nodes += 1
+        trail_length = len(self.trail)
+        if not self.propagate():
+            self.undo(trail_length)
+            return False
+
+        cell = self.most_constrained_cell()
+        if cell is None:
+            return True
+        candidates = self.candidates(cell)
+        while candidates:
+            bit = candidates & -candidates
+            candidates ^= bit
+            branch_length = len(self.trail)
+            self.place(cell, bit.bit_length() - 1)
+            if self.search():
+                return True
+            self.undo(branch_length)
+
+        self.undo(trail_length)
+        return False
+
+    def solve(self):
+        return self.valid and self.search()
+
+
+def solve_sudoku(board: List[List[str]]) -> bool:
+    """Fills the board in place, False if it has no solution."""
+    grid = Grid([
+        0 if cell == '.' else DIGIT_CHARS.index(cell.encode()) + 1
+        for row in board for cell in row
+    ])
+    if not grid.solve():
+        return False
+    for r, row in enumerate(board):
+        for c in range(len(row)):
+            row[c] = chr(DIGIT_CHARS[grid.cells[r * grid.n + c] - 1])
+    return True
+
+
+def parse_line(line: str) -> List[int]:
+    return [
+        0 if char in EMPTY_CHARS else DIGIT_CHARS.index(char) + 1
+        for char in line.strip().upper().encode()
+    ]
+
+
+def solve_line(line: str):
+    """Returns (solution line or None, nodes) of a packed board."""
+    grid = Grid(parse_line(line))
+    if not grid.solve():
+        return None, grid.nodes
+    return (
+        bytes(DIGIT_CHARS[value - 1] for value in grid.cells).decode(),
+        grid.nodes
+    )
+
+
+def solve_file(path, output=sys.stdout, jobs=1, chunksize=16):
+    """
+    Writes the solution of every board of a packed text file to the
+    output, a line of '-' for a board without a solution. With several
+    jobs the boards are solved by a process pool in chunks of chunksize.
+    Returns the number of solved boards and the nodes of the search.
+    """
+    with open(path) as fh:
+        lines = [line.strip() for line in fh if line.strip()]
+
+    if jobs == 1:
+        results = map(solve_line, lines)
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        results = executor.map(solve_line, lines, chunksize=chunksize)
+
+    solved = nodes = 0
+    try:
+        for line, (solution, line_nodes) in zip(lines, results):
+            output.write(f'{solution or "-" * len(line)}\n')
+            solved += solution is not None
+            nodes += line_nodes
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return solved, nodes
+
+
+class TestCase(unittest.TestCase):
+
+    def assertSolved(self, puzzle: str, solution: str):
+        n = math.isqrt(len(puzzle))
+        self.assertTrue(all(
+            p in '.0' or p == s for p, s in zip(puzzle, solution)
+        ))
+        board = np.array(parse_line(solution), dtype=np.uint8).reshape(1, n, n)
+        self.assertTrue((board > 0).all())
+        self.assertTrue(validate_boards(board)[0][0])
+
+    def test_leetcode_board(self):
+        from solution_two import is_valid_sudoku
+
+        board = [
+            ["5", "3", ".", ".", "7", ".", ".", ".", "."],
+            ["6", ".", ".", "1", "9", "5", ".", ".", "."],
+            [".", "9", "8", ".", ".", ".", ".", "6", "."],
+            ["8", ".", ".", ".", "6", ".", ".", ".", "3"],
+            ["4", ".", ".", "8", ".", "3", ".", ".", "1"],
+            ["7", ".", ".", ".", "2", ".", ".", ".", "6"],
+            [".", "6", ".", ".", ".", ".", "2", "8", "."],
+            [".", ".", ".", "4", "1", "9", ".", ".", "5"],
+            [".", ".", ".", ".", "8", ".", ".", "7", "9"]
+        ]
+        self.assertTrue(solve_sudoku(board))
+        self.assertTrue(is_valid_sudoku(board))
+        self.assertEqual(''.join(board[0]), '534678912')
+
+    def test_hard_puzzle(self):
+        puzzle = (
+            '8..........36......7..9.2...5...7.......457.....1...3...1....68..'
+            '85...1..9....4..'
+        )
+        solution, nodes = solve_line(puzzle)
+        self.assertSolved(puzzle, solution)
+        self.assertGreater(nodes, 1)
+
+    def test_without_solution(self):
+        for puzzle in [
+            # Two 1s in the first row.
+            '11' + '.' * 79,
+            # No digit fits the last cell of the first row.
+            '12345678.' + '.' * 8 + '9' + '.' * 63,
+        ]:
+            with self.subTest(puzzle=puzzle):
+                self.assertEqual(solve_line(puzzle)[0], None)
+
+    def test_other_sizes(self):
+        rng = np.random.default_rng(0)
+        for n in [4, 16, 25]:
+            with self.subTest(n=n):
+                box = math.isqrt(n)
+                r = np.arange(n)
+                solved = (box * (r[:, None] % box) + r[:, None] // box + r) % n
+                board = rng.permutation(n)[solved] + 1
+                board[rng.random((n, n)) < 0.5] = 0
+                puzzle = ''.join(
+                    chr(DIGIT_CHARS[v - 1]) if v else '.'
+                    for v in board.ravel().tolist()
+                )
+                solution, _ = solve_line(puzzle)
+                self.assertSolved(puzzle, solution)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='a packed text file of boards')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--chunksize', type=int, default=16)
+    parser.add_argument('--output', help='the solutions, stdout by default')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        solved, nodes = solve_file(
+            args.path, output, jobs=args.jobs, chunksize=args.chunksize
+        )
+    finally:
+        if args.output:
+            output.close()
+    print(f'{solved} boards solved, {nodes} search nodes', file=sys.stderr)
@@ -0,0 +1,88 @@
+"""
+Puzzles per second and search nodes per puzzle of the solver, on the
+hard puzzles below or on a packed text file of boards such as a local
+copy of top95.txt.
+
+    python solver_benchmark.py --repeat 5
+    python solver_benchmark.py --puzzles top95.txt --jobs 4
+"""
+import os
+import time
+import argparse
+import tempfile
+import statistics
+
+from solver import solve_file, solve_line
+
+
+# Inkala's 2012 puzzle, the first puzzles of Norvig's top95 set and a
+# puzzle built against naive backtracking.
+HARD_PUZZLES = [
+    '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+    '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......',
+    '52...6.........7.13...........4..8..6......5...........418.........3..2...87.....',
+    '6.....8.3.4.7.................5.4.7.3..2.....1.6.......2.....5.....8.6......1....',
+    '48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....',
+    '..............3.85..1.2.......5.7.....4...1...9.......5......73..2.1........4...9',
+]
+
+
+def run_sequential(puzzles, repeat):
+    print(f'{"puzzle":>6} {"nodes":>8} {"ms":>10}')
+    nodes = []
+    times = []
+    for i, puzzle in enumerate(puzzles):
+        puzzle_times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            solution, puzzle_nodes = solve_line(puzzle)
+            puzzle_times.append(time.perf_counter() - start)
+        if solution is None:
+            print(f'{i:>6} has no solution')
+        best = min(puzzle_times)
+        print(f'{i:>6} {puzzle_nodes:>8} {best * 1000:>10.2f}')
+        nodes.append(puzzle_nodes)
+        times.append(best)
+
+    print(
+        f'{len(puzzles) / sum(times):.1f} puzzles/s, '
+        f'{statistics.mean(nodes):.1f} nodes per puzzle, '
+        f'max {max(nodes)} nodes'
+    )
+
+
+def run_pool(puzzles, jobs, chunksize):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'puzzles.txt')
+        with open(path, 'w') as fh:
+            fh.write('\n'.join(puzzles) + '\n')
+        with open(os.devnull, 'w') as output:
+            start = time.perf_counter()
+            solved, nodes = solve_file(path, output, jobs, chunksize)
+            elapsed = time.perf_counter() - start
+    print(
+        f'{jobs} jobs: {solved} of {len(puzzles)} solved, '
+        f'{len(puzzles) / elapsed:.1f} puzzles/s, '
+        f'{nodes / len(puzzles):.1f} nodes per puzzle'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--puzzles', help='a packed text file of boards')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--jobs', type=int, nargs='*', default=[],
+        help='also solve all the puzzles with process pools of these sizes'
+    )
+    parser.add_argument('--chunksize', type=int, default=16)
+    args = parser.parse_args()
+
+    puzzles = HARD_PUZZLES
+    if args.puzzles:
+        with open(args.puzzles) as fh:
+            puzzles = [line.strip() for line in fh if line.strip()]
+
+    run_sequential(puzzles, args.repeat)
+    for jobs in args.jobs:
+        run_pool(puzzles, jobs, args.chunksize)
@@ -0,0 +1,817 @@
+"""
+PageRank over graphs stored as CSR arrays.
+
+A graph is loaded from an edge list file, a networkx graph or a dict of
+lists, or from a CSR directory saved earlier, whose arrays are memory
+mapped. An iteration goes over the links in chunks, so apart from the
+links themselves it needs a few vectors of the number of nodes.
+
+    python pagerank.py edges.txt --top 20
+    python pagerank.py edges.txt --save-csr graph_csr
+    python pagerank.py graph_csr --personalize 1 7 42
+
+`IncrementalPageRank` keeps the scores up to date while links are added
+and removed, a batch of changes costs the pushes around the changed
+nodes instead of a full recompute.
+"""
+import os
+import json
+import argparse
+import itertools
+import tempfile
+import unittest
+
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+DAMPING = 0.85
+# The number of links one iteration handles at a time.
+CHUNK_EDGES = 1 << 22
+
+
+class CSRGraph(NamedTuple):
+    """
+    The links of the node i are indices[indptr[i]:indptr[i + 1]], a
+    repeated link is kept repeated. nodes are the labels of the nodes, None
+    when the nodes are 0..n-1.
+    """
+    indptr: np.ndarray
+    indices: np.ndarray
+    nodes: Optional[Sequence] = None
+
+    @property
+    def num_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def num_edges(self):
+        return int(self.indptr[-1])
+
+    def out_degrees(self):
+        return np.diff(self.indptr)
+
+    def label(self, i):
+        return i if self.nodes is None else self.nodes[i]
+
+    def node_index(self):
+        return {node: i for i, node in enumerate(self.nodes)}
+
+    def chunks(self, chunk_edges=CHUNK_EDGES):
+        """
+        Splits the nodes into ranges (start, end) of about chunk_edges
+        links each. A node with more links than that is a range of its own.
+        """
+        bounds = np.searchsorted(
+            self.indptr,
+            np.arange(0, self.num_edges, chunk_edges),
+            side='right'
+        ) - 1
+        bounds = np.unique(np.append(bounds, self.num_nodes))
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def from_edges(sources, targets, num_nodes, nodes=None) -> CSRGraph:
+    """
+    >>> graph = from_edges(np.array([2, 0, 0]), np.array([0, 2, 1]), 3)
+    >>> graph.indptr, graph.indices
+    (array([0, 2, 2, 3]), array([2, 1, 0]))
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    # A stable sort keeps the links of a node in the order of the input.
+    order = np.argsort(sources, kind='stable')
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    indices = np.asarray(targets, dtype=np.int64)[order]
+    return CSRGraph(indptr, indices, nodes)
+
+
+def from_adjacency(graph, nodes=None) -> CSRGraph:
+    """A dict of lists of links, nodes fixes the order of the nodes."""
+    nodes = list(graph) if nodes is None else list(nodes)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    degrees = np.array(
+        [len(graph.get(node, ())) for node in nodes], dtype=np.int64
+    )
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.fromiter(
+        (node_index[link] for node in nodes for link in graph.get(node, ())),
+        dtype=np.int64,
+        count=indptr[-1]
+    )
+    return CSRGraph(indptr, indices, nodes)
+
+
+def from_networkx(graph) -> CSRGraph:
+    """An undirected graph links both ways, a multigraph repeats links."""
+    nodes = list(graph)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    edges = graph.edges() if graph.is_directed() else itertools.chain(
+        graph.edges(), ((v, u) for u, v in graph.edges() if u != v)
+    )
+    pairs = np.fromiter(
+        (i for u, v in edges for i in (node_index[u], node_index[v])),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    return from_edges(pairs[:, 0], pairs[:, 1], len(nodes), nodes)
+
+
+def load_edge_list(path, integer_ids=True, chunk_lines=1 << 20) -> CSRGraph:
+    """
+    Reads a text file of `source target` lines, lines starting with #
+    are comments. With integer_ids the nodes are 0..max id and the lines
+    are parsed in chunks by NumPy, otherwise the nodes are the labels in
+    the order they appear.
+    """
+    sources = []
+    targets = []
+    node_index = {}
+    with open(path) as fh:
+        lines = (line for line in fh if line.strip() and line[0] != '#')
+        while True:
+            chunk = list(itertools.islice(lines, chunk_lines))
+            if not chunk:
+                break
+            if integer_ids:
+                pairs = np.loadtxt(
+                    chunk, dtype=np.int64, usecols=(0, 1), ndmin=2
+                )
+            else:
+                pairs = np.array([
+                    [
+                        node_index.setdefault(label, len(node_index))
+                        for label in line.split()[:2]
+                    ]
+                    for line in chunk
+                ], dtype=np.int64)
+            sources.append(pairs[:, 0])
+            targets.append(pairs[:, 1])
+
+    sources = np.concatenate(sources) if sources else np.zeros(0, np.int64)
+    targets = np.concatenate(targets) if targets else np.zeros(0, np.int64)
+    if integer_ids:
+        num_nodes = int(max(sources.max(initial=-1), targets.max(initial=-1))) + 1
+        return from_edges(sources, targets, num_nodes)
+    return from_edges(sources, targets, len(node_index), list(node_index))
+
+
+def save_csr(graph: CSRGraph, csr_dir):
+    os.makedirs(csr_dir, exist_ok=True)
+    np.save(os.path.join(csr_dir, 'indptr.npy'), graph.indptr)
+    np.save(os.path.join(csr_dir, 'indices.npy'), graph.indices)
+    if graph.nodes is not None:
+        with open(os.path.join(csr_dir, 'nodes.json'), 'w') as fh:
+            json.dump(list(graph.nodes), fh)
+
+
+def load_csr(csr_dir, mmap=True) -> CSRGraph:
+    """The links are memory mapped, so they are read chunk by chunk."""
+    mmap_mode = 'r' if mmap else None
+    indptr = np.load(os.path.join(csr_dir, 'indptr.npy'), mmap_mode=mmap_mode)
+    indices = np.load(os.path.join(csr_dir, 'indices.npy'), mmap_mode=mmap_mode)
+    nodes = None
+    nodes_path = os.path.join(csr_dir, 'nodes.json')
+    if os.path.exists(nodes_path):
+        with open(nodes_path) as fh:
+            nodes = json.load(fh)
+    return CSRGraph(indptr, indices, nodes)
+
+
+def load_graph(path, integer_ids=True) -> CSRGraph:
+    if os.path.isdir(path):
+        return load_csr(path)
+    return load_edge_list(path, integer_ids=integer_ids)
+
+
+def teleport_vector(graph: CSRGraph, weights=None, dtype=np.float64):
+    """
+    weights is None for the uniform vector, an array of the number of
+    nodes or a dict {node: weight} of the labels of the nodes.
+    """
+    n = graph.num_nodes
+    if weights is None:
+        return np.full(n, 1 / n, dtype=dtype)
+
+    if isinstance(weights, dict):
+        vector = np.zeros(n, dtype=dtype)
+        node_index = graph.node_index() if graph.nodes is not None else None
+        for node, weight in weights.items():
+            vector[node if node_index is None else node_index[node]] = weight
+    else:
+        vector = np.array(weights, dtype=dtype)
+    total = vector.sum()
+    if vector.shape != (n,) or total <= 0 or (vector < 0).any():
+        raise ValueError('Teleport weights must be non negative, not all zero')
+    return vector / total
+
+
+def inverse_degrees(graph: CSRGraph, dtype=np.float64):
+    """1 / out degree, 0 for the nodes without links."""
+    degrees = graph.out_degrees()
+    with np.errstate(divide='ignore'):
+        return np.where(degrees == 0, 0, 1 / degrees).astype(dtype)
+
+
+def link_sums(graph: CSRGraph, scaled, chunks, dtype=np.float64):
+    """The sum of scaled[source] over the links into every node."""
+    n = graph.num_nodes
+    sums = np.zeros(n, dtype=dtype)
+    for start, end in chunks:
+        lo, hi = int(graph.indptr[start]), int(graph.indptr[end])
+        if lo == hi:
+            continue
+        weights = np.repeat(
+            scaled[start:end], np.diff(graph.indptr[start:end + 1])
+        )
+        sums += np.bincount(
+            graph.indices[lo:hi], weights=weights, minlength=n
+        ).astype(dtype, copy=False)
+    return sums
+
+
+def pagerank(
+        graph: CSRGraph,
+        alpha=DAMPING,
+        personalization=None,
+        dangling=None,
+        tol=1e-8,
+        max_iter=1000,
+        chunk_edges=CHUNK_EDGES,
+        dtype=np.float64
+):
+    """
+    With probability alpha the surfer follows a random link, otherwise it
+    teleports by the personalization vector. A surfer on a node without
+    links teleports by the dangling vector, personalization by default.
+    Stops when the L1 change of the scores is below tol. Unlike networkx
+    tol is not multiplied by the number of nodes, which on a large graph
+    would stop after the first iteration. float32 halves the memory of the
+    vectors.
+    """
+    n = graph.num_nodes
+    if n == 0:
+        return np.zeros(0, dtype=dtype)
+
+    teleport = teleport_vector(graph, personalization, dtype)
+    dangling_weights = (
+        teleport if dangling is None else teleport_vector(graph, dangling, dtype)
+    )
+    is_dangling = graph.out_degrees() == 0
+    inv_degrees = inverse_degrees(graph, dtype)
+    chunks = graph.chunks(chunk_edges)
+
+    x = teleport.copy()
+    for _ in range(max_iter):
+        next_x = link_sums(graph, x * inv_degrees, chunks, dtype)
+        next_x *= alpha
+        next_x += (alpha * x[is_dangling].sum()) * dangling_weights
+        next_x += (1 - alpha) * teleport
+
+        err = np.abs(next_x - x).sum()
+        x = next_x
+        if err < tol:
+            return x
+    raise RuntimeError(f'PageRank did not converge in {max_iter} iterations')
+
+
+def top_nodes(graph: CSRGraph, scores, k=10):
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k] if k else np.zeros(0, np.int64)
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [(graph.label(i), float(scores[i])) for i in best.tolist()]
+
+
+def link_positions(indptr, nodes):
+    """The positions of the links of the nodes in indices, concatenated."""
+    starts = np.asarray(indptr[nodes])
+    lengths = np.asarray(indptr[nodes + 1]) - starts
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(int(lengths.sum())) + offsets, lengths
+
+
+def snapshot_csr_dir(path):
+    """
+    Where a snapshot keeps its compacted graph.
+    >>> snapshot_csr_dir('ranks/scores.npz'), snapshot_csr_dir('scores')
+    ('ranks/scores_csr', 'scores_csr')
+    """
+    path = str(path)
+    if path.endswith('.npz'):
+        path = path[:-len('.npz')]
+    return f'{path}_csr'
+
+
+class IncrementalPageRank:
+    """
+    PageRank of a graph whose links change, by pushing residuals. Besides
+    the scores x it keeps the residual
+
+        r = (1 - alpha) v + alpha P^T x + alpha (x of the dangling nodes) d - x
+
+    which is 0 at the PageRank. Changing the links of u changes r only at
+    the old and new targets of u, by alpha x_u / degree. Pushing r_u adds
+    it to x_u and alpha r_u / degree to r of the targets of u, all the
+    nodes above tol / (2 n) are pushed at once until none is left. A
+    dangling node pushes to every node by d, so that part of r is kept as
+    one number and spread only once it reaches tol / 2. The L1 norm of r
+    then stays below tol and x within tol / (1 - alpha) of the PageRank.
+
+    The graph itself is not modified, the links of the changed nodes are
+    kept in an overlay until `compact`. The nodes are fixed. A snapshot
+    taken after `compact` keeps the compacted graph next to it.
+    """
+
+    def __init__(
+            self, graph: CSRGraph, alpha=DAMPING, personalization=None,
+            dangling=None, tol=1e-8, scores=None,
+            overlay: Optional[Dict[int, np.ndarray]] = None,
+            chunk_edges=CHUNK_EDGES
+    ):
+        """
+        scores warm-start the ranking, by default they are computed by
+        `pagerank`. overlay holds links that replace the ones of the graph.
+        """
+        n = graph.num_nodes
+        self.graph = graph
+        self.alpha = alpha
+        self.tol = tol
+        self.node_tol = tol / (2 * max(n, 1))
+        self.teleport = teleport_vector(graph, personalization)
+        self.dangling_weights = (
+            self.teleport if dangling is None
+            else teleport_vector(graph, dangling)
+        )
+        self.node_index = None
+        self.pushes = 0
+        # Whether the graph is a compacted one, and the snapshot CSR
+        # directory it is saved in.
+        self.compacted = False
+        self.csr_dir = None
+
+        self.degrees = graph.out_degrees().astype(np.int64)
+        self.overlay: Dict[int, np.ndarray] = {}
+        self.in_overlay = np.zeros(n, dtype=bool)
+        for u, links in (overlay or {}).items():
+            self.overlay[u] = np.asarray(links, dtype=np.int64)
+            self.in_overlay[u] = True
+            self.degrees[u] = len(links)
+
+        if scores is None and not self.overlay:
+            scores = pagerank(
+                graph, alpha, self.teleport, self.dangling_weights, tol=tol,
+                chunk_edges=chunk_edges
+            )
+        self.x = (
+            self.teleport.copy() if scores is None
+            else np.array(scores, dtype=np.float64)
+        )
+        self.dangling_mass = 0.0
+        self.residual = self.full_residual(chunk_edges)
+        self.push(np.arange(n))
+
+    @property
+    def scores(self):
+        return self.x
+
+    def links(self, u) -> np.ndarray:
+        if self.in_overlay[u]:
+            return self.overlay[u]
+        return np.asarray(
+            self.graph.indices[self.graph.indptr[u]:self.graph.indptr[u + 1]]
+        )
+
+    def full_residual(self, chunk_edges=CHUNK_EDGES):
+        """r of the current x, with one pass over all the links."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scaled = np.where(self.degrees == 0, 0, self.x / self.degrees)
+        base_scaled = np.where(self.in_overlay, 0, scaled)
+        sums = link_sums(self.graph, base_scaled, self.graph.chunks(chunk_edges))
+        for u, links in self.overlay.items():
+            np.add.at(sums, links, scaled[u])
+        dangling_sum = self.x[self.degrees == 0].sum()
+        return (
+            (1 - self.alpha) * self.teleport
+            + self.alpha * sums
+            + self.alpha * dangling_sum * self.dangling_weights
+            - self.x
+        )
+
+    def index(self, node):
+        if self.graph.nodes is None:
+            return int(node)
+        if self.node_index is None:
+            self.node_index = self.graph.node_index()
+        return self.node_index[node]
+
+    def set_links(self, u, links):
+        """
+        Replaces the links of u keeping the residual invariant, returns
+        the nodes whose residual changed.
+        """
+        old = self.links(u)
+        share = self.alpha * self.x[u]
+        if len(old):
+            np.subtract.at(self.residual, old, share / len(old))
+        else:
+            self.dangling_mass -= share
+        if len(links):
+            np.add.at(self.residual, links, share / len(links))
+        else:
+            self.dangling_mass += share
+        self.overlay[u] = links
+        self.in_overlay[u] = True
+        self.degrees[u] = len(links)
+        return np.concatenate([old, links])
+
+    def update(self, added=(), removed=()):
+        """
+        Adds and removes the (source, target) links, a removed link must
+        exist, then pushes the residuals until the scores are within tol
+        again. Nothing changes when a link to remove is missing.
+        """
+        changes = {}
+        for source, target in added:
+            changes.setdefault(self.index(source), ([], []))[0].append(
+                self.index(target)
+            )
+        for source, target in removed:
+            changes.setdefault(self.index(source), ([], []))[1].append(
+                self.index(target)
+            )
+
+        new_links = {}
+        for u, (adds, removes) in changes.items():
+            links = self.links(u).tolist()
+            for v in removes:
+                try:
+                    links.remove(v)
+                except ValueError:
+                    raise ValueError(
+                        f'No link {self.graph.label(u)} -> {self.graph.label(v)}'
+                    ) from None
+            links.extend(adds)
+            new_links[u] = np.array(links, dtype=np.int64)
+
+        touched = [self.set_links(u, links) for u, links in new_links.items()]
+        if touched:
+            self.push(np.unique(np.concatenate(touched)))
+
+    def push(self, candidates):
+        r = self.residual
+        frontier = candidates[np.abs(r[candidates]) > self.node_tol]
+        while True:
+            while len(frontier):
+                amounts = r[frontier]
+                r[frontier] = 0
+                self.x[frontier] += amounts
+                self.pushes += len(frontier)
+
+                degrees = self.degrees[frontier]
+                dangling = degrees == 0
+                self.dangling_mass += self.alpha * amounts[dangling].sum()
+                shares = self.alpha * amounts / np.maximum(degrees, 1)
+
+                base = ~dangling & ~self.in_overlay[frontier]
+                positions, lengths = link_positions(
+                    self.graph.indptr, frontier[base]
+                )
+                targets = [np.asarray(self.graph.indices[positions])]
+                weights = [np.repeat(shares[base], lengths)]
+                overlaid = ~dangling & self.in_overlay[frontier]
+                for u, share in zip(
+                        frontier[overlaid].tolist(), shares[overlaid].tolist()
+                ):
+                    targets.append(self.overlay[u])
+                    weights.append(np.full(len(self.overlay[u]), share))
+
+                targets = np.concatenate(targets)
+                weights = np.concatenate(weights)
+                if len(targets) > len(r) // 16:
+                    # A wide round, sorting the targets costs more than a
+                    # pass over all the nodes.
+                    pushed = np.bincount(targets, weights, minlength=len(r))
+                    r += pushed
+                    touched = np.flatnonzero(pushed)
+                else:
+                    touched, inverse = np.unique(targets, return_inverse=True)
+                    r[touched] += np.bincount(inverse, weights)
+                frontier = touched[np.abs(r[touched]) > self.node_tol]
+
+            if abs(self.dangling_mass) <= self.tol / 2:
+                return
+            r += self.dangling_mass * self.dangling_weights
+            self.dangling_mass = 0.0
+            frontier = np.flatnonzero(np.abs(r) > self.node_tol)
+
+    def compact(self) -> CSRGraph:
+        """Merges the overlay into a new graph and ranks on it from now on."""
+        n = self.graph.num_nodes
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(self.degrees, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int64)
+        base = np.flatnonzero(~self.in_overlay)
+        indices[link_positions(indptr, base)[0]] = self.graph.indices[
+            link_positions(self.graph.indptr, base)[0]
+        ]
+        for u, links in self.overlay.items():
+            indices[indptr[u]:indptr[u + 1]] = links
+        self.graph = CSRGraph(indptr, indices, self.graph.nodes)
+        self.overlay = {}
+        self.in_overlay[:] = False
+        self.compacted = True
+        self.csr_dir = None
+        return self.graph
+
+    def save(self, path):
+        """
+        An .npz snapshot of the scores, the settings and the overlay. After
+        `compact` the graph is saved too, by `save_csr` in
+        `snapshot_csr_dir(path)`.
+        """
+        if self.compacted:
+            csr_dir = os.path.abspath(snapshot_csr_dir(path))
+            # A graph loaded from there is memory mapped, it is not rewritten.
+            if csr_dir != self.csr_dir:
+                save_csr(self.graph, csr_dir)
+                self.csr_dir = csr_dir
+        overlay_nodes = np.array(sorted(self.overlay), dtype=np.int64)
+        overlay_indptr = np.zeros(len(overlay_nodes) + 1, dtype=np.int64)
+        np.cumsum(
+            [len(self.overlay[u]) for u in overlay_nodes.tolist()],
+            out=overlay_indptr[1:]
+        )
+        np.savez(
+            path,
+            scores=self.x,
+            alpha=self.alpha,
+            tol=self.tol,
+            teleport=self.teleport,
+            dangling_weights=self.dangling_weights,
+            num_nodes=self.graph.num_nodes,
+            num_edges=self.graph.num_edges,
+            compacted=self.compacted,
+            overlay_nodes=overlay_nodes,
+            overlay_indptr=overlay_indptr,
+            overlay_indices=np.concatenate(
+                [self.overlay[u] for u in overlay_nodes.tolist()]
+                or [np.zeros(0, np.int64)]
+            ),
+        )
+
+    @classmethod
+    def load(cls, graph: Optional[CSRGraph], path, chunk_edges=CHUNK_EDGES):
+        """
+        Warm-starts from a snapshot of the same graph, the residual is
+        recomputed with one pass over the links. The graph of a snapshot
+        taken after `compact` is its saved one, the given graph may then
+        be None.
+        """
+        with np.load(path) as data:
+            compacted = 'compacted' in data and bool(data['compacted'])
+            if compacted:
+                csr_dir = os.path.abspath(snapshot_csr_dir(path))
+                graph = load_csr(csr_dir)
+            elif graph is None:
+                raise ValueError('The snapshot is not of a compacted graph')
+            if (int(data['num_nodes']), int(data['num_edges'])) != (
+                    graph.num_nodes, graph.num_edges
+            ):
+                raise ValueError('The snapshot is of another graph')
+            indptr = data['overlay_indptr']
+            overlay = {
+                u: data['overlay_indices'][indptr[i]:indptr[i + 1]]
+                for i, u in enumerate(data['overlay_nodes'].tolist())
+            }
+            ranking = cls(
+                graph,
+                alpha=float(data['alpha']),
+                personalization=data['teleport'],
+                dangling=data['dangling_weights'],
+                tol=float(data['tol']),
+                scores=data['scores'],
+                overlay=overlay,
+                chunk_edges=chunk_edges
+            )
+        if compacted:
+            ranking.compacted = True
+            ranking.csr_dir = csr_dir
+        return ranking
+
+
+class TestCase(unittest.TestCase):
+
+    def random_graph(self, n=200, m=1000, seed=0):
+        import networkx as nx
+
+        rng = np.random.default_rng(seed)
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(range(n))
+        # Some nodes are left without links.
+        graph.add_edges_from(
+            zip(rng.integers(0, n, m).tolist(), rng.integers(0, n // 2, m).tolist())
+        )
+        return graph
+
+    def nx_pagerank(self, graph, **kwargs):
+        from networkx.algorithms.link_analysis.pagerank_alg import (
+            _pagerank_python
+        )
+        scores = _pagerank_python(graph, tol=1e-12, max_iter=1000, **kwargs)
+        return np.array([scores[node] for node in graph])
+
+    def test_same_as_networkx(self):
+        nx_graph = self.random_graph()
+        graph = from_networkx(nx_graph)
+        personalization = {i: i % 3 for i in range(200)}
+        dangling = {i: 1 for i in range(10)}
+        for kwargs in [
+            {},
+            {'alpha': 0.5},
+            {'personalization': personalization},
+            {'personalization': personalization, 'dangling': dangling},
+        ]:
+            with self.subTest(kwargs=kwargs):
+                np.testing.assert_allclose(
+                    pagerank(
+                        graph, tol=1e-14, max_iter=1000, chunk_edges=37,
+                        **kwargs
+                    ),
+                    self.nx_pagerank(nx_graph, **kwargs),
+                    atol=1e-10
+                )
+
+    def test_undirected_networkx(self):
+        import networkx as nx
+
+        nx_graph = nx.karate_club_graph()
+        np.testing.assert_allclose(
+            pagerank(from_networkx(nx_graph), tol=1e-14, max_iter=1000),
+            self.nx_pagerank(nx_graph, weight=None),
+            atol=1e-10
+        )
+
+    def test_load_edge_list_and_csr(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'edges.txt')
+            with open(path, 'w') as fh:
+                fh.write('# source target\n0 2\n\n2 0\n0 1\n3 1\n')
+            graph = load_edge_list(path, chunk_lines=2)
+            self.assertEqual(graph.indptr.tolist(), [0, 2, 2, 3, 4])
+            self.assertEqual(graph.indices.tolist(), [2, 1, 0, 1])
+
+            labelled = load_edge_list(path, integer_ids=False)
+            self.assertEqual(labelled.nodes, ['0', '2', '1', '3'])
+            self.assertEqual(labelled.indices.tolist(), [1, 2, 0, 2])
+
+            save_csr(labelled, os.path.join(tmp_dir, 'csr'))
+            loaded = load_csr(os.path.join(tmp_dir, 'csr'))
+            self.assertIsInstance(loaded.indices, np.memmap)
+            self.assertEqual(loaded.nodes, labelled.nodes)
+            np.testing.assert_allclose(
+                pagerank(loaded, personalization={'3': 1}),
+                pagerank(labelled, personalization=[0, 0, 0, 1])
+            )
+
+    def random_changes(self, graph: CSRGraph, rng, size):
+        """Adds and removes links, some nodes lose all of their links."""
+        sources = np.repeat(np.arange(graph.num_nodes), graph.out_degrees())
+        picked = rng.choice(graph.num_edges, size, replace=False)
+        removed = list(zip(sources[picked].tolist(),
+                           np.asarray(graph.indices)[picked].tolist()))
+        emptied = rng.choice(graph.num_nodes, 3).tolist()
+        removed.extend(
+            (u, v) for u in set(emptied)
+            for v in graph.indices[graph.indptr[u]:graph.indptr[u + 1]].tolist()
+            if (u, v) not in removed
+        )
+        added = list(zip(rng.integers(0, graph.num_nodes, size).tolist(),
+                         rng.integers(0, graph.num_nodes, size).tolist()))
+        return added, removed
+
+    def test_incremental_same_as_pagerank(self):
+        graph = from_networkx(self.random_graph())
+        rng = np.random.default_rng(1)
+        for kwargs in [
+            {},
+            {'alpha': 0.5, 'personalization': {i: i % 3 for i in range(200)}},
+            {'dangling': {i: 1 for i in range(10)}},
+        ]:
+            with self.subTest(kwargs=kwargs):
+                ranking = IncrementalPageRank(graph, tol=1e-12, **kwargs)
+                for _ in range(4):
+                    added, removed = self.random_changes(
+                        ranking.compact(), rng, 40
+                    )
+                    ranking.update(added, removed)
+                    np.testing.assert_allclose(
+                        ranking.scores,
+                        pagerank(ranking.compact(), tol=1e-14, **kwargs),
+                        atol=1e-10
+                    )
+
+    def test_update_without_compact(self):
+        graph = from_adjacency({'a': ['b'], 'b': ['c'], 'c': ['a', 'b'], 'd': []})
+        ranking = IncrementalPageRank(graph, tol=1e-12)
+        ranking.update(added=[('d', 'a'), ('a', 'c')], removed=[('c', 'b')])
+        ranking.update(removed=[('b', 'c')])
+        self.assertEqual(ranking.links(1).tolist(), [])
+        expected = pagerank(from_adjacency(
+            {'a': ['b', 'c'], 'b': [], 'c': ['a'], 'd': ['a']}
+        ), tol=1e-14)
+        np.testing.assert_allclose(ranking.scores, expected, atol=1e-10)
+
+        scores = ranking.scores.copy()
+        with self.assertRaises(ValueError):
+            ranking.update(added=[('a', 'd')], removed=[('d', 'b')])
+        np.testing.assert_array_equal(ranking.scores, scores)
+        self.assertEqual(ranking.links(0).tolist(), [1, 2])
+
+    def test_snapshot(self):
+        graph = from_networkx(self.random_graph())
+        ranking = IncrementalPageRank(
+            graph, tol=1e-12, personalization={i: 1 for i in range(50)}
+        )
+        added, removed = self.random_changes(graph, np.random.default_rng(2), 20)
+        ranking.update(added, removed)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'scores.npz')
+            ranking.save(path)
+            loaded = IncrementalPageRank.load(graph, path)
+            with self.assertRaises(ValueError):
+                IncrementalPageRank.load(from_adjacency({0: [0]}), path)
+        np.testing.assert_allclose(loaded.scores, ranking.scores, atol=1e-10)
+        self.assertEqual(loaded.overlay.keys(), ranking.overlay.keys())
+
+        ranking.update([(0, 1)])
+        loaded.update([(0, 1)])
+        np.testing.assert_allclose(loaded.scores, ranking.scores, atol=1e-10)
+
+    def test_snapshot_after_compact(self):
+        graph = from_networkx(self.random_graph())
+        ranking = IncrementalPageRank(graph, tol=1e-12)
+        rng = np.random.default_rng(3)
+        ranking.update(*self.random_changes(graph, rng, 20))
+        compacted = ranking.compact()
+        ranking.update([(0, 1)])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'scores.npz')
+            ranking.save(path)
+            loaded = IncrementalPageRank.load(graph, path)
+            np.testing.assert_array_equal(loaded.graph.indptr, compacted.indptr)
+            np.testing.assert_array_equal(loaded.graph.indices, compacted.indices)
+            self.assertEqual(loaded.overlay.keys(), ranking.overlay.keys())
+            np.testing.assert_allclose(loaded.scores, ranking.scores, atol=1e-10)
+
+            # Saving it again keeps the mapped graph as it is.
+            loaded.update(*self.random_changes(loaded.graph, rng, 5))
+            loaded.save(path)
+            again = IncrementalPageRank.load(None, path)
+            np.testing.assert_allclose(again.scores, loaded.scores, atol=1e-10)
+            expected = pagerank(loaded.compact(), tol=1e-12)
+            np.testing.assert_allclose(again.scores, expected, atol=1e-8)
+            del loaded, again
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('graph', help='an edge list file or a CSR directory')
+    parser.add_argument(
+        '--labels', action='store_true',
+        help='the nodes of the edge list are labels, not integer ids'
+    )
+    parser.add_argument('--alpha', type=float, default=DAMPING)
+    parser.add_argument('--tol', type=float, default=1e-8)
+    parser.add_argument('--max-iter', type=int, default=1000)
+    parser.add_argument('--chunk-edges', type=int, default=CHUNK_EDGES)
+    parser.add_argument('--float32', action='store_true')
+    parser.add_argument(
+        '--personalize', nargs='+', metavar='NODE',
+        help='teleport only to these nodes'
+    )
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--save-csr', metavar='DIR')
+    args = parser.parse_args()
+
+    graph = load_graph(args.graph, integer_ids=not args.labels)
+    if args.save_csr:
+        save_csr(graph, args.save_csr)
+
+    personalization = None
+    if args.personalize:
+        personalization = {
+            node if graph.nodes is not None else int(node): 1
+            for node in args.personalize
+        }
+    scores = pagerank(
+        graph,
+        alpha=args.alpha,
+        personalization=personalization,
+        tol=args.tol,
+        max_iter=args.max_iter,
+        chunk_edges=args.chunk_edges,
+        dtype=np.float32 if args.float32 else np.float64
+    )
+    for node, score in top_nodes(graph, scores, args.top):
+        print(f'{node}\t{score:.8f}')
@@ -1,9 +1,14 @@
 import enum
 import random
 import pprint
+import unittest
 
 from collections import defaultdict
 
+import numpy as np
+
+from pagerank import CSRGraph, from_adjacency
+
 
 class Page(enum.Enum):
     A = 'A'
@@ -21,6 +26,8 @@ transition_graph = {
     Page.C: [Page.A],
 }
 
+FOLLOW_LINK_PROBABILITY = 0.85
+
 
 def compute_surfer_authority_score(num_of_simulations):
     surfer_authority_score = defaultdict(int)
@@ -45,9 +52,127 @@ def compute_surfer_authority_score(num_of_simulations):
     pprint.pprint(surfer_authority_score_percentage, indent=4)
 
 
-compute_surfer_authority_score(1000 * 1000)
+class SurferChain:
+    """
+    The Markov chain of the surfer over a CSRGraph: with
+    probability p it follows a random link, otherwise it jumps to any other
+    page. A surfer on a page without links always jumps.
+    """
+
+    def __init__(self, graph: CSRGraph, p=FOLLOW_LINK_PROBABILITY):
+        self.indptr = graph.indptr
+        self.indices = graph.indices
+        self.p = p
+        self.n = graph.num_nodes
+        self.degrees = graph.out_degrees()
+        self.dangling = self.degrees == 0
+        # The source page of every link and the probability to take it.
+        self.sources = np.repeat(np.arange(self.n), self.degrees)
+        self.link_weights = 1 / self.degrees[self.sources]
+
+    def step(self, scores):
+        """The distribution of pages after one step from `scores`."""
+        linked = self.p * np.bincount(
+            self.indices,
+            weights=scores[self.sources] * self.link_weights,
+            minlength=self.n
+        )
+        # The jump mass goes to every page but the one it leaves.
+        jumping = (1 - self.p) * scores + self.p * np.where(
+            self.dangling, scores, 0
+        )
+        return linked + (jumping.sum() - jumping) / (self.n - 1)
+
+    def matrix(self):
+        """The dense transition matrix, for small graphs."""
+        return np.stack([self.step(row) for row in np.eye(self.n)])
+
+    def stationary(self, method='power', tol=1e-12, max_iter=10000):
+        """
+        The distribution the simulation converges to. `power` iterates
+        `step` and works on large sparse graphs, `solve` solves the dense
+        linear system.
+        """
+        if method == 'solve':
+            a = self.matrix().T - np.eye(self.n)
+            # The equations are dependent, one of them is replaced by sum = 1.
+            a[-1] = 1
+            b = np.zeros(self.n)
+            b[-1] = 1
+            return np.linalg.solve(a, b)
+
+        scores = np.full(self.n, 1 / self.n)
+        for _ in range(max_iter):
+            next_scores = self.step(scores)
+            if np.abs(next_scores - scores).sum() < tol:
+                return next_scores
+            scores = next_scores
+        return scores
+
+    def simulate(self, num_surfers, num_steps, seed=None):
+        """
+        Simulates num_surfers surfers at once for num_steps steps and
+        returns the share of visits of every page.
+        """
+        rng = np.random.default_rng(seed)
+        visits = np.zeros(self.n, dtype=np.int64)
+
+        current = rng.integers(0, self.n, size=num_surfers)
+        for _ in range(num_steps):
+            current_degrees = self.degrees[current]
+            follow = (
+                (rng.random(num_surfers) <= self.p) & (current_degrees > 0)
+            )
+
+            # A uniform page other than the current one.
+            next_pages = rng.integers(0, self.n - 1, size=num_surfers)
+            next_pages += next_pages >= current
+
+            links = self.indptr[current[follow]] + (
+                rng.random(follow.sum()) * current_degrees[follow]
+            ).astype(np.int64)
+            next_pages[follow] = self.indices[links]
+
+            visits += np.bincount(next_pages, minlength=self.n)
+            current = next_pages
+        return visits / (num_surfers * num_steps)
+
+
+def compute_surfer_authority_score_exact(graph=None, method='power'):
+    graph = transition_graph if graph is None else graph
+    pages = list(Page)
+    chain = SurferChain(from_adjacency(graph, pages))
+    return dict(zip(pages, chain.stationary(method=method).tolist()))
 
 
+class TestCase(unittest.TestCase):
 
+    def test_engines_agree(self):
+        chain = SurferChain(from_adjacency(transition_graph, list(Page)))
+        power = chain.stationary()
+        np.testing.assert_allclose(
+            chain.stationary(method='solve'), power, atol=1e-10
+        )
+        np.testing.assert_allclose(
+            chain.simulate(num_surfers=10000, num_steps=100, seed=0), power,
+            atol=5e-3
+        )
+        self.assertAlmostEqual(power.sum(), 1)
+
+    def test_dangling_page(self):
+        graph = {'a': ['b', 'b', 'c'], 'b': ['a'], 'c': []}
+        chain = SurferChain(from_adjacency(graph, ['a', 'b', 'c']))
+        matrix = chain.matrix()
+        np.testing.assert_allclose(matrix.sum(axis=1), 1)
+        np.testing.assert_allclose(matrix[2], [0.5, 0.5, 0])
+        np.testing.assert_allclose(
+            chain.simulate(10000, 100, seed=0), chain.stationary(), atol=5e-3
+        )
 
 
+if __name__ == '__main__':
+    compute_surfer_authority_score(1000 * 1000)
+    pprint.pprint({
+        page: f'{score * 100}%'
+        for page, score in compute_surfer_authority_score_exact().items()
+    }, indent=4)